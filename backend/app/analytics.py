@@ -0,0 +1,416 @@
+"""
+Optional in-memory read model of campaigns, periods and sites (ANALYTICS_STORE=1,
+see crud.ANALYTICS_STORE).
+
+Each table is held as NumPy column arrays: float64 for numbers (NaN for NULL),
+datetime64[D] for dates and int32 codes into a per-column dictionary for
+categorical strings. Filters, sorts, top-k and group-bys run as vectorized
+operations instead of building an ORM object per row.
+
+Writes made through crud register their new campaign names and are appended on
+the next read; any other invalidation, or ANALYTICS_STORE_MAX_AGE_SECONDS
+elapsing (rows written by another process), reloads everything. A reload builds
+a new snapshot beside the current one, which other readers keep using until it
+is swapped in.
+"""
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from sqlalchemy import Date, Float, Integer, select
+from sqlalchemy.orm import Session
+from . import demographics, models, pagination, schemas
+
+ANALYTICS_STORE_MAX_AGE_SECONDS = float(os.getenv("ANALYTICS_STORE_MAX_AGE_SECONDS", "300"))
+
+# Names per IN (...) when appending the children of new campaigns
+LOAD_CHUNK_SIZE = 500
+
+class Categories:
+    """Dictionary encoding of a string column: int32 codes into `values`, -1 for NULL."""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def encode(self, column: Iterable[Optional[str]]) -> np.ndarray:
+        values = np.array(list(column), dtype=object)
+        codes = np.full(len(values), -1, dtype=np.int32)
+        present = np.not_equal(values, None)
+        if present.any():
+            # Only the distinct values go through the dictionary
+            distinct, inverse = np.unique(values[present].astype(str), return_inverse=True)
+            distinct_codes = np.empty(len(distinct), dtype=np.int32)
+            for position, value in enumerate(distinct.tolist()):
+                code = self.index.get(value)
+                if code is None:
+                    code = self.index[value] = len(self.values)
+                    self.values.append(value)
+                distinct_codes[position] = code
+            codes[present] = distinct_codes[inverse.reshape(-1)]
+        return codes
+
+    def decode(self, code: int) -> Optional[str]:
+        return None if code < 0 else self.values[code]
+
+class ColumnTable:
+    """
+    The rows of one model as column arrays. Tables are never modified once
+    built: appended() returns a new table, so readers keep a consistent view.
+    Categories are shared between versions; they only ever grow.
+    """
+
+    def __init__(self, model, categorical=(), categories=None, arrays=None):
+        self.model = model
+        self.columns = list(model.__table__.columns)
+        self.categories = categories or {name: Categories() for name in categorical}
+        self.arrays = arrays or {column.name: self._convert(column, []) for column in self.columns}
+        self.size = len(self.arrays[self.columns[0].name])
+
+    def _convert(self, column, values):
+        if column.name in self.categories:
+            return self.categories[column.name].encode(values)
+        if isinstance(column.type, (Integer, Float)):
+            return np.array(values, dtype=np.float64)
+        if isinstance(column.type, Date):
+            return np.array(values, dtype="datetime64[D]")
+        return np.array(values, dtype=object)
+
+    def appended(self, rows) -> "ColumnTable":
+        if not rows:
+            return self
+        arrays = {}
+        for column, values in zip(self.columns, zip(*rows)):
+            arrays[column.name] = np.concatenate([self.arrays[column.name], self._convert(column, values)])
+        return ColumnTable(self.model, categories=self.categories, arrays=arrays)
+
+    def __getitem__(self, name) -> np.ndarray:
+        return self.arrays[name]
+
+    def code(self, name: str, value: str) -> int:
+        """Code of a categorical value; -2 (matches nothing) when it never occurs."""
+        return self.categories[name].index.get(value, -2)
+
+    def value(self, column, row: int):
+        array = self.arrays[column.name]
+        if column.name in self.categories:
+            return self.categories[column.name].decode(int(array[row]))
+        if isinstance(column.type, (Integer, Float)):
+            value = array[row]
+            if np.isnan(value):
+                return None
+            return int(value) if isinstance(column.type, Integer) else float(value)
+        if isinstance(column.type, Date):
+            value = array[row]
+            return None if np.isnat(value) else value.astype(date)
+        return array[row]
+
+    def row(self, row: int) -> dict:
+        return {column.name: self.value(column, row) for column in self.columns}
+
+def _campaign_rows_by_code(campaign_names: Categories, campaign_index: Dict[str, int]) -> np.ndarray:
+    """
+    Campaign row of every code of a child table's campaign_name column (-1 if
+    missing). The trailing -1 is what the NULL code (-1) indexes.
+    """
+    return np.array([campaign_index.get(name, -1) for name in campaign_names.values] + [-1], dtype=np.int64)
+
+class Snapshot:
+    """One consistent version of the three tables plus the indexes derived from them."""
+
+    def __init__(self, campaigns: ColumnTable, periods: ColumnTable, sites: ColumnTable):
+        self.campaigns, self.periods, self.sites = campaigns, periods, sites
+
+        names = campaigns["name"]
+        self.name_order = np.argsort(names, kind="stable")
+        self.name_rank = np.empty(campaigns.size, dtype=np.int64)
+        self.name_rank[self.name_order] = np.arange(campaigns.size)
+        self.campaign_index = {name: row for row, name in enumerate(names)}
+
+        # Children sorted by campaign code (stable, so still in id order within a campaign)
+        self._by_campaign = {}
+        for table in (periods, sites):
+            codes = table["campaign_name"]
+            order = np.argsort(codes, kind="stable")
+            self._by_campaign[id(table)] = (order, codes[order])
+        code_to_row = _campaign_rows_by_code(sites.categories["campaign_name"], self.campaign_index)
+        self.site_campaign_row = code_to_row[sites["campaign_name"]]
+
+    def child_rows(self, table: ColumnTable, campaign_name: str) -> np.ndarray:
+        code = table.code("campaign_name", campaign_name)
+        order, sorted_codes = self._by_campaign[id(table)]
+        lo, hi = np.searchsorted(sorted_codes, [code, code + 1])
+        return order[lo:hi] if code >= 0 else order[:0]
+
+def _load(db: Session, model, order_by, where=None) -> list:
+    columns = list(model.__table__.columns)
+    statement = select(*columns).order_by(order_by)
+    if where is not None:
+        statement = statement.where(where)
+    return db.execute(statement).all()
+
+def _sum(values: np.ndarray, keys: np.ndarray, size: int) -> np.ndarray:
+    """Per-key sum of a column, NULLs counting as 0."""
+    return np.bincount(keys, weights=np.nan_to_num(values), minlength=size)
+
+def _mean(values: np.ndarray, keys: np.ndarray, size: int) -> List[Optional[float]]:
+    """Per-key mean of a column ignoring NULLs; None for keys without values."""
+    present = ~np.isnan(values)
+    totals = np.bincount(keys[present], weights=values[present], minlength=size)
+    counts = np.bincount(keys[present], minlength=size)
+    return [float(t / c) if c else None for t, c in zip(totals, counts)]
+
+def _group(codes: np.ndarray, categories: Categories):
+    """Keys shifted so NULL (-1) is bucket 0, the bucket count and each bucket's key."""
+    size = len(categories.values) + 1
+    return codes + 1, size, [None] + categories.values
+
+def _key_order(key):
+    # SQL sorts NULL first
+    return (key is not None, key or "")
+
+class AnalyticsStore:
+    def __init__(self):
+        self._snapshot: Optional[Snapshot] = None
+        self._loaded_at = 0.0
+        self._stale = True
+        self._pending = set()
+        self._state_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def invalidate(self, campaign_names: Optional[Iterable[str]] = None):
+        """Append `campaign_names` (and their children) on the next read, or reload everything."""
+        with self._state_lock:
+            if campaign_names is None:
+                self._stale = True
+            else:
+                self._pending.update(campaign_names)
+
+    def snapshot(self, db: Session) -> Snapshot:
+        """
+        The current snapshot, brought up to date first if writes happened. Only
+        one reader refreshes it at a time; the others get the previous snapshot
+        instead of waiting, except for the very first load.
+        """
+        with self._state_lock:
+            current = self._snapshot
+            if current is not None and not self._needs_refresh():
+                return current
+        if current is not None and not self._load_lock.acquire(blocking=False):
+            return current
+        if current is None:
+            self._load_lock.acquire()
+        try:
+            with self._state_lock:
+                current = self._snapshot
+                stale = current is None or self._stale or self._expired()
+                pending, self._pending = self._pending, set()
+                self._stale = False
+            if not stale and not pending:
+                return current
+            try:
+                if stale:
+                    loaded_at = time.monotonic()
+                    fresh = self._load_all(db)
+                else:
+                    loaded_at = self._loaded_at
+                    fresh = self._append(db, current, pending)
+            except Exception:
+                self.invalidate()
+                raise
+            with self._state_lock:
+                self._snapshot, self._loaded_at = fresh, loaded_at
+            return fresh
+        finally:
+            self._load_lock.release()
+
+    def _expired(self) -> bool:
+        return time.monotonic() - self._loaded_at > ANALYTICS_STORE_MAX_AGE_SECONDS
+
+    def _needs_refresh(self) -> bool:
+        return self._stale or bool(self._pending) or self._expired()
+
+    def _load_all(self, db: Session) -> Snapshot:
+        return Snapshot(
+            ColumnTable(models.Campaign, ["tipo_campania"]).appended(
+                _load(db, models.Campaign, models.Campaign.name)
+            ),
+            ColumnTable(models.CampaignPeriod, ["campaign_name", "period"]).appended(
+                _load(db, models.CampaignPeriod, models.CampaignPeriod.id)
+            ),
+            ColumnTable(
+                models.CampaignSite,
+                ["campaign_name", "codigo_del_sitio", "tipo_de_mueble", "tipo_de_anuncio", "estado", "municipio", "zm"]
+            ).appended(_load(db, models.CampaignSite, models.CampaignSite.id)),
+        )
+
+    def _append(self, db: Session, snapshot: Snapshot, names) -> Snapshot:
+        names = sorted(name for name in names if name not in snapshot.campaign_index)
+        campaigns, periods, sites = snapshot.campaigns, snapshot.periods, snapshot.sites
+        for start in range(0, len(names), LOAD_CHUNK_SIZE):
+            chunk = names[start:start + LOAD_CHUNK_SIZE]
+            campaigns = campaigns.appended(
+                _load(db, models.Campaign, models.Campaign.name, models.Campaign.name.in_(chunk))
+            )
+            periods = periods.appended(_load(
+                db, models.CampaignPeriod, models.CampaignPeriod.id, models.CampaignPeriod.campaign_name.in_(chunk)
+            ))
+            sites = sites.appended(_load(
+                db, models.CampaignSite, models.CampaignSite.id, models.CampaignSite.campaign_name.in_(chunk)
+            ))
+        return Snapshot(campaigns, periods, sites)
+
+    def _campaign_mask(self, snapshot: Snapshot, tipo_campania=None, start_date=None, end_date=None):
+        campaigns = snapshot.campaigns
+        mask = np.ones(campaigns.size, dtype=bool)
+        if tipo_campania:
+            mask &= campaigns["tipo_campania"] == campaigns.code("tipo_campania", tipo_campania)
+        if start_date:
+            mask &= campaigns["fecha_inicio"] >= np.datetime64(_as_date(start_date), "D")
+        if end_date:
+            mask &= campaigns["fecha_fin"] <= np.datetime64(_as_date(end_date), "D")
+        return mask
+
+    def _campaigns(self, snapshot: Snapshot, rows) -> List[schemas.Campaign]:
+        return [schemas.Campaign.model_validate(snapshot.campaigns.row(row)) for row in rows]
+
+    def get_campaigns_page(
+        self,
+        db: Session,
+        skip: int,
+        limit: int,
+        tipo_campania: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True
+    ):
+        """Campaigns page in name order with the look-ahead row (see crud.split_page) and the total."""
+        snapshot = self.snapshot(db)
+        mask = self._campaign_mask(snapshot, tipo_campania, start_date, end_date)
+        ordered = snapshot.name_order[mask[snapshot.name_order]]
+        if cursor is not None:
+            last_name = pagination.decode_cursor(cursor, str)[0]
+            skip = int(np.searchsorted(snapshot.campaigns["name"][ordered], last_name, side="right"))
+        total = int(mask.sum()) if include_total else None
+        return self._campaigns(snapshot, ordered[skip:skip + limit + 1]), total
+
+    def top_campaigns(
+        self,
+        db: Session,
+        metric: str,
+        limit: int,
+        tipo_campania: Optional[str] = None,
+        ascending: bool = False
+    ) -> List[schemas.Campaign]:
+        """The `limit` campaigns with the highest (or lowest) `metric`, ties by name."""
+        snapshot = self.snapshot(db)
+        values = snapshot.campaigns[metric]
+        candidates = np.flatnonzero(self._campaign_mask(snapshot, tipo_campania) & ~np.isnan(values))
+        values = values[candidates] if ascending else -values[candidates]
+        if len(candidates) > limit:
+            kth = np.partition(values, limit - 1)[limit - 1]
+            keep = values <= kth
+            candidates, values = candidates[keep], values[keep]
+        order = np.lexsort((snapshot.name_rank[candidates], values))[:limit]
+        return self._campaigns(snapshot, candidates[order])
+
+    def summarize_campaigns(self, db: Session, group_by: str) -> List[dict]:
+        campaigns = self.snapshot(db).campaigns
+        keys, size, labels = _group(campaigns[group_by], campaigns.categories[group_by])
+        counts = np.bincount(keys, minlength=size)
+        personas = _sum(campaigns["impactos_personas"], keys, size)
+        vehiculos = _sum(campaigns["impactos_vehiculos"], keys, size)
+        alcance = _sum(campaigns["alcance"], keys, size)
+        frecuencia = _mean(campaigns["frecuencia_promedio"], keys, size)
+        buckets = [
+            {
+                "key": labels[i],
+                "campaigns": int(counts[i]),
+                "impactos_personas": int(personas[i]),
+                "impactos_vehiculos": int(vehiculos[i]),
+                "alcance": int(alcance[i]),
+                "frecuencia_promedio": frecuencia[i],
+            }
+            for i in np.flatnonzero(counts)
+        ]
+        return sorted(buckets, key=lambda b: _key_order(b["key"]))
+
+    def _site_buckets(self, sites: ColumnTable, rows: np.ndarray, group_by: str, limit: Optional[int]):
+        keys, size, labels = _group(sites[group_by][rows], sites.categories[group_by])
+        counts = np.bincount(keys, minlength=size)
+        mensuales = _sum(sites["impactos_mensuales"][rows], keys, size)
+        catorcenal = _sum(sites["impactos_catorcenal"][rows], keys, size)
+        alcance = _sum(sites["alcance_mensual"][rows], keys, size)
+        frecuencia = _mean(sites["frecuencia_mensual"][rows], keys, size)
+        buckets = [
+            {
+                "key": labels[i],
+                "sites": int(counts[i]),
+                "impactos_mensuales": int(mensuales[i]),
+                "impactos_catorcenal": int(catorcenal[i]),
+                "alcance_mensual": float(alcance[i]),
+                "frecuencia_mensual_promedio": frecuencia[i],
+            }
+            for i in np.flatnonzero(counts)
+        ]
+        buckets.sort(key=lambda b: (-b["impactos_mensuales"], _key_order(b["key"])))
+        return buckets[:limit] if limit else buckets
+
+    def summarize_sites(self, db: Session, campaign_id: str, group_by: str, limit: Optional[int] = None) -> List[dict]:
+        snapshot = self.snapshot(db)
+        rows = snapshot.child_rows(snapshot.sites, campaign_id)
+        return self._site_buckets(snapshot.sites, rows, group_by, limit)
+
+    def summarize_all_sites(
+        self,
+        db: Session,
+        group_by: str,
+        tipo_campania: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[dict]:
+        snapshot = self.snapshot(db)
+        rows = np.arange(snapshot.sites.size)
+        if tipo_campania:
+            campaign_rows = snapshot.site_campaign_row
+            in_type = self._campaign_mask(snapshot, tipo_campania)
+            rows = rows[(campaign_rows >= 0) & in_type[campaign_rows]]
+        return self._site_buckets(snapshot.sites, rows, group_by, limit)
+
+    def site_demographics(self, db: Session, campaign_id: str, weight: str, filters: Dict[str, Optional[str]]):
+        """Weights and demographic columns (see app.demographics) of a campaign's matching sites."""
+        snapshot = self.snapshot(db)
+        sites = snapshot.sites
+        rows = snapshot.child_rows(sites, campaign_id)
+        for name, value in filters.items():
+            if value:
+                rows = rows[sites[name][rows] == sites.code(name, value)]
+        weights = np.ones(len(rows)) if weight == "sites" else sites[weight][rows]
+        values = np.column_stack([sites[name][rows] for name in demographics.COLUMNS])
+        return weights, values
+
+    def period_rows(self, db: Session, campaign_id: str) -> List[dict]:
+        """Per-period impactos of a campaign, ordered by period (see crud.period_summary)."""
+        snapshot = self.snapshot(db)
+        periods = snapshot.periods
+        rows = snapshot.child_rows(periods, campaign_id)
+        keys, size, labels = _group(periods["period"][rows], periods.categories["period"])
+        counts = np.bincount(keys, minlength=size)
+        personas = _sum(periods["impactos_periodo_personas"][rows], keys, size)
+        vehiculos = _sum(periods["impactos_periodo_vehiculos"][rows], keys, size)
+        buckets = [
+            {
+                "period": labels[i],
+                "impactos_periodo_personas": int(personas[i]),
+                "impactos_periodo_vehiculos": int(vehiculos[i]),
+            }
+            for i in np.flatnonzero(counts)
+        ]
+        return sorted(buckets, key=lambda b: _key_order(b["period"]))
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+store = AnalyticsStore()
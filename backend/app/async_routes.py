@@ -0,0 +1,467 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from datetime import datetime
+from . import schemas, crud, crud_async, dependencies, pagination, cache, projection
+
+# Event-loop versions of the routes of routes.py that use the database, swapped
+# in for them when DB_ASYNC is enabled. Parameters, responses and caching match
+# the sync routes, and the tests hold them to the same query budgets. Login (whose hashing already runs in a process
+# pool) and the bulk import (whose batches run in the threadpool while the body
+# streams in) keep their sync routes, and so does the authentication dependency
+# of the write routes.
+router = APIRouter()
+
+async def _with_rollups(db: AsyncSession, campaigns):
+    rollups_by_name = await crud_async.get_rollups(db, [c.name for c in campaigns])
+    return [
+        {**schemas.Campaign.model_validate(c).model_dump(), "rollup": rollups_by_name.get(c.name)}
+        for c in campaigns
+    ]
+
+async def _page_data(db: AsyncSession, campaigns, fields: Optional[List[str]], format: str, include_rollups: bool) -> dict:
+    if projection.is_projected(fields, format):
+        rollups_by_name = await crud_async.get_rollups(db, [c.name for c in campaigns]) if include_rollups else None
+        return projection.page_data(campaigns, fields, format, rollups_by_name)
+    return {"data": await _with_rollups(db, campaigns) if include_rollups else campaigns}
+
+def _page_model(fields: Optional[List[str]], format: str, include_rollups: bool):
+    if projection.is_projected(fields, format):
+        return None
+    return schemas.CampaignPaginationWithRollups if include_rollups else schemas.CampaignPagination
+
+@router.get("/campaigns", response_model=schemas.CampaignPagination)
+async def read_campaigns(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    include_rollups: bool = False,
+    fields: Optional[str] = None,
+    format: Literal["json", "columnar"] = "json",
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Get all campaigns with pagination and optional filtering by campaign type.
+
+    Pass the `next_cursor` of a response as `cursor` to fetch the following page
+    by keyset instead of offset; `include_total=false` skips counting the rows.
+    `include_rollups=true` adds each campaign's site and period rollup.
+    `fields=name,tipo_campania,...` returns (and reads) only those fields;
+    `format=columnar` returns `data` as one array per field.
+    """
+    selected = projection.parse_fields(fields)
+
+    async def build():
+        try:
+            campaigns, total, next_cursor = await crud_async.get_campaigns(
+                db,
+                skip=skip,
+                limit=limit,
+                tipo_campania=tipo_campania,
+                start_date=start_date,
+                end_date=end_date,
+                cursor=cursor,
+                include_total=include_total,
+                fields=selected
+            )
+        except pagination.InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return {
+            **await _page_data(db, campaigns, selected, format, include_rollups),
+            "total": total,
+            "page": skip // limit,
+            "pageSize": limit,
+            "next_cursor": next_cursor
+        }
+
+    return await cache.cached_response_async(request, _page_model(selected, format, include_rollups), build)
+
+@router.post("/campaigns", response_model=schemas.Campaign, dependencies=[Depends(dependencies.require_writable)])
+async def create_campaign(
+    campaign: schemas.CampaignCreate,
+    db: AsyncSession = Depends(dependencies.get_async_db),
+    current_user: schemas.User = Depends(dependencies.get_current_user)
+):
+    """
+    Create a new campaign with all its details (sites, periods, demographics).
+    """
+    created = await crud_async.create_campaign_with_details(db, campaign)
+    if created is None:
+        raise HTTPException(status_code=400, detail="Campaign with this name already exists")
+    return created
+
+@router.get("/campaigns/summary", response_model=schemas.CampaignSummary)
+async def read_campaigns_summary(
+    request: Request,
+    group_by: schemas.CampaignGroupBy = "tipo_campania",
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Campaign counts and totals per campaign type, computed in the database.
+    """
+    async def build():
+        return {"group_by": group_by, "buckets": await crud_async.summarize_campaigns(db, group_by)}
+
+    return await cache.cached_response_async(request, schemas.CampaignSummary, build)
+
+@router.get("/campaigns/search-by-date", response_model=schemas.CampaignPagination)
+async def search_campaigns_by_date(
+    request: Request,
+    start_date: datetime,
+    end_date: datetime,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    tipo_campania: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    include_rollups: bool = False,
+    fields: Optional[str] = None,
+    format: Literal["json", "ndjson", "columnar"] = "json",
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Search campaigns running at any point of a date range.
+
+    Paginates like `/campaigns` (ordered by start date), with the same `fields`
+    and `format=columnar` options. `format=ndjson` streams every matching
+    campaign, one JSON object per line, ignoring pagination.
+    `include_rollups=true` adds each campaign's site and period rollup.
+    """
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=400,
+            detail="Start date must be before end date"
+        )
+    selected = projection.parse_fields(fields)
+
+    if format == "ndjson":
+        statement = await crud_async.search_campaigns_by_date(db, start_date, end_date, tipo_campania=tipo_campania)
+
+        async def stream_campaigns():
+            if selected:
+                import orjson
+
+                projected = statement.with_only_columns(*crud.projected_columns(selected, []))
+                async for row in await db.stream(projected.execution_options(yield_per=500)):
+                    yield orjson.dumps(row._asdict()) + b"\n"
+                return
+            async for campaign in await db.stream_scalars(statement.execution_options(yield_per=500)):
+                yield schemas.Campaign.model_validate(campaign).model_dump_json() + "\n"
+
+        return StreamingResponse(stream_campaigns(), media_type="application/x-ndjson")
+
+    async def build():
+        try:
+            campaigns, total, next_cursor = await crud_async.get_campaigns_by_date(
+                db,
+                start_date=start_date,
+                end_date=end_date,
+                skip=skip,
+                limit=limit,
+                tipo_campania=tipo_campania,
+                cursor=cursor,
+                include_total=include_total,
+                fields=selected
+            )
+        except pagination.InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return {
+            **await _page_data(db, campaigns, selected, format, include_rollups),
+            "total": total,
+            "page": skip // limit,
+            "pageSize": limit,
+            "next_cursor": next_cursor
+        }
+
+    return await cache.cached_response_async(request, _page_model(selected, format, include_rollups), build)
+
+@router.get("/campaigns/export")
+async def export_campaigns(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    include: List[Literal["sites", "periods"]] = Query([]),
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Stream every campaign (optionally filtered like `/campaigns`) in name order.
+
+    `include=sites` / `include=periods` adds each campaign's sites and periods:
+    nested lists in NDJSON, one row per child in CSV (which joins only one of them).
+    """
+    from . import export
+
+    include = list(dict.fromkeys(include))
+    if format == "csv" and len(include) > 1:
+        raise HTTPException(status_code=400, detail="CSV exports can join either sites or periods, not both")
+    campaigns = export.iter_campaigns_async(db, include, tipo_campania, start_date, end_date)
+    return StreamingResponse(
+        export.chunks_async(campaigns, format, include),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="campaigns.{format}"'}
+    )
+
+@router.get("/search", response_model=schemas.SearchResults)
+async def search_campaigns(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    field: Optional[schemas.SearchField] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Type-ahead search of campaigns by name or by the code, municipio, estado or zm
+    of their sites, ignoring case and accents. The last word matches as a prefix.
+
+    Campaigns come best match first, each once, with the `field` and `value` that
+    matched; `field` restricts the search to one of them.
+    """
+    async def build():
+        hits, has_more = await crud_async.search_campaigns(db, q, field, skip, limit)
+        return {"query": q, "data": hits, "page": skip // limit, "pageSize": limit, "has_more": has_more}
+
+    return await cache.cached_response_async(request, schemas.SearchResults, build)
+
+@router.get("/campaigns/{campaign_id}", response_model=schemas.CampaignDetail)
+async def read_campaign(
+    request: Request,
+    campaign_id: str,
+    sites_limit: Optional[int] = Query(None, ge=1, le=5000),
+    sites_cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None,
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Get detailed information for a specific campaign.
+
+    All sites are returned unless `sites_limit` is given; then they come in pages
+    of that size, and `sites_next_cursor` goes back as `sites_cursor` for the next
+    page. `estado`, `municipio` and `tipo_de_mueble`
+    filter the sites.
+    """
+    async def build():
+        try:
+            detail = await crud_async.get_campaign_detail(
+                db,
+                campaign_id,
+                sites_limit=sites_limit,
+                sites_cursor=sites_cursor,
+                estado=estado,
+                municipio=municipio,
+                tipo_de_mueble=tipo_de_mueble
+            )
+        except pagination.InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if detail is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        campaign, sites, periods, next_cursor = detail
+        return schemas.CampaignDetail(
+            **schemas.Campaign.model_validate(campaign).model_dump(),
+            sites=[schemas.CampaignSite.model_validate(site) for site in sites],
+            periods=[schemas.CampaignPeriod.model_validate(period) for period in periods],
+            sites_next_cursor=next_cursor
+        )
+
+    return await cache.cached_response_async(request, schemas.CampaignDetail, build)
+
+@router.get("/campaigns/{campaign_id}/sites/summary", response_model=schemas.SiteSummary)
+async def read_campaign_sites_summary(
+    request: Request,
+    campaign_id: str,
+    group_by: schemas.SiteGroupBy = "estado",
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Site counts and impact totals of a campaign grouped by location or format.
+    Use `group_by=codigo_del_sitio&limit=10` for the top sites by impactos.
+    """
+    async def build():
+        if await crud_async.get_campaign(db, campaign_id) is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        buckets = await crud_async.summarize_sites(db, campaign_id, group_by, limit=limit)
+        return {"group_by": group_by, "buckets": buckets}
+
+    return await cache.cached_response_async(request, schemas.SiteSummary, build)
+
+@router.get("/campaigns/{campaign_id}/sites/demographics", response_model=schemas.SiteDemographics)
+async def read_campaign_sites_demographics(
+    request: Request,
+    campaign_id: str,
+    weight: schemas.DemographicsWeight = "impactos_mensuales",
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None,
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Audience shares (NSE, age, gender) and average exposure of a campaign's
+    sites, optionally only those of one estado, municipio or tipo_de_mueble.
+    Each site counts in proportion to its `weight` (`sites` counts them equally).
+    """
+    async def build():
+        if await crud_async.get_campaign(db, campaign_id) is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        summary = await crud_async.site_demographics(
+            db, campaign_id, weight, estado=estado, municipio=municipio, tipo_de_mueble=tipo_de_mueble
+        )
+        return {"campaign_name": campaign_id, "weight": weight, **summary}
+
+    return await cache.cached_response_async(request, schemas.SiteDemographics, build)
+
+@router.get("/campaigns/{campaign_id}/periods/summary", response_model=schemas.PeriodSummary)
+async def read_campaign_periods_summary(
+    request: Request,
+    campaign_id: str,
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Impactos per period of a campaign, with totals and the peak period.
+    """
+    async def build():
+        if await crud_async.get_campaign(db, campaign_id) is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        return await crud_async.summarize_periods(db, campaign_id)
+
+    return await cache.cached_response_async(request, schemas.PeriodSummary, build)
+
+@router.get("/campaigns/{campaign_id}/traffic", response_model=schemas.TrafficProfile)
+async def read_campaign_traffic(
+    request: Request,
+    campaign_id: str,
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Vehicles per hour of day (index 0 is 00:00-01:00) with the daily total and
+    the peak hour. All null when the campaign has no traffic profile.
+    """
+    from . import traffic
+
+    async def build():
+        profile = await crud_async.get_traffic_profile(db, campaign_id)
+        if profile is False:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        if profile is None:
+            return {"campaign_name": campaign_id}
+        return {"campaign_name": campaign_id, **traffic.describe(profile)}
+
+    return await cache.cached_response_async(request, schemas.TrafficProfile, build)
+
+@router.get("/analytics/campaigns/top", response_model=schemas.TopCampaigns)
+async def read_top_campaigns(
+    request: Request,
+    metric: schemas.CampaignMetric = "impactos_personas",
+    order: Literal["desc", "asc"] = "desc",
+    limit: int = Query(10, ge=1, le=1000),
+    tipo_campania: Optional[str] = None,
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Campaigns with the highest (or, with `order=asc`, lowest) `metric`, ties by name.
+    Campaigns without a value are left out.
+    """
+    async def build():
+        campaigns = await crud_async.top_campaigns(db, metric, limit, tipo_campania=tipo_campania, ascending=order == "asc")
+        return {"metric": metric, "order": order, "data": campaigns}
+
+    return await cache.cached_response_async(request, schemas.TopCampaigns, build)
+
+@router.get("/analytics/sites/summary", response_model=schemas.SiteSummary)
+async def read_all_sites_summary(
+    request: Request,
+    group_by: schemas.SiteGroupBy = "estado",
+    tipo_campania: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Site counts and impact totals across all campaigns (or those of `tipo_campania`)
+    grouped by location or format, largest impactos first.
+    """
+    async def build():
+        buckets = await crud_async.summarize_all_sites(db, group_by, tipo_campania=tipo_campania, limit=limit)
+        return {"group_by": group_by, "buckets": buckets}
+
+    return await cache.cached_response_async(request, schemas.SiteSummary, build)
+
+@router.get("/sites/{codigo_del_sitio}", response_model=schemas.SiteUsage)
+async def read_site_usage(
+    request: Request,
+    codigo_del_sitio: str,
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    A site's format and location with the number of campaigns that used it
+    (`rows` counts each time a campaign listed it).
+    """
+    async def build():
+        usage = await crud_async.get_site_usage(db, codigo_del_sitio)
+        if usage is None:
+            raise HTTPException(status_code=404, detail="Site not found")
+        return usage
+
+    return await cache.cached_response_async(request, schemas.SiteUsage, build)
+
+@router.get("/analytics/periods", response_model=schemas.PeriodSeries)
+async def read_period_series(
+    request: Request,
+    granularity: schemas.PeriodGranularity = "month",
+    group_by: schemas.PeriodSeriesGroupBy = "tipo_campania",
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Impactos of every campaign's periods per month, quarter or year, one series
+    per campaign type (or a single one with `group_by=all`). Periods are placed
+    by their first day; the date range filters on that day too.
+    """
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date must be before end date")
+
+    async def build():
+        series = await crud_async.period_series(
+            db, granularity, group_by, tipo_campania=tipo_campania, start_date=start_date, end_date=end_date
+        )
+        return {"granularity": granularity, "group_by": group_by, "series": series}
+
+    return await cache.cached_response_async(request, schemas.PeriodSeries, build)
+
+@router.get("/analytics/traffic", response_model=schemas.TrafficSummary)
+async def read_traffic_summary(
+    request: Request,
+    group_by: schemas.TrafficGroupBy = "tipo_campania",
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    percentile: List[float] = Query([50, 90]),
+    db: AsyncSession = Depends(dependencies.get_async_read_db)
+):
+    """
+    Hourly traffic of the campaigns within a date range: per group, the
+    hour-by-hour sum, mean and each requested `percentile` across campaigns.
+    Campaigns without a traffic profile are left out.
+    """
+    if any(p < 0 or p > 100 for p in percentile):
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date must be before end date")
+
+    async def build():
+        buckets = await crud_async.summarize_traffic(
+            db, group_by, percentile, tipo_campania=tipo_campania, start_date=start_date, end_date=end_date
+        )
+        return {"group_by": group_by, "buckets": buckets}
+
+    return await cache.cached_response_async(request, schemas.TrafficSummary, build)
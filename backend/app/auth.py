@@ -1,9 +1,15 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+import atexit
 import os
+import threading
+import time
+from functools import lru_cache
 from dotenv import load_dotenv
+from .cache import TTLCache
+
+# jose, passlib and the process pool are imported on first use: most requests
+# (and every cold start) need none of them.
 
 load_dotenv()
 
@@ -12,13 +18,94 @@ SECRET_KEY = os.getenv("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Authenticated requests resolve their token from these caches instead of
+# re-verifying the JWT and selecting the user every time. Entries never outlive
+# the token's exp, and user entries are dropped when the user is created or changed.
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "1024"))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+
+token_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+user_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+
+# bcrypt cost factor. Hashes made with another cost are rehashed on login.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))
+
+# bcrypt runs in a pool of worker processes so a burst of logins does not hold
+# the GIL or the request threadpool. At most PASSWORD_HASH_MAX_PENDING hashes
+# are queued or running; beyond that callers get HashingBusy right away.
+# PASSWORD_HASH_WORKERS=0 hashes in the calling thread (Lambda has no
+# multiprocessing support).
+PASSWORD_HASH_WORKERS = int(os.getenv(
+    "PASSWORD_HASH_WORKERS",
+    "0" if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") else str(min(os.cpu_count() or 1, 4))
+))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 4)))
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=PASSWORD_HASH_ROUNDS)
+
+class HashingBusy(Exception):
+    """Raised when the password hashing queue is full."""
+
+class InvalidToken(Exception):
+    """Raised for tokens that are malformed, badly signed or expired."""
+
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+def _get_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn, not fork: the server process has threads (and open connections)
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _hash_pool
+
+def shutdown_hashing():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(cancel_futures=True)
+            _hash_pool = None
+
+atexit.register(shutdown_hashing)
+
+def _run_hashing(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        if PASSWORD_HASH_WORKERS <= 0:
+            return fn(*args)
+        return _get_hash_pool().submit(fn, *args).result()
+    finally:
+        _hash_slots.release()
+
+def _verify_and_update(plain_password, hashed_password):
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
+
+def _hash(password):
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_and_update(plain_password, hashed_password)[0]
+
+def verify_and_update(plain_password, hashed_password):
+    """
+    Check a password against its hash. Returns (verified, new_hash), where
+    new_hash is set when the stored hash uses an outdated cost and should be replaced.
+    """
+    return _run_hashing(_verify_and_update, plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _run_hashing(_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -27,5 +114,34 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+def _ttl_until(exp) -> float:
+    return min(AUTH_CACHE_TTL_SECONDS, exp - time.time())
+
+def decode_token(token: str) -> dict:
+    """
+    Verified claims of a token, memoized until it expires. Raises InvalidToken
+    for invalid or expired tokens, which are not cached.
+    """
+    payload = token_cache.get(token)
+    if payload is None:
+        from jose import JWTError, jwt
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError as e:
+            raise InvalidToken(str(e)) from e
+        ttl = _ttl_until(payload["exp"]) if "exp" in payload else AUTH_CACHE_TTL_SECONDS
+        if ttl > 0:
+            token_cache.set(token, payload, ttl=ttl)
+    return payload
+
+def cache_user(user, payload: dict):
+    ttl = _ttl_until(payload["exp"]) if "exp" in payload else AUTH_CACHE_TTL_SECONDS
+    if ttl > 0:
+        user_cache.set(user.username, user, ttl=ttl)
+
+def invalidate_user(username: str):
+    user_cache.discard(username)
@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from typing import AsyncIterator, Callable, List, Optional
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from . import schemas
+
+NDJSON = "ndjson"
+CSV = "csv"
+
+# Results are spooled to disk past this size so huge uploads stay in bounded memory
+RESULTS_SPOOL_BYTES = 1 << 20
+# Longest record (NDJSON line) accepted; longer ones are reported as invalid unread
+MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", str(8 << 20)))
+
+def detect_format(content_type: str) -> Optional[str]:
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return CSV
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json"):
+        return NDJSON
+    return None
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = MAX_LINE_BYTES) -> AsyncIterator[Optional[bytes]]:
+    """
+    Split a byte stream into lines, holding at most one partial line (of up to
+    `max_line_bytes`) in memory. Each chunk is scanned once. Longer lines are
+    skipped and yielded as None.
+    """
+    pending = bytearray()
+    oversized = False
+    async for chunk in chunks:
+        view = memoryview(chunk)
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                break
+            if oversized or len(pending) + end - start > max_line_bytes:
+                yield None
+            elif pending:
+                pending += view[start:end]
+                yield bytes(pending)
+            else:
+                yield chunk[start:end]
+            pending.clear()
+            oversized = False
+            start = end + 1
+        if not oversized and len(pending) + len(chunk) - start > max_line_bytes:
+            oversized = True
+            pending.clear()
+        if not oversized:
+            pending += view[start:]
+    if oversized:
+        yield None
+    elif pending:
+        yield bytes(pending)
+
+def _format_errors(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'record'}: {e['msg']}"
+        for e in error.errors()
+    )
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str):
+    """
+    Yield (line_number, CampaignCreate or None, error) for every non-empty line,
+    or for CSV every record (numbered by its first line; quoted fields may span
+    lines). CSV uploads have a header row and describe campaigns without sites
+    or periods.
+    """
+    header = None
+    line_number = 0
+    # Lines of the CSV record being read, its first line number, quotes and size so far
+    parts, start, quotes, size = [], 0, 0, 0
+    async for raw in iter_lines(chunks, MAX_LINE_BYTES):
+        line_number += 1
+        if raw is None or size + len(raw) > MAX_LINE_BYTES:
+            if parts:
+                yield start, None, f"record longer than {MAX_LINE_BYTES} bytes"
+            else:
+                yield line_number, None, f"line longer than {MAX_LINE_BYTES} bytes"
+            parts, quotes, size = [], 0, 0
+            continue
+        try:
+            text = raw.decode("utf-8-sig" if line_number == 1 else "utf-8")
+        except UnicodeDecodeError:
+            yield start if parts else line_number, None, "line is not valid UTF-8"
+            parts, quotes, size = [], 0, 0
+            continue
+
+        number = line_number
+        if fmt == CSV:
+            if not parts:
+                if not text.strip():
+                    continue
+                start = line_number
+            parts.append(text.rstrip("\r"))
+            quotes += text.count('"')
+            size += len(raw)
+            # An odd number of quotes leaves a quoted field open: the record goes on
+            if quotes % 2:
+                continue
+            row = next(csv.reader(io.StringIO("\n".join(parts).strip(), newline="")))
+            number, parts, quotes, size = start, [], 0, 0
+            if header is None:
+                header = row
+                continue
+            record = {key: value or None for key, value in zip(header, row)}
+        else:
+            text = text.strip()
+            if not text:
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as e:
+                yield number, None, f"invalid JSON: {e}"
+                continue
+
+        try:
+            yield number, schemas.CampaignCreate.model_validate(record), None
+        except ValidationError as e:
+            yield number, None, _format_errors(e)
+    if parts:
+        yield start, None, "unterminated quoted field"
+
+async def import_campaigns(
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    write_batch: Callable[[List[schemas.CampaignCreate]], list],
+    batch_size: int
+):
+    """
+    Validate an upload record by record and hand it to `write_batch` (run in the
+    threadpool) every `batch_size` valid campaigns. Returns the per-record results
+    as an NDJSON temporary file positioned at the start, and the status counts.
+    """
+    results = tempfile.SpooledTemporaryFile(max_size=RESULTS_SPOOL_BYTES, mode="w+b")
+    counts = {"created": 0, "conflict": 0, "invalid": 0}
+    batch, batch_lines = [], []
+
+    def record(line_number, name, status, detail=None):
+        counts[status] += 1
+        result = {"line": line_number, "name": name, "status": status}
+        if detail:
+            result["detail"] = detail
+        results.write(json.dumps(result).encode() + b"\n")
+
+    async def flush():
+        written = await run_in_threadpool(write_batch, batch)
+        for line_number, (name, status) in zip(batch_lines, written):
+            record(line_number, name, status)
+        batch.clear()
+        batch_lines.clear()
+
+    async for line_number, campaign, error in iter_records(chunks, fmt):
+        if campaign is None:
+            record(line_number, None, "invalid", error)
+            continue
+        batch.append(campaign)
+        batch_lines.append(line_number)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+
+    results.seek(0)
+    return results, counts
@@ -0,0 +1,203 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from fastapi import Request, Response
+from pydantic import BaseModel
+from . import metrics
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+# Bodies at least this large are sent compressed to clients that accept it
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+# Bumped by every write to campaign data. Cached responses are keyed by it, so
+# a write makes all of them unreachable at once. It is per process: writes made
+# by another process (e.g. seed.py) are picked up when entries expire.
+_data_version = 0
+_version_lock = threading.Lock()
+
+response_cache = TTLCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+
+def data_version() -> int:
+    return _data_version
+
+def bump_data_version() -> int:
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+    response_cache.clear()
+    return _data_version
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+def lookup(request: Request):
+    """Cache key of a read request and its cached (body, etag, variants) entry, if any."""
+    key = (data_version(), request.url.path, tuple(sorted(request.query_params.multi_items())))
+    return key, response_cache.get(key)
+
+def encode(model: Optional[type], payload: Any) -> bytes:
+    """
+    JSON bytes of `payload` validated against `model`. With no model the payload
+    is plain data (dicts, lists, dates) and is dumped with orjson as is, which
+    skips building a pydantic object per row.
+    """
+    with metrics.phase("serialize"):
+        if model is None:
+            import orjson
+
+            return orjson.dumps(payload)
+        if not isinstance(payload, BaseModel):
+            payload = model.model_validate(payload)
+        return payload.model_dump_json().encode()
+
+def store(key, model: Optional[type], payload: Any):
+    """Encode `payload` (see encode), cache it with an ETag and return the entry."""
+    body = encode(model, payload)
+    # The dict memoizes the compressed variants of the body, made on first use
+    entry = (body, make_etag(body), {})
+    response_cache.set(key, entry)
+    return entry
+
+def accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").lower().split(","):
+        name, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        try:
+            if params.startswith("q=") and float(params[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip())
+    return accepted
+
+@lru_cache(maxsize=1)
+def brotli_module():
+    """brotli, imported with the first large response; None when not installed (clients get gzip)."""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def negotiate_encoding(request: Request, body: bytes) -> Optional[str]:
+    if len(body) < COMPRESS_MIN_BYTES:
+        return None
+    accepted = accepted_encodings(request)
+    if "br" in accepted and brotli_module() is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli_module().compress(body, quality=5)
+    import gzip
+
+    return gzip.compress(body, compresslevel=6)
+
+def respond(request: Request, entry) -> Response:
+    body, etag, variants = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    encoding = negotiate_encoding(request, body)
+    if encoding:
+        # Each content coding is a different representation, so it gets its own ETag
+        headers["ETag"] = etag[:-1] + "-" + encoding + '"'
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        if encoding not in variants:
+            variants[encoding] = compress(body, encoding)
+        body = variants[encoding]
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def cached_response(request: Request, model: Optional[type], build: Callable[[], Any]) -> Response:
+    """
+    Serve a read endpoint from the response cache, keyed by path, normalized
+    query parameters and data version. `build` is only called on a miss and its
+    result is encoded (see encode) and stored as JSON bytes with an ETag.
+    Requests whose If-None-Match matches get an empty 304; large bodies are
+    compressed with brotli or gzip once per entry.
+    """
+    key, entry = lookup(request)
+    if entry is None:
+        entry = store(key, model, build())
+    return respond(request, entry)
+
+async def cached_response_async(request: Request, model: Optional[type], build: Callable[[], Awaitable[Any]]) -> Response:
+    """cached_response for coroutine builders."""
+    key, entry = lookup(request)
+    if entry is None:
+        entry = store(key, model, await build())
+    return respond(request, entry)
@@ -1,103 +1,699 @@
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from datetime import datetime
-from typing import Optional
-from . import models, schemas
+from sqlalchemy import and_, func, insert, literal, or_, select, tuple_, update
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import List, Optional
+import math
+import os
+from . import models, schemas, pagination, cache, rollups, search, sites, period_buckets
+from .database import dialect_insert
 
-def get_campaigns(
-    db: Session,
-    skip: int = 0,
-    limit: int = 10,
+# Serve campaign lists and summaries from the in-memory column store of
+# app.analytics. It (like app.traffic and app.demographics) needs NumPy, so those
+# modules are imported by the functions that use them, not on cold start.
+ANALYTICS_STORE = os.getenv("ANALYTICS_STORE", "0").lower() in ("1", "true", "yes")
+
+# Memoized aggregates (list totals per filter), keyed by
+# the data version so any write invalidates them. The TTL bounds how long rows
+# loaded by another process (seed.py) can go unnoticed.
+MEMO_TTL_SECONDS = 30
+MEMO_MAX_ENTRIES = 256
+
+# Campaigns longer than this many days are the "long" span class of the
+# date-overlap search (see overlap_statement)
+OVERLAP_SHORT_SPAN_DAYS = int(os.getenv("OVERLAP_SHORT_SPAN_DAYS", "92"))
+_memo = cache.TTLCache(MEMO_MAX_ENTRIES, MEMO_TTL_SECONDS)
+
+def invalidate_read_caches(new_campaigns: Optional[List[str]] = None):
+    """
+    Call after writing campaign data; drops memoized aggregates and cached responses.
+    Pass the names of the campaigns inserted when that was the only change, so the
+    analytics store appends them instead of reloading.
+    """
+    cache.bump_data_version()
+    if ANALYTICS_STORE:
+        analytics_store().invalidate(new_campaigns)
+
+def analytics_store():
+    """The column store, loading app.analytics on first use."""
+    from . import analytics
+    return analytics.store
+
+def _memoized(key, compute):
+    return _memo.get_or_set((cache.data_version(),) + key, compute)
+
+# Statement builders are shared by the sync functions below and by crud_async.
+
+def campaigns_statement(
     tipo_campania: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None
 ):
-    query = db.query(models.Campaign)
+    statement = select(models.Campaign)
 
     if tipo_campania:
-        query = query.filter(models.Campaign.tipo_campania == tipo_campania)
+        statement = statement.where(models.Campaign.tipo_campania == tipo_campania)
     
+    # Compared as dates: SQLite would compare a datetime as text and miss the boundary day
     if start_date:
-        query = query.filter(models.Campaign.fecha_inicio >= start_date)
+        statement = statement.where(models.Campaign.fecha_inicio >= _as_date(start_date))
     
     if end_date:
-        query = query.filter(models.Campaign.fecha_fin <= end_date)
-    
-    total = query.count()
-    campaings = query.offset(skip).limit(limit).all()
-    
-    return campaings, total
+        statement = statement.where(models.Campaign.fecha_fin <= _as_date(end_date))
+
+    return statement
+
+def count_statement(statement):
+    return select(func.count()).select_from(statement.order_by(None).subquery())
+
+def campaigns_page_statement(statement, skip: int, limit: int, cursor: Optional[str]):
+    """Order by name and fetch one row past the page to know whether another follows."""
+    if cursor is not None:
+        last_name = pagination.decode_cursor(cursor, str)[0]
+        statement = statement.where(models.Campaign.name > last_name)
+        skip = 0
+    return statement.order_by(models.Campaign.name).offset(skip).limit(limit + 1)
+
+def projected_columns(fields: List[str], keys: List[str]) -> list:
+    """Campaign columns to SELECT for `fields`, plus the `keys` the page cursor needs."""
+    return [getattr(models.Campaign, name) for name in dict.fromkeys([*fields, *keys])]
+
+def _fetch_page(db: Session, statement, fields: Optional[List[str]], keys: List[str]):
+    """ORM campaigns, or with `fields` plain rows carrying only those columns (and `keys`)."""
+    if fields:
+        return db.execute(statement.with_only_columns(*projected_columns(fields, keys))).all()
+    return db.scalars(statement).all()
+
+def split_page(rows, limit: Optional[int], cursor_key):
+    """Trim the look-ahead row of a page and build the cursor of the next page."""
+    rows = list(rows)
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, pagination.encode_cursor(*cursor_key(rows[-1]))
+
+def get_campaigns(
+    db: Session,
+    skip: int = 0,
+    limit: int = 10,
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    fields: Optional[List[str]] = None
+):
+    """
+    Return a page of campaigns ordered by name, the total matching rows (or None
+    when include_total is False) and the cursor of the next page, if any.
+    When a cursor is given, skip is ignored and the page starts right after the
+    last name of the previous page, so deep pages cost the same as the first.
+    `fields` limits the SELECT to those columns (see _fetch_page).
+    """
+    if ANALYTICS_STORE:
+        campaigns, total = analytics_store().get_campaigns_page(
+            db, skip, limit, tipo_campania, start_date, end_date, cursor, include_total
+        )
+    else:
+        statement = campaigns_statement(tipo_campania, start_date, end_date)
+
+        total = None
+        if include_total:
+            total = _memoized(
+                ("campaigns_total", tipo_campania, start_date, end_date),
+                lambda: db.scalar(count_statement(statement))
+            )
+
+        campaigns = _fetch_page(db, campaigns_page_statement(statement, skip, limit, cursor), fields, ["name"])
+    campaigns, next_cursor = split_page(campaigns, limit, lambda c: (c.name,))
+    return campaigns, total, next_cursor
 
 def get_campaign(db: Session, campaign_id: str):
-    return db.query(models.Campaign).filter(models.Campaign.name == campaign_id).first()
+    return db.get(models.Campaign, campaign_id)
 
-def search_campaigns_by_date(
+def sites_page_statement(
+    campaign_id: str,
+    sites_limit: Optional[int],
+    sites_cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None
+):
+    statement = select(models.CampaignSite).where(models.CampaignSite.campaign_name == campaign_id)
+    if estado:
+        statement = statement.where(models.CampaignSite.estado == estado)
+    if municipio:
+        statement = statement.where(models.CampaignSite.municipio == municipio)
+    if tipo_de_mueble:
+        statement = statement.where(models.CampaignSite.tipo_de_mueble == tipo_de_mueble)
+    if sites_cursor is not None:
+        last_id = pagination.decode_cursor(sites_cursor, int)[0]
+        statement = statement.where(models.CampaignSite.id > last_id)
+    statement = statement.order_by(models.CampaignSite.id)
+    return statement if sites_limit is None else statement.limit(sites_limit + 1)
+
+def periods_statement(campaign_id: str):
+    return select(models.CampaignPeriod).where(
+        models.CampaignPeriod.campaign_name == campaign_id
+    ).order_by(models.CampaignPeriod.id)
+
+def get_campaign_detail(
     db: Session,
-    start_date: datetime,
-    end_date: datetime
+    campaign_id: str,
+    sites_limit: Optional[int] = None,
+    sites_cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None
 ):
-    return db.query(models.Campaign).filter(
-        and_(
-            models.Campaign.fecha_inicio <= end_date,
-            models.Campaign.fecha_fin >= start_date
+    """
+    Load a campaign with its sites (one page of `sites_limit` if given) and all
+    of its periods in three queries, without touching the lazy relationships.
+    Returns None when the campaign does not exist, otherwise
+    (campaign, sites, periods, next_cursor).
+    """
+    campaign = get_campaign(db, campaign_id)
+    if campaign is None:
+        return None
+
+    sites = db.scalars(sites_page_statement(
+        campaign_id, sites_limit, sites_cursor, estado=estado, municipio=municipio, tipo_de_mueble=tipo_de_mueble
+    )).all()
+    sites, next_cursor = split_page(sites, sites_limit, lambda site: (site.id,))
+    periods = db.scalars(periods_statement(campaign_id)).all()
+
+    return campaign, sites, periods, next_cursor
+
+def _site_buckets_statement(
+    group_by: str,
+    limit: Optional[int] = None,
+    campaign_id: Optional[str] = None,
+    tipo_campania: Optional[str] = None
+):
+    """
+    Site figures per group_by value. Categorical attributes are grouped by their
+    integer code (see app.sites) and only the buckets are joined to the strings.
+    """
+    fact, site = models.CampaignSiteFact, models.Site
+    code = site.codigo_del_sitio if group_by == "codigo_del_sitio" else getattr(site, f"{group_by}_id")
+    buckets = select(
+        code.label("code"),
+        func.count(fact.id).label("sites"),
+        func.coalesce(func.sum(fact.impactos_mensuales), 0).label("impactos_mensuales"),
+        func.coalesce(func.sum(fact.impactos_catorcenal), 0).label("impactos_catorcenal"),
+        func.coalesce(func.sum(fact.alcance_mensual), 0.0).label("alcance_mensual"),
+        func.avg(fact.frecuencia_mensual).label("frecuencia_mensual_promedio")
+    ).select_from(fact).join(site, site.id == fact.site_id)
+    if campaign_id is not None:
+        buckets = buckets.where(fact.campaign_name == campaign_id)
+    if tipo_campania:
+        buckets = buckets.join(models.Campaign, models.Campaign.name == fact.campaign_name).where(
+            models.Campaign.tipo_campania == tipo_campania
         )
-    ).all()
+    buckets = buckets.group_by(code).subquery("buckets")
 
-def create_campaign_with_details(db: Session, campaign: schemas.CampaignCreate):
-    # Create Campaign instance
-    db_campaign = models.Campaign(
-        name=campaign.name,
-        tipo_campania=campaign.tipo_campania,
-        fecha_inicio=campaign.fecha_inicio,
-        fecha_fin=campaign.fecha_fin,
-        universo_zona_metro=campaign.universo_zona_metro,
-        impactos_personas=campaign.impactos_personas,
-        impactos_vehiculos=campaign.impactos_vehiculos,
-        frecuencia_calculada=campaign.frecuencia_calculada,
-        frecuencia_promedio=campaign.frecuencia_promedio,
-        alcance=campaign.alcance,
-        nse_ab=campaign.nse_ab,
-        nse_c=campaign.nse_c,
-        nse_cmas=campaign.nse_cmas,
-        nse_d=campaign.nse_d,
-        nse_dmas=campaign.nse_dmas,
-        nse_e=campaign.nse_e,
-        edad_0a14=campaign.edad_0a14,
-        edad_15a19=campaign.edad_15a19,
-        edad_20a24=campaign.edad_20a24,
-        edad_25a34=campaign.edad_25a34,
-        edad_35a44=campaign.edad_35a44,
-        edad_45a64=campaign.edad_45a64,
-        edad_65mas=campaign.edad_65mas,
-        hombres=campaign.hombres,
-        mujeres=campaign.mujeres
+    if group_by == "codigo_del_sitio":
+        key, source = buckets.c.code, buckets
+    else:
+        category = models.SiteCategory.__table__.alias("category")
+        key, source = category.c.value, buckets.outerjoin(category, category.c.id == buckets.c.code)
+    statement = select(
+        key.label("key"), buckets.c.sites, buckets.c.impactos_mensuales, buckets.c.impactos_catorcenal,
+        buckets.c.alcance_mensual, buckets.c.frecuencia_mensual_promedio
+    ).select_from(source).order_by(buckets.c.impactos_mensuales.desc(), key)
+    if limit:
+        statement = statement.limit(limit)
+    return statement
+
+def site_summary_statement(campaign_id: str, group_by: str, limit: Optional[int] = None):
+    return _site_buckets_statement(group_by, limit, campaign_id=campaign_id)
+
+def summarize_sites(db: Session, campaign_id: str, group_by: str, limit: Optional[int] = None):
+    """Aggregate a campaign's sites per group_by value, largest impactos first."""
+    if ANALYTICS_STORE:
+        return analytics_store().summarize_sites(db, campaign_id, group_by, limit)
+    return [row._asdict() for row in db.execute(site_summary_statement(campaign_id, group_by, limit))]
+
+def all_sites_summary_statement(group_by: str, tipo_campania: Optional[str] = None, limit: Optional[int] = None):
+    return _site_buckets_statement(group_by, limit, tipo_campania=tipo_campania)
+
+def summarize_all_sites(db: Session, group_by: str, tipo_campania: Optional[str] = None, limit: Optional[int] = None):
+    """Aggregate the sites of every campaign (optionally of one type) per group_by value."""
+    if ANALYTICS_STORE:
+        return analytics_store().summarize_all_sites(db, group_by, tipo_campania, limit)
+    return [row._asdict() for row in db.execute(all_sites_summary_statement(group_by, tipo_campania, limit))]
+
+def site_demographics_statement(
+    campaign_id: str,
+    weight: str,
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None
+):
+    from . import demographics
+
+    site = models.CampaignSite
+    weight_column = literal(1.0) if weight == "sites" else getattr(site, weight)
+    statement = select(weight_column, *(getattr(site, name) for name in demographics.COLUMNS)).where(
+        site.campaign_name == campaign_id
+    )
+    for name, value in (("estado", estado), ("municipio", municipio), ("tipo_de_mueble", tipo_de_mueble)):
+        if value:
+            statement = statement.where(getattr(site, name) == value)
+    return statement
+
+def site_demographics(
+    db: Session,
+    campaign_id: str,
+    weight: str,
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None
+):
+    """Demographics of a campaign's (filtered) sites weighted by `weight` (see app.demographics)."""
+    filters = {"estado": estado, "municipio": municipio, "tipo_de_mueble": tipo_de_mueble}
+    if ANALYTICS_STORE:
+        from . import demographics
+
+        weights, values = analytics_store().site_demographics(db, campaign_id, weight, filters)
+        return demographics.summarize(values, weights)
+    return demographics_summary(db.execute(site_demographics_statement(campaign_id, weight, **filters)).all())
+
+def demographics_summary(rows):
+    """demographics.summarize of the rows of site_demographics_statement."""
+    import numpy as np
+    from . import demographics
+
+    matrix = np.array(rows, dtype=np.float64).reshape(-1, len(demographics.COLUMNS) + 1)
+    return demographics.summarize(matrix[:, 1:], matrix[:, 0])
+
+def period_summary_statement(campaign_id: str):
+    return select(
+        models.CampaignPeriod.period,
+        func.coalesce(func.sum(models.CampaignPeriod.impactos_periodo_personas), 0).label("impactos_periodo_personas"),
+        func.coalesce(func.sum(models.CampaignPeriod.impactos_periodo_vehiculos), 0).label("impactos_periodo_vehiculos")
+    ).where(
+        models.CampaignPeriod.campaign_name == campaign_id
+    ).group_by(models.CampaignPeriod.period).order_by(models.CampaignPeriod.period)
+
+def period_summary(periods: List[dict]):
+    total_personas = sum(p["impactos_periodo_personas"] for p in periods)
+    peak = max(periods, key=lambda p: p["impactos_periodo_personas"], default=None)
+    return {
+        "periods": periods,
+        "total_personas": total_personas,
+        "total_vehiculos": sum(p["impactos_periodo_vehiculos"] for p in periods),
+        "promedio_personas": total_personas / len(periods) if periods else None,
+        "peak_period": peak["period"] if peak else None
+    }
+
+def period_series_statement(
+    dialect_name: str,
+    granularity: str,
+    group_by: str,
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    period = models.CampaignPeriod
+    bucket = period_buckets.bucket_expression(period.period_start, granularity, dialect_name).label("bucket")
+    by_type = group_by == "tipo_campania"
+    key = models.Campaign.tipo_campania if by_type else literal(None)
+    statement = select(
+        key.label("key"),
+        bucket,
+        func.coalesce(func.sum(period.impactos_periodo_personas), 0).label("impactos_periodo_personas"),
+        func.coalesce(func.sum(period.impactos_periodo_vehiculos), 0).label("impactos_periodo_vehiculos")
+    ).select_from(period).where(period.period_start.isnot(None))
+    if by_type or tipo_campania:
+        statement = statement.join(models.Campaign, models.Campaign.name == period.campaign_name)
+    if tipo_campania:
+        statement = statement.where(models.Campaign.tipo_campania == tipo_campania)
+    if start_date:
+        statement = statement.where(period.period_start >= _as_date(start_date))
+    if end_date:
+        statement = statement.where(period.period_start <= _as_date(end_date))
+    groups = [models.Campaign.tipo_campania, bucket] if by_type else [bucket]
+    return statement.group_by(*groups).order_by(*groups)
+
+def period_series(
+    db: Session,
+    granularity: str,
+    group_by: str,
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """Impactos per month, quarter or year of every campaign's periods, one series per group."""
+    statement = period_series_statement(
+        db.get_bind().dialect.name, granularity, group_by, tipo_campania, start_date, end_date
     )
-    db.add(db_campaign)
-    db.flush() # Flush to check for potential errors on campaign creation first
-
-    # Create Sites
-    for site in campaign.sites:
-        db_site = models.CampaignSite(
-            **site.model_dump(),
-            campaign_name=campaign.name
+    return series_of(db.execute(statement))
+
+def series_of(rows):
+    """The rows of period_series_statement as one list of points per key."""
+    series = []
+    for key, rows in groupby(rows, key=lambda row: row.key):
+        points = [
+            {
+                "bucket": row.bucket,
+                "impactos_periodo_personas": row.impactos_periodo_personas,
+                "impactos_periodo_vehiculos": row.impactos_periodo_vehiculos,
+            }
+            for row in rows
+        ]
+        series.append({"key": key, "points": points})
+    return series
+
+def summarize_periods(db: Session, campaign_id: str):
+    if ANALYTICS_STORE:
+        return period_summary(analytics_store().period_rows(db, campaign_id))
+    return period_summary([row._asdict() for row in db.execute(period_summary_statement(campaign_id))])
+
+def campaign_summary_statement(group_by: str):
+    key = getattr(models.Campaign, group_by)
+    return select(
+        key.label("key"),
+        func.count(models.Campaign.name).label("campaigns"),
+        func.coalesce(func.sum(models.Campaign.impactos_personas), 0).label("impactos_personas"),
+        func.coalesce(func.sum(models.Campaign.impactos_vehiculos), 0).label("impactos_vehiculos"),
+        func.coalesce(func.sum(models.Campaign.alcance), 0).label("alcance"),
+        func.avg(models.Campaign.frecuencia_promedio).label("frecuencia_promedio")
+    ).group_by(key).order_by(key)
+
+def summarize_campaigns(db: Session, group_by: str):
+    if ANALYTICS_STORE:
+        return analytics_store().summarize_campaigns(db, group_by)
+    return [row._asdict() for row in db.execute(campaign_summary_statement(group_by))]
+
+def top_campaigns_statement(metric: str, limit: int, tipo_campania: Optional[str] = None, ascending: bool = False):
+    column = getattr(models.Campaign, metric)
+    statement = select(models.Campaign).where(column.isnot(None))
+    if tipo_campania:
+        statement = statement.where(models.Campaign.tipo_campania == tipo_campania)
+    order = column.asc() if ascending else column.desc()
+    return statement.order_by(order, models.Campaign.name).limit(limit)
+
+def top_campaigns(db: Session, metric: str, limit: int, tipo_campania: Optional[str] = None, ascending: bool = False):
+    """Campaigns with the highest (or lowest) value of a numeric column, ties by name."""
+    if ANALYTICS_STORE:
+        return analytics_store().top_campaigns(db, metric, limit, tipo_campania, ascending)
+    return db.scalars(top_campaigns_statement(metric, limit, tipo_campania, ascending)).all()
+
+def traffic_profile_statement(campaign_id: str):
+    return select(models.Campaign.hourly_vehicle_counts).where(models.Campaign.name == campaign_id)
+
+def get_traffic_profile(db: Session, campaign_id: str):
+    """The campaign's hourly profile (None when it has none), or False when the campaign does not exist."""
+    return traffic_profile(db.execute(traffic_profile_statement(campaign_id)).first())
+
+def traffic_profile(row):
+    """get_traffic_profile's result from the row of traffic_profile_statement (None when not found)."""
+    from . import traffic
+
+    if row is None:
+        return False
+    return traffic.unpack(row[0])
+
+def traffic_statement(
+    group_by: str,
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    key = models.Campaign.tipo_campania if group_by == "tipo_campania" else literal(None)
+    return campaigns_statement(tipo_campania, start_date, end_date).with_only_columns(
+        key.label("key"), models.Campaign.hourly_vehicle_counts
+    ).where(models.Campaign.hourly_vehicle_counts.isnot(None))
+
+def summarize_traffic(
+    db: Session,
+    group_by: str,
+    percentiles: List[float],
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """Hourly sum, mean and percentiles of the matching campaigns' traffic profiles per group."""
+    return traffic_summary(db.execute(traffic_statement(group_by, tipo_campania, start_date, end_date)).all(), percentiles)
+
+def traffic_summary(rows, percentiles: List[float]):
+    """traffic.aggregate of the rows of traffic_statement."""
+    from . import traffic
+
+    profiles = traffic.matrix(row.hourly_vehicle_counts for row in rows)
+    return traffic.aggregate([row.key for row in rows], profiles, percentiles)
+
+def campaign_span(dialect_name: str):
+    """fecha_fin - fecha_inicio in days, as indexed by ix_campaigns_span."""
+    if dialect_name == "sqlite":
+        return func.julianday(models.Campaign.fecha_fin) - func.julianday(models.Campaign.fecha_inicio)
+    return models.Campaign.fecha_fin - models.Campaign.fecha_inicio
+
+def longest_span_statement(dialect_name: str):
+    """Longest campaign span in days; NULL when there are no campaigns."""
+    return select(func.max(campaign_span(dialect_name)))
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+def _has_long_campaigns(longest_span) -> bool:
+    return longest_span is not None and longest_span > OVERLAP_SHORT_SPAN_DAYS
+
+def _unindexed(dialect_name: str, column):
+    """`column` as a filter SQLite will not pick an index for (unary +)."""
+    if dialect_name == "sqlite":
+        return UnaryExpression(column, operator=operators.custom_op("+"), type_=column.type)
+    return column
+
+def overlap_statement(
+    dialect_name: str,
+    start_date: datetime,
+    end_date: datetime,
+    tipo_campania: Optional[str] = None,
+    longest_span: Optional[float] = None
+):
+    """
+    Campaigns whose [fecha_inicio, fecha_fin] overlaps [start_date, end_date],
+    ordered by (fecha_inicio, name). `longest_span` is the result of
+    longest_span_statement, read in the same transaction.
+
+    `fecha_fin >= start` alone cannot use an index together with the start bound,
+    so campaigns are split in two span classes. Those of at most
+    OVERLAP_SHORT_SPAN_DAYS are read from the fecha_inicio index range
+    [start - their longest span, end]: any of them starting earlier has already
+    ended. The longer ones, when there are any, are read from ix_campaigns_span,
+    so a single long campaign no longer stretches the range over the whole
+    table. That plan matches the two ranges and sorts them, so it is only used
+    while long campaigns exist; SQLite is kept to it by not indexing the other
+    conditions, the sort and the page cursor (see overlap_page_statement).
+    """
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    short_span = min(longest_span or 0, OVERLAP_SHORT_SPAN_DAYS)
+    in_window = and_(
+        models.Campaign.fecha_inicio >= start_date - timedelta(days=math.ceil(short_span)),
+        models.Campaign.fecha_inicio <= end_date
+    )
+    if _has_long_campaigns(longest_span):
+        long_running = and_(
+            campaign_span(dialect_name) > OVERLAP_SHORT_SPAN_DAYS,
+            _unindexed(dialect_name, models.Campaign.fecha_inicio) <= end_date
+        )
+        statement = select(models.Campaign).where(
+            _unindexed(dialect_name, models.Campaign.fecha_fin) >= start_date,
+            or_(in_window, long_running)
         )
-        db.add(db_site)
+        if tipo_campania:
+            statement = statement.where(_unindexed(dialect_name, models.Campaign.tipo_campania) == tipo_campania)
+        # Sorted after matching; an index order would tempt SQLite into a full scan
+        return statement.order_by(_unindexed(dialect_name, models.Campaign.fecha_inicio), models.Campaign.name)
+    statement = select(models.Campaign).where(in_window, models.Campaign.fecha_fin >= start_date)
+    if tipo_campania:
+        statement = statement.where(models.Campaign.tipo_campania == tipo_campania)
+    return statement.order_by(models.Campaign.fecha_inicio, models.Campaign.name)
 
-    # Create Periods
-    for period in campaign.periods:
-        db_period = models.CampaignPeriod(
-            **period.model_dump(),
-            campaign_name=campaign.name
+def overlap_page_statement(
+    statement,
+    skip: int,
+    limit: int,
+    cursor: Optional[str],
+    dialect_name: str = "",
+    longest_span: Optional[float] = None
+):
+    if cursor is not None:
+        key = pagination.decode_cursor(cursor, str, str)
+        try:
+            last_inicio, last_name = date.fromisoformat(key[0]), key[1]
+        except ValueError:
+            raise pagination.InvalidCursor("Malformed cursor")
+        fecha_inicio = models.Campaign.fecha_inicio
+        if _has_long_campaigns(longest_span):
+            # An open-ended seek from the cursor would read to the end of the table
+            fecha_inicio = _unindexed(dialect_name, fecha_inicio)
+        statement = statement.where(
+            tuple_(fecha_inicio, models.Campaign.name) > tuple_(last_inicio, last_name)
+        )
+        skip = 0
+    return statement.offset(skip).limit(limit + 1)
+
+def overlap_cursor_key(campaign):
+    return campaign.fecha_inicio.isoformat(), campaign.name
+
+def overlap_total_key(tipo_campania, start_date, end_date):
+    return ("overlap_total", tipo_campania, _as_date(start_date), _as_date(end_date))
+
+def search_campaigns_by_date(
+    db: Session,
+    start_date: datetime,
+    end_date: datetime,
+    tipo_campania: Optional[str] = None
+):
+    """Date-overlap statement (see overlap_statement)."""
+    dialect_name = db.get_bind().dialect.name
+    longest_span = db.scalar(longest_span_statement(dialect_name))
+    return overlap_statement(dialect_name, start_date, end_date, tipo_campania=tipo_campania, longest_span=longest_span)
+
+def get_campaigns_by_date(
+    db: Session,
+    start_date: datetime,
+    end_date: datetime,
+    skip: int = 0,
+    limit: int = 10,
+    tipo_campania: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    fields: Optional[List[str]] = None
+):
+    """Paginated date-overlap search, returning the same triple as get_campaigns."""
+    dialect_name = db.get_bind().dialect.name
+    longest_span = db.scalar(longest_span_statement(dialect_name))
+    statement = overlap_statement(dialect_name, start_date, end_date, tipo_campania=tipo_campania, longest_span=longest_span)
+
+    total = None
+    if include_total:
+        total = _memoized(
+            overlap_total_key(tipo_campania, start_date, end_date),
+            lambda: db.scalar(count_statement(statement))
         )
-        db.add(db_period)
+
+    page = overlap_page_statement(statement, skip, limit, cursor, dialect_name, longest_span)
+    campaigns = _fetch_page(db, page, fields, ["fecha_inicio", "name"])
+    campaigns, next_cursor = split_page(campaigns, limit, overlap_cursor_key)
+    return campaigns, total, next_cursor
+
+def _insert_ignoring_conflicts(db: Session, model):
+    """
+    INSERT that skips rows whose primary key already exists, so uniqueness is
+    decided by the database rather than by a prior SELECT. Returns None on
+    dialects without ON CONFLICT support.
+    """
+    statement = dialect_insert(db.get_bind(), model.__table__)
+    return None if statement is None else statement.on_conflict_do_nothing()
+
+def _campaign_row(campaign: schemas.CampaignCreate) -> dict:
+    from . import traffic
+
+    row = campaign.model_dump(exclude={"sites", "periods"})
+    row["hourly_vehicle_counts"] = traffic.pack(row["hourly_vehicle_counts"])
+    return row
+
+def _period_rows(campaign: schemas.CampaignCreate) -> List[dict]:
+    return [
+        {
+            **period.model_dump(),
+            "campaign_name": campaign.name,
+            "period_start": period_buckets.period_start(period.period, campaign.tipo_campania),
+        }
+        for period in campaign.periods
+    ]
+
+def create_campaign_with_details(db: Session, campaign: schemas.CampaignCreate):
+    """
+    Create a campaign, its sites and its periods with one INSERT per table and a
+    single commit. Returns None when a campaign with the same name already
+    exists; the response is built from the input instead of re-querying.
+    """
+    campaign_row = _campaign_row(campaign)
+
+    statement = _insert_ignoring_conflicts(db, models.Campaign)
+    try:
+        if statement is None:
+            db.execute(insert(models.Campaign.__table__), campaign_row)
+        elif db.execute(statement, campaign_row).rowcount == 0:
+            db.rollback()
+            return None
+    except IntegrityError:
+        db.rollback()
+        return None
+
+    site_rows = [{**site.model_dump(), "campaign_name": campaign.name} for site in campaign.sites]
+    period_rows = _period_rows(campaign)
+    if site_rows:
+        sites.insert(db, site_rows)
+    if period_rows:
+        db.execute(insert(models.CampaignPeriod), period_rows)
+    rollups.apply(db, [campaign.name], site_rows, period_rows)
+    search.apply(db, [campaign.name], site_rows)
 
     db.commit()
-    db.refresh(db_campaign)
-    db.refresh(db_campaign)
-    return db_campaign
+    invalidate_read_caches([campaign.name])
+    return schemas.Campaign(**campaign_row)
+
+def bulk_create_campaigns(db: Session, campaigns: List[schemas.CampaignCreate]):
+    """
+    Insert a batch of campaigns with their sites and periods in one transaction
+    using multi-row inserts. Names that already exist (or repeat inside the
+    batch) are skipped. Returns (name, "created" | "conflict") per campaign.
+    """
+    rows = {}
+    for campaign in campaigns:
+        rows.setdefault(campaign.name, _campaign_row(campaign))
+
+    statement = _insert_ignoring_conflicts(db, models.Campaign)
+    if statement is None:
+        taken = set(db.scalars(select(models.Campaign.name).where(models.Campaign.name.in_(list(rows)))))
+        campaign_rows = [row for name, row in rows.items() if name not in taken]
+        if campaign_rows:
+            db.execute(insert(models.Campaign), campaign_rows)
+        inserted = {row["name"] for row in campaign_rows}
+    elif rows:
+        # What the database actually inserted, so a concurrent writer's names are conflicts too
+        inserted = set(db.scalars(statement.returning(models.Campaign.name), list(rows.values())))
+    else:
+        inserted = set()
+
+    results = []
+    site_rows, period_rows = [], []
+    for campaign in campaigns:
+        if campaign.name not in inserted:
+            results.append((campaign.name, "conflict"))
+            continue
+        inserted.discard(campaign.name)
+        results.append((campaign.name, "created"))
+        site_rows.extend({**site.model_dump(), "campaign_name": campaign.name} for site in campaign.sites)
+        period_rows.extend(_period_rows(campaign))
+
+    created = [name for name, status in results if status == "created"]
+    if created:
+        if site_rows:
+            sites.insert(db, site_rows)
+        if period_rows:
+            db.execute(insert(models.CampaignPeriod), period_rows)
+        rollups.apply(db, created, site_rows, period_rows)
+        search.apply(db, created, site_rows)
+    db.commit()
+    if created:
+        invalidate_read_caches(created)
+    return results
+
+def user_statement(username: str):
+    return select(models.User).where(models.User.username == username)
 
 def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+    return db.scalars(user_statement(username)).first()
 
 def create_user(db: Session, user: schemas.UserCreate):
     from . import auth
@@ -106,4 +702,11 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    auth.invalidate_user(db_user.username)
     return db_user
+
+def update_password_hash(db: Session, username: str, hashed_password: str):
+    from . import auth
+    db.execute(update(models.User).where(models.User.username == username).values(hashed_password=hashed_password))
+    db.commit()
+    auth.invalidate_user(username)
@@ -0,0 +1,211 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Optional
+from . import cache, crud, models, rollups, schemas, search, sites
+
+# Async counterparts of the crud read functions, used when DB_ASYNC is enabled.
+# They execute the same statements as crud and return the same shapes.
+
+async def _memoized(key, compute):
+    key = (cache.data_version(),) + key
+    value = crud._memo.get(key)
+    if value is None:
+        value = await compute()
+        crud._memo.set(key, value)
+    return value
+
+async def _fetch_page(db: AsyncSession, statement, fields: Optional[List[str]], keys: List[str]):
+    if fields:
+        return (await db.execute(statement.with_only_columns(*crud.projected_columns(fields, keys)))).all()
+    return (await db.scalars(statement)).all()
+
+async def get_campaigns(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 10,
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    fields: Optional[List[str]] = None
+):
+    if crud.ANALYTICS_STORE:
+        campaigns, total = await db.run_sync(
+            crud.analytics_store().get_campaigns_page, skip, limit, tipo_campania, start_date, end_date, cursor, include_total
+        )
+    else:
+        statement = crud.campaigns_statement(tipo_campania, start_date, end_date)
+
+        total = None
+        if include_total:
+            total = await _memoized(
+                ("campaigns_total", tipo_campania, start_date, end_date),
+                lambda: db.scalar(crud.count_statement(statement))
+            )
+
+        campaigns = await _fetch_page(db, crud.campaigns_page_statement(statement, skip, limit, cursor), fields, ["name"])
+    campaigns, next_cursor = crud.split_page(campaigns, limit, lambda c: (c.name,))
+    return campaigns, total, next_cursor
+
+async def get_campaign(db: AsyncSession, campaign_id: str):
+    return await db.get(models.Campaign, campaign_id)
+
+async def get_campaign_detail(
+    db: AsyncSession,
+    campaign_id: str,
+    sites_limit: Optional[int] = None,
+    sites_cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None
+):
+    campaign = await get_campaign(db, campaign_id)
+    if campaign is None:
+        return None
+
+    sites = (await db.scalars(crud.sites_page_statement(
+        campaign_id, sites_limit, sites_cursor, estado=estado, municipio=municipio, tipo_de_mueble=tipo_de_mueble
+    ))).all()
+    sites, next_cursor = crud.split_page(sites, sites_limit, lambda site: (site.id,))
+    periods = (await db.scalars(crud.periods_statement(campaign_id))).all()
+
+    return campaign, sites, periods, next_cursor
+
+async def summarize_sites(db: AsyncSession, campaign_id: str, group_by: str, limit: Optional[int] = None):
+    if crud.ANALYTICS_STORE:
+        return await db.run_sync(crud.analytics_store().summarize_sites, campaign_id, group_by, limit)
+    result = await db.execute(crud.site_summary_statement(campaign_id, group_by, limit))
+    return [row._asdict() for row in result]
+
+async def summarize_periods(db: AsyncSession, campaign_id: str):
+    if crud.ANALYTICS_STORE:
+        return crud.period_summary(await db.run_sync(crud.analytics_store().period_rows, campaign_id))
+    result = await db.execute(crud.period_summary_statement(campaign_id))
+    return crud.period_summary([row._asdict() for row in result])
+
+async def summarize_campaigns(db: AsyncSession, group_by: str):
+    if crud.ANALYTICS_STORE:
+        return await db.run_sync(crud.analytics_store().summarize_campaigns, group_by)
+    return [row._asdict() for row in await db.execute(crud.campaign_summary_statement(group_by))]
+
+async def summarize_all_sites(db: AsyncSession, group_by: str, tipo_campania: Optional[str] = None, limit: Optional[int] = None):
+    if crud.ANALYTICS_STORE:
+        return await db.run_sync(crud.analytics_store().summarize_all_sites, group_by, tipo_campania, limit)
+    result = await db.execute(crud.all_sites_summary_statement(group_by, tipo_campania, limit))
+    return [row._asdict() for row in result]
+
+async def site_demographics(
+    db: AsyncSession,
+    campaign_id: str,
+    weight: str,
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None
+):
+    filters = {"estado": estado, "municipio": municipio, "tipo_de_mueble": tipo_de_mueble}
+    if crud.ANALYTICS_STORE:
+        return await db.run_sync(crud.site_demographics, campaign_id, weight, **filters)
+    rows = (await db.execute(crud.site_demographics_statement(campaign_id, weight, **filters))).all()
+    return crud.demographics_summary(rows)
+
+async def get_site_usage(db: AsyncSession, codigo_del_sitio: str):
+    row = (await db.execute(sites.site_usage_statement(codigo_del_sitio))).first()
+    return row._asdict() if row is not None else None
+
+async def period_series(
+    db: AsyncSession,
+    granularity: str,
+    group_by: str,
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    statement = crud.period_series_statement(
+        db.get_bind().dialect.name, granularity, group_by, tipo_campania, start_date, end_date
+    )
+    return crud.series_of(await db.execute(statement))
+
+async def top_campaigns(db: AsyncSession, metric: str, limit: int, tipo_campania: Optional[str] = None, ascending: bool = False):
+    if crud.ANALYTICS_STORE:
+        return await db.run_sync(crud.analytics_store().top_campaigns, metric, limit, tipo_campania, ascending)
+    return (await db.scalars(crud.top_campaigns_statement(metric, limit, tipo_campania, ascending))).all()
+
+async def get_traffic_profile(db: AsyncSession, campaign_id: str):
+    return crud.traffic_profile((await db.execute(crud.traffic_profile_statement(campaign_id))).first())
+
+async def summarize_traffic(
+    db: AsyncSession,
+    group_by: str,
+    percentiles: List[float],
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    rows = (await db.execute(crud.traffic_statement(group_by, tipo_campania, start_date, end_date))).all()
+    return crud.traffic_summary(rows, percentiles)
+
+async def search_campaigns(db: AsyncSession, query: str, field: Optional[str] = None, skip: int = 0, limit: int = 10):
+    dialect_name = db.get_bind().dialect.name
+    statement = search.search_statement(dialect_name, query, field, skip, limit)
+    if statement is None:
+        return [], False
+    hits, has_more, complete = search.page_of(await db.execute(statement), limit, search.SEARCH_MAX_TERMS)
+    if not complete:
+        statement = search.search_statement(dialect_name, query, field, skip, limit, search.SEARCH_SCAN_TERMS)
+        hits, has_more, _ = search.page_of(await db.execute(statement), limit, search.SEARCH_SCAN_TERMS)
+    return hits, has_more
+
+async def search_campaigns_by_date(
+    db: AsyncSession,
+    start_date: datetime,
+    end_date: datetime,
+    tipo_campania: Optional[str] = None
+):
+    dialect_name = db.get_bind().dialect.name
+    longest_span = await db.scalar(crud.longest_span_statement(dialect_name))
+    return crud.overlap_statement(dialect_name, start_date, end_date, tipo_campania=tipo_campania, longest_span=longest_span)
+
+async def get_campaigns_by_date(
+    db: AsyncSession,
+    start_date: datetime,
+    end_date: datetime,
+    skip: int = 0,
+    limit: int = 10,
+    tipo_campania: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    fields: Optional[List[str]] = None
+):
+    dialect_name = db.get_bind().dialect.name
+    longest_span = await db.scalar(crud.longest_span_statement(dialect_name))
+    statement = crud.overlap_statement(dialect_name, start_date, end_date, tipo_campania=tipo_campania, longest_span=longest_span)
+
+    total = None
+    if include_total:
+        total = await _memoized(
+            crud.overlap_total_key(tipo_campania, start_date, end_date),
+            lambda: db.scalar(crud.count_statement(statement))
+        )
+
+    page = crud.overlap_page_statement(statement, skip, limit, cursor, dialect_name, longest_span)
+    campaigns = await _fetch_page(db, page, fields, ["fecha_inicio", "name"])
+    campaigns, next_cursor = crud.split_page(campaigns, limit, crud.overlap_cursor_key)
+    return campaigns, total, next_cursor
+
+async def get_rollups(db: AsyncSession, campaign_names):
+    if not campaign_names:
+        return {}
+    rollups_statement, muebles_statement = rollups.rollup_statements(campaign_names)
+    return rollups.merge_rollups(
+        (await db.scalars(rollups_statement)).all(),
+        (await db.scalars(muebles_statement)).all()
+    )
+
+async def create_campaign_with_details(db: AsyncSession, campaign: schemas.CampaignCreate):
+    # The write path (conflict-checked insert, child inserts, rollups) runs the
+    # sync implementation on the async connection.
+    return await db.run_sync(crud.create_campaign_with_details, campaign)
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    return (await db.scalars(crud.user_statement(username))).first()
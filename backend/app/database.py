@@ -1,13 +1,22 @@
 import os
 import shutil
-from sqlalchemy import create_engine
+import warnings
+from sqlalchemy import create_engine, event, inspect, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./campaigns.db"
+DEFAULT_DATABASE_URL = "sqlite:///./campaigns.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
 
-# Fix for AWS Lambda read-only file system
-if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+ON_LAMBDA = bool(os.environ.get("AWS_LAMBDA_FUNCTION_NAME"))
+
+# Serve a packaged SQLite file as is: opened read-only and immutable, without
+# copying it or creating journal files, and with the write routes disabled. The
+# default on Lambda, where the package directory is read-only.
+DATABASE_READ_ONLY = os.getenv("DATABASE_READ_ONLY", "1" if ON_LAMBDA else "0").lower() in ("1", "true", "yes")
+
+# Fix for AWS Lambda read-only file system (when the database must stay writable)
+if ON_LAMBDA and not DATABASE_READ_ONLY and SQLALCHEMY_DATABASE_URL == DEFAULT_DATABASE_URL:
     source_db = "campaigns.db"
     target_db = "/tmp/campaigns.db"
     
@@ -16,9 +25,190 @@ if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
             shutil.copy2(source_db, target_db)
         SQLALCHEMY_DATABASE_URL = f"sqlite:///{target_db}"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Reads may go to a replica; by default they use the same database
+SQLALCHEMY_READ_DATABASE_URL = os.getenv("DATABASE_READ_URL", SQLALCHEMY_DATABASE_URL)
+
+# Reads get a pool of their own so a long write never holds up a dashboard
+# request waiting for a connection. SQLite allows a single writer at a time, so
+# writes queue for one connection here instead of failing with "database is
+# locked"; WRITE_POOL_TIMEOUT bounds that wait.
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "8"))
+WRITE_POOL_TIMEOUT = float(os.getenv("WRITE_POOL_TIMEOUT", "30"))
+
+# Connection settings applied to every SQLite connection. WAL lets readers keep
+# reading the last committed data while a write is in progress.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def is_memory_sqlite(url: str) -> bool:
+    return is_sqlite(url) and make_url(url).database in (None, "", ":memory:")
+
+def read_only_url(url: str) -> str:
+    """URI of a SQLite file database that opens it read-only and immutable."""
+    path = make_url(url).database
+    return f"sqlite:///file:{path}?mode=ro&immutable=1&uri=true"
+
+def configure_sqlite(sync_engine, read_only: bool = False):
+    """
+    Apply the journaling, page cache, mmap and busy timeout settings on connect.
+    `read_only` connections also refuse writes (PRAGMA query_only).
+    """
+    memory = is_memory_sqlite(str(sync_engine.url))
+    immutable = sync_engine.url.query.get("immutable") == "1"
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not memory and not immutable:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+def create_write_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    if not is_sqlite(url):
+        return create_engine(url, pool_pre_ping=True)
+    if is_memory_sqlite(url):
+        write_engine = create_engine(url, connect_args={"check_same_thread": False})
+    else:
+        write_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=WRITE_POOL_TIMEOUT,
+        )
+    configure_sqlite(write_engine)
+    return write_engine
+
+def create_read_engine(url: str = SQLALCHEMY_READ_DATABASE_URL):
+    if not is_sqlite(url):
+        return create_engine(url, pool_size=READ_POOL_SIZE, pool_pre_ping=True)
+    if is_memory_sqlite(url):
+        # A private in-memory database would be empty; share the writer's
+        return engine
+    read_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=READ_POOL_SIZE,
+        max_overflow=READ_POOL_SIZE,
+    )
+    configure_sqlite(read_engine, read_only=True)
+    return read_engine
+
+# `engine`/SessionLocal is the single writer and also runs migrations and seeding;
+# ReadSessionLocal serves the read routes.
+if DATABASE_READ_ONLY and is_sqlite(SQLALCHEMY_DATABASE_URL) and not is_memory_sqlite(SQLALCHEMY_DATABASE_URL):
+    engine = read_engine = create_read_engine(read_only_url(SQLALCHEMY_DATABASE_URL))
+else:
+    engine = create_write_engine()
+    read_engine = create_read_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Optional asyncio stack (DB_ASYNC=1): the API routes then run on the event loop
+# through crud_async, split like the sync stack into a writer and a read pool
+# of at most ASYNC_DB_POOL_SIZE connections, waiting ASYNC_DB_POOL_TIMEOUT
+# seconds at most for one.
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "8"))
+ASYNC_DB_POOL_TIMEOUT = float(os.getenv("ASYNC_DB_POOL_TIMEOUT", "30"))
+
+def async_url(url: str) -> str:
+    """Swap the sync driver of a database URL for its asyncio counterpart."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgresql:"):
+        return "postgresql+asyncpg:" + url[len("postgresql:"):]
+    return url
+
+def create_async_session_factory(url: str = SQLALCHEMY_DATABASE_URL, read_only: bool = False):
+    """
+    Async sessions on `url`. As with the sync engines, a SQLite file gets a
+    single writer connection, and `read_only` sessions a pool of their own whose
+    connections refuse writes.
+    """
+    # Imported here so the sync deployment does not need aiosqlite installed
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    single_writer = is_sqlite(url) and not read_only and not is_memory_sqlite(url)
+    async_engine = create_async_engine(
+        async_url(url),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1 if single_writer else ASYNC_DB_POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=WRITE_POOL_TIMEOUT if single_writer else ASYNC_DB_POOL_TIMEOUT,
+    )
+    if is_sqlite(url):
+        configure_sqlite(async_engine.sync_engine, read_only=read_only)
+    return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+AsyncSessionLocal = AsyncReadSessionLocal = None
+if DB_ASYNC:
+    AsyncSessionLocal = create_async_session_factory(engine.url.render_as_string(hide_password=False))
+    # Like read_engine: the writer's own database when reads have nowhere else to go
+    AsyncReadSessionLocal = AsyncSessionLocal if read_engine is engine else create_async_session_factory(
+        read_engine.url.render_as_string(hide_password=False), read_only=True
+    )
 
 Base = declarative_base()
+
+def sync_schema(metadata, bind):
+    """
+    Create missing tables and bring existing ones up to date with the models.
+    create_all skips tables that already exist, so columns and indexes added
+    later are applied here to databases created by an older version.
+    """
+    with bind.begin() as conn:
+        metadata.create_all(bind=conn)
+        inspector = inspect(conn)
+        for table in metadata.sorted_tables:
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+            with warnings.catch_warnings():
+                # Expression indexes (created by DDL events, see models) are not reflected
+                warnings.filterwarnings("ignore", "Skipped unsupported reflection of expression-based index")
+                indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(bind=conn)
+
+def dialect_insert(bind, table):
+    """
+    INSERT construct of the bind's dialect, which supports ON CONFLICT clauses
+    (SQLite and PostgreSQL). Returns None for dialects without them.
+    """
+    dialect = bind.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(table)
+
+def checkpoint(bind):
+    """
+    Fold the WAL back into the main SQLite file, so the file alone holds every
+    committed row (needed before it is packaged and opened read-only).
+    """
+    if bind.dialect.name == "sqlite":
+        with bind.connect() as conn:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
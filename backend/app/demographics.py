@@ -0,0 +1,46 @@
+"""
+Impact-weighted audience demographics of a set of sites. The site columns are
+reported under the names of the campaign-level figures they correspond to.
+"""
+from typing import Dict, List, Optional
+import numpy as np
+
+SITE_COLUMNS = {
+    "nivel_socioeconomico_ab": "nse_ab",
+    "nivel_socioeconomico_c": "nse_c",
+    "nivel_socioeconomico_c_mas": "nse_cmas",
+    "nivel_socioeconomico_d": "nse_d",
+    "nivel_socioeconomico_d_mas": "nse_dmas",
+    "nivel_socioeconomico_e": "nse_e",
+    "cero_catorce": "edad_0a14",
+    "quince_diecinueve": "edad_15a19",
+    "veinte_veinticuatro": "edad_20a24",
+    "veinticinco_treintaycuatro": "edad_25a34",
+    "treintaycinco_cuarentaycuatro": "edad_35a44",
+    "cuarentaycinco_sesentaycuatro": "edad_45a64",
+    "sesentaycinco_mas": "edad_65mas",
+    "per_hom": "hombres",
+    "per_muj": "mujeres",
+    "exposicion_promedio_catorcenal": "exposicion_promedio_catorcenal",
+}
+COLUMNS: List[str] = list(SITE_COLUMNS)
+
+def weighted_means(values: np.ndarray, weights: np.ndarray) -> List[Optional[float]]:
+    """
+    Per-column mean of an (n, k) array weighted by `weights` (n,). NaN values and
+    NaN weights are left out; a column with no weight left is None.
+    """
+    weights = np.nan_to_num(weights)[:, None]
+    present = ~np.isnan(values)
+    totals = (np.where(present, values, 0.0) * weights).sum(axis=0)
+    shares = (present * weights).sum(axis=0)
+    return [float(t / s) if s > 0 else None for t, s in zip(totals, shares)]
+
+def summarize(values: np.ndarray, weights: np.ndarray) -> Dict:
+    """Site count, total weight and weighted demographics of the COLUMNS of (n, k) `values`."""
+    means = weighted_means(values.reshape(-1, len(COLUMNS)), weights)
+    return {
+        "sites": len(weights),
+        "total_weight": float(np.nansum(weights)),
+        "demographics": dict(zip(SITE_COLUMNS.values(), means)),
+    }
@@ -1,33 +1,65 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from .database import SessionLocal
+from . import database
+from .database import ReadSessionLocal, SessionLocal
 from . import schemas, crud, auth
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def get_db():
+    """Session on the single writer connection, for routes that write."""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_read_db():
+    """Session from the read pool, which never waits on writes."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def require_writable():
+    """Reject writes when the deployment serves a read-only database."""
+    if database.DATABASE_READ_ONLY:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="This deployment serves a read-only database"
+        )
+
+async def get_async_db():
+    """AsyncSession on the writer, for async routes that write."""
+    async with database.AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    """AsyncSession from the async read pool."""
+    async with database.AsyncReadSessionLocal() as db:
+        yield db
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = auth.jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+        payload = auth.decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
         token_data = schemas.TokenData(username=username)
-    except auth.JWTError:
+    except auth.InvalidToken:
         raise credentials_exception
-    user = crud.get_user_by_username(db, username=token_data.username)
+    user = auth.user_cache.get(token_data.username)
     if user is None:
-        raise credentials_exception
+        db_user = crud.get_user_by_username(db, username=token_data.username)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.User.model_validate(db_user)
+        auth.cache_user(user, payload)
     return user
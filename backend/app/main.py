@@ -1,11 +1,24 @@
+import os
+from functools import lru_cache
+from typing import List
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from . import models, crud, schemas
-from .database import engine, SessionLocal
+from fastapi.middleware.gzip import GZipMiddleware
+from . import models, crud, schemas, database, auth, cache, metrics
+from .database import engine, SessionLocal, sync_schema
 from .routes import router
 from .dependencies import get_db
 
-models.Base.metadata.create_all(bind=engine)
+# Creating the schema and the admin user at startup costs every cold start a
+# few queries and a bcrypt hash. On Lambda (and with a read-only database) both
+# happen at build time instead, when seed.py prepares the packaged database.
+BOOTSTRAP_ON_STARTUP = (
+    os.getenv("BOOTSTRAP_ON_STARTUP", "0" if database.ON_LAMBDA else "1").lower() in ("1", "true", "yes")
+    and not database.DATABASE_READ_ONLY
+)
+
+if BOOTSTRAP_ON_STARTUP:
+    sync_schema(models.Base.metadata, engine)
 
 app = FastAPI(title="Campaign Analytics API")
 
@@ -17,11 +30,58 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Cached read responses are already compressed by app.cache (brotli or gzip,
+# once per entry); this covers the rest, e.g. streamed exports.
+app.add_middleware(GZipMiddleware, minimum_size=cache.COMPRESS_MIN_BYTES)
+# Outermost, so the timings and the Server-Timing header cover everything above
+app.add_middleware(metrics.MetricsMiddleware)
+
+def use_async_routes(sync_router, async_router):
+    """
+    Swap each sync route for the async route with the same path and methods,
+    keeping the sync router's order (which matters for /campaigns/{campaign_id}).
+    """
+    replacements = {(r.path, frozenset(r.methods)): r for r in async_router.routes}
+    sync_router.routes = [
+        replacements.get((r.path, frozenset(getattr(r, "methods", None) or ())), r)
+        for r in sync_router.routes
+    ]
+
+if database.DB_ASYNC:
+    from . import async_routes
+    use_async_routes(router, async_routes.router)
 
 app.include_router(router)
 
+def pending_maintenance(bind) -> List[str]:
+    """
+    Commands a database upgraded from an older version needs before it can be
+    served: until they run, the tables they fill read back empty. They rewrite
+    or drop tables, so they are run by hand (or by seed.py), never implicitly
+    at startup.
+    """
+    from . import period_buckets, rollups, search, sites
+    pending = []
+    with bind.connect() as conn:
+        if sites.needs_migration(conn):
+            pending.append("python -m app.sites migrate")
+        if rollups.needs_backfill(conn):
+            pending.append("python -m app.rollups rebuild")
+        if search.needs_backfill(conn):
+            pending.append("python -m app.search rebuild")
+        if period_buckets.needs_backfill(conn):
+            pending.append("python -m app.period_buckets backfill")
+    return pending
+
 @app.on_event("startup")
 def startup_event():
+    if not BOOTSTRAP_ON_STARTUP:
+        return
+    pending = pending_maintenance(engine)
+    if pending:
+        raise RuntimeError(
+            "The database predates this version; run `python seed.py` or " + ", ".join(f"`{c}`" for c in pending)
+        )
     db = SessionLocal()
     try:
         user = crud.get_user_by_username(db, "admin")
@@ -31,5 +91,16 @@ def startup_event():
     finally:
         db.close()
 
-from mangum import Mangum
-handler = Mangum(app)
+@app.on_event("shutdown")
+def shutdown_event():
+    auth.shutdown_hashing()
+
+@lru_cache(maxsize=1)
+def lambda_adapter():
+    from mangum import Mangum
+
+    return Mangum(app)
+
+def handler(event, context):
+    """Lambda entry point (template.yaml); mangum is imported with the first event."""
+    return lambda_adapter()(event, context)
@@ -0,0 +1,272 @@
+"""
+Per-request instrumentation: an ASGI middleware times every request, SQLAlchemy
+cursor events count the statements it runs and their time, and the breakdown is
+sent back in a Server-Timing header:
+
+    Server-Timing: db;dur=2.1;desc="3 queries", orm;dur=0.6, serialize;dur=0.4, app;dur=0.7, total;dur=3.8
+
+`db` is time spent executing statements, `orm` fetching the rows of session
+queries and hydrating ORM objects from them, `serialize` encoding response
+bodies (see cache.encode), and `app` the rest: routing, validation and Python
+work on the results. The same numbers feed
+per-route histograms and counters, which GET /metrics exposes in the Prometheus
+text format together with connection pool and threadpool gauges.
+
+Bookkeeping is a few perf_counter calls and a lock per request. METRICS_ENABLED=0
+turns it all off and SERVER_TIMING=0 keeps the metrics without the header.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+class RequestTimings:
+    """What one request spent, filled in by the hooks below while it is handled."""
+
+    __slots__ = ("started", "statements", "db_seconds", "phases")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.phases = {}
+
+    def add_phase(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        app = total - self.db_seconds - sum(self.phases.values())
+        entries = [f'db;dur={self.db_seconds * 1000:.2f};desc="{self.statements} queries"']
+        entries += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        entries += [f"app;dur={max(app, 0.0) * 1000:.2f}", f"total;dur={total * 1000:.2f}"]
+        return ", ".join(entries)
+
+# Copied into the threadpool that runs sync routes, so their statements count too
+_current: contextvars.ContextVar = contextvars.ContextVar("request_timings", default=None)
+
+@contextmanager
+def phase(name: str):
+    """Time a block as its own Server-Timing entry of the current request, if any."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_phase(name, time.perf_counter() - started)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _current.get()
+    started = conn.info.get("metrics_started")
+    if timings is None or not started:
+        return
+    timings.statements += 1
+    timings.db_seconds += time.perf_counter() - started.pop()
+
+@event.listens_for(Session, "do_orm_execute")
+def _time_orm_loading(orm_execute_state):
+    """
+    Load every row of a session SELECT up front, timed as the `orm` phase.
+    Streamed queries (yield_per, stream_results) are left alone: their rows are
+    loaded while the response is sent.
+    """
+    if _current.get() is None or not orm_execute_state.is_select:
+        return None
+    options = orm_execute_state.execution_options
+    if options.get("yield_per") or options.get("stream_results"):
+        return None
+    result = orm_execute_state.invoke_statement()
+    with phase("orm"):
+        loaded = result.freeze()
+    return loaded()
+
+class Histogram:
+    """Cumulative-bucket histogram per label values, as Prometheus expects."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, labels: Tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            # Bucket counts, then the sum and count of the observations
+            series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = _labels(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), labels + (_number(bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), labels + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{base} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{base} {series[-1]}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str]):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, labels)} {_number(value)}" for labels, value in sorted(self._values.items())]
+        return lines
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+def _samples(name: str, help: str, kind: str, samples: Sequence[Tuple[Tuple, float]], labels: Sequence[str] = ()) -> list:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labels, values)} {_number(value)}" for values, value in samples]
+    return lines
+
+_lock = threading.Lock()
+_in_flight = 0
+ROUTE_LABELS = ("method", "route")
+request_seconds = Histogram(
+    "http_request_duration_seconds", "Time to the first byte of the response, by route.",
+    ROUTE_LABELS + ("status",), LATENCY_BUCKETS
+)
+request_statements = Histogram(
+    "http_request_db_statements", "SQL statements run per request, by route.", ROUTE_LABELS, STATEMENT_BUCKETS
+)
+db_seconds = Counter("http_request_db_seconds_total", "Time spent executing SQL statements, by route.", ROUTE_LABELS)
+phase_seconds = Counter(
+    "http_request_phase_seconds_total", "Time spent in named phases such as serialize, by route.", ROUTE_LABELS + ("phase",)
+)
+
+def record(method: str, route: str, status: int, seconds: float, timings: RequestTimings):
+    labels = (method, route)
+    with _lock:
+        request_seconds.observe(labels + (str(status),), seconds)
+        request_statements.observe(labels, timings.statements)
+        db_seconds.inc(labels, timings.db_seconds)
+        for name, value in timings.phases.items():
+            phase_seconds.inc(labels + (name,), value)
+
+def route_label(scope) -> str:
+    """Path template of the matched route, so /campaigns/{campaign_id} is one series."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """Times each HTTP request, adds Server-Timing and records the route's metrics."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        global _in_flight
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+        first_byte = None
+        with _lock:
+            _in_flight += 1
+
+        async def send_with_timing(message):
+            nonlocal status, first_byte
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                first_byte = time.perf_counter() - timings.started
+                if SERVER_TIMING:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", timings.server_timing(first_byte).encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            with _lock:
+                _in_flight -= 1
+            elapsed = first_byte if first_byte is not None else time.perf_counter() - timings.started
+            record(scope["method"], route_label(scope), status, elapsed, timings)
+
+def _pool_samples(engines: Dict[str, Engine]):
+    """(pool, checked out, size, overflow) of each distinct connection pool."""
+    seen = set()
+    for name, engine in engines.items():
+        if engine is None or id(engine.pool) in seen:
+            continue
+        seen.add(id(engine.pool))
+        pool = engine.pool
+        yield name, getattr(pool, "checkedout", lambda: 0)(), getattr(pool, "size", lambda: 0)(), getattr(pool, "overflow", lambda: 0)()
+
+def render(engines: Dict[str, Engine], threadpool: Optional[Tuple[int, float]] = None, caches: Optional[dict] = None) -> str:
+    """
+    All metrics in the Prometheus text format. `threadpool` is (busy threads,
+    thread limit) of the request threadpool and `caches` maps cache names to
+    their TTLCache.stats().
+    """
+    with _lock:
+        lines = request_seconds.render() + request_statements.render() + db_seconds.render() + phase_seconds.render()
+        in_flight = _in_flight
+    lines += _samples("http_requests_in_flight", "Requests being handled.", "gauge", [((), in_flight)])
+    pools = list(_pool_samples(engines))
+    for index, (metric, help) in enumerate((
+        ("db_pool_checked_out", "Connections in use, by pool."),
+        ("db_pool_size", "Configured connections, by pool."),
+        ("db_pool_overflow", "Connections over the pool size (negative while below it), by pool."),
+    ), start=1):
+        lines += _samples(metric, help, "gauge", [((pool[0],), pool[index]) for pool in pools], ("pool",))
+    if threadpool is not None:
+        lines += _samples("threadpool_busy_threads", "Threads of the request threadpool running sync routes.", "gauge", [((), threadpool[0])])
+        lines += _samples("threadpool_max_threads", "Size of the request threadpool.", "gauge", [((), threadpool[1])])
+    if caches:
+        for metric, help in (("hits", "Lookups answered by the cache."), ("misses", "Lookups the cache could not answer.")):
+            lines += _samples(f"cache_{metric}_total", help, "counter",
+                              [((name,), stats[metric]) for name, stats in caches.items()], ("cache",))
+        lines += _samples("cache_entries", "Entries held, by cache.", "gauge",
+                          [((name,), stats["entries"]) for name, stats in caches.items()], ("cache",))
+    return "\n".join(lines) + "\n"
+
+def reset():
+    """Forget recorded requests (for tests)."""
+    with _lock:
+        for metric in (request_seconds, request_statements):
+            metric._series.clear()
+        for metric in (db_seconds, phase_seconds):
+            metric._values.clear()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Integer, Date, ForeignKey
+from sqlalchemy import DDL, Column, String, Float, Integer, Date, ForeignKey, Index, LargeBinary, event, select
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -37,9 +37,35 @@ class Campaign(Base):
     hombres = Column(Float)
     mujeres = Column(Float)
 
+    # Vehicles per hour of day, 24 packed little-endian int32 (see app.traffic)
+    hourly_vehicle_counts = Column(LargeBinary)
+
     # Relationships
     periods = relationship("CampaignPeriod", back_populates="campaign")
-    sites = relationship("CampaignSite", back_populates="campaign")
+    sites = relationship(
+        "CampaignSite", primaryjoin="Campaign.name == foreign(CampaignSite.campaign_name)",
+        back_populates="campaign", viewonly=True
+    )
+
+    # Composite indexes matching the list filters; the trailing name column lets
+    # keyset pagination seek straight to the cursor instead of scanning.
+    __table_args__ = (
+        Index("ix_campaigns_tipo_name", "tipo_campania", "name"),
+        Index("ix_campaigns_inicio_name", "fecha_inicio", "name"),
+        Index("ix_campaigns_tipo_inicio", "tipo_campania", "fecha_inicio", "name"),
+        Index("ix_campaigns_fin_name", "fecha_fin", "name"),
+    )
+
+# Campaign span in days, indexed so the date-overlap search reads the longest one
+# with an index lookup (see crud.campaign_span, which must match these expressions)
+for dialect, span in (
+    ("sqlite", "julianday(fecha_fin) - julianday(fecha_inicio)"),
+    ("postgresql", "fecha_fin - fecha_inicio"),
+):
+    event.listen(
+        Base.metadata, "after_create",
+        DDL(f"CREATE INDEX IF NOT EXISTS ix_campaigns_span ON campaigns (({span}))").execute_if(dialect=dialect)
+    )
 
 class CampaignPeriod(Base):
     __tablename__ = "campaign_periods"
@@ -47,29 +73,200 @@ class CampaignPeriod(Base):
     id = Column(Integer, primary_key=True)
     campaign_name = Column(String, ForeignKey("campaigns.name"))
     period = Column(String)
+    # First day of `period` (see app.period_buckets)
+    period_start = Column(Date)
     impactos_periodo_personas = Column(Integer)
     impactos_periodo_vehiculos = Column(Integer)
 
     campaign = relationship("Campaign", back_populates="periods")
 
-class CampaignSite(Base):
-    __tablename__ = "campaign_sites"
+    # The time series range-scans period_start and reads the sums from the index.
+    __table_args__ = (
+        Index("ix_campaign_periods_campaign", "campaign_name", "id"),
+        Index(
+            "ix_campaign_periods_start", "period_start", "campaign_name",
+            "impactos_periodo_personas", "impactos_periodo_vehiculos"
+        ),
+    )
+
+class SiteCategory(Base):
+    """Dictionary of the categorical site attributes: each (field, value) gets an integer code."""
+    __tablename__ = "site_categories"
+
+    id = Column(Integer, primary_key=True)
+    field = Column(String, nullable=False)
+    value = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index("ix_site_categories_field_value", "field", "value", unique=True),
+    )
+
+class Site(Base):
+    """
+    A physical site and its attributes, stored once however many campaigns use
+    it. A code gets a further row only if a campaign reports it with different
+    attributes (see app.sites).
+    """
+    __tablename__ = "sites"
 
     id = Column(Integer, primary_key=True)
-    campaign_name = Column(String, ForeignKey("campaigns.name"))
     codigo_del_sitio = Column(String)
-    tipo_de_mueble = Column(String)
-    tipo_de_anuncio = Column(String)
-    estado = Column(String)
-    municipio = Column(String)
-    zm = Column(String)
+    # Codes of site_categories
+    tipo_de_mueble_id = Column(Integer, ForeignKey("site_categories.id"))
+    tipo_de_anuncio_id = Column(Integer, ForeignKey("site_categories.id"))
+    estado_id = Column(Integer, ForeignKey("site_categories.id"))
+    municipio_id = Column(Integer, ForeignKey("site_categories.id"))
+    zm_id = Column(Integer, ForeignKey("site_categories.id"))
+
+    # Audience shares at the site (see app.demographics)
+    nivel_socioeconomico_ab = Column(Float)
+    nivel_socioeconomico_c_mas = Column(Float)
+    nivel_socioeconomico_c = Column(Float)
+    nivel_socioeconomico_d_mas = Column(Float)
+    nivel_socioeconomico_d = Column(Float)
+    nivel_socioeconomico_e = Column(Float)
+    cero_catorce = Column(Float)
+    quince_diecinueve = Column(Float)
+    veinte_veinticuatro = Column(Float)
+    veinticinco_treintaycuatro = Column(Float)
+    treintaycinco_cuarentaycuatro = Column(Float)
+    cuarentaycinco_sesentaycuatro = Column(Float)
+    sesentaycinco_mas = Column(Float)
+    per_muj = Column(Float)
+    per_hom = Column(Float)
+
+    __table_args__ = (
+        Index("ix_sites_codigo", "codigo_del_sitio"),
+    )
+
+class CampaignSiteFact(Base):
+    """A site's figures in one campaign."""
+    __tablename__ = "campaign_site_facts"
+
+    id = Column(Integer, primary_key=True)
+    campaign_name = Column(String, ForeignKey("campaigns.name"))
+    site_id = Column(Integer, ForeignKey("sites.id"), nullable=False)
     frecuencia_catorcenal = Column(Float)
     frecuencia_mensual = Column(Float)
     impactos_catorcenal = Column(Integer)
     impactos_mensuales = Column(Integer)
     alcance_mensual = Column(Float)
+    exposicion_promedio_catorcenal = Column(Float)
+
+    # The detail view pages sites by id within a campaign; per-site questions
+    # (which campaigns used a site) read the second index only.
+    __table_args__ = (
+        Index("ix_campaign_site_facts_campaign", "campaign_name", "id"),
+        Index("ix_campaign_site_facts_site", "site_id", "campaign_name"),
+    )
+
+SITE_CATEGORY_FIELDS = ("tipo_de_mueble", "tipo_de_anuncio", "estado", "municipio", "zm")
+
+def _campaign_sites():
+    """
+    Facts joined with their site and decoded categories: one row per site of a
+    campaign, with the columns of the former campaign_sites table in its order.
+    """
+    fact, site = CampaignSiteFact.__table__, Site.__table__
+    categories = {field: SiteCategory.__table__.alias(f"{field}_category") for field in SITE_CATEGORY_FIELDS}
+    joined = fact.join(site, site.c.id == fact.c.site_id)
+    for field, category in categories.items():
+        joined = joined.outerjoin(category, category.c.id == site.c[f"{field}_id"])
+    metrics = [c for c in fact.c if c.name not in ("id", "campaign_name", "site_id")]
+    audience = [c for c in site.c if c.name not in ("id", "codigo_del_sitio") and not c.name.endswith("_id")]
+    return select(
+        fact.c.id, fact.c.campaign_name, site.c.codigo_del_sitio,
+        *(category.c.value.label(field) for field, category in categories.items()),
+        *metrics, *audience
+    ).select_from(joined).subquery("campaign_sites")
+
+class CampaignSite(Base):
+    """Read-only view of a campaign's sites; app.sites writes the tables behind it."""
+    __table__ = _campaign_sites()
+    __mapper_args__ = {"primary_key": [__table__.c.id]}
+
+    campaign = relationship("Campaign", back_populates="sites", viewonly=True)
+
+def _read_only(mapper, connection, target):
+    raise TypeError("CampaignSite is read-only; write sites with app.sites.insert()")
+
+for _operation in ("before_insert", "before_update", "before_delete"):
+    event.listen(CampaignSite, _operation, _read_only)
+
+class CampaignRollup(Base):
+    """Per-campaign figures derived from sites and periods, maintained on insert."""
+    __tablename__ = "campaign_rollups"
+
+    campaign_name = Column(String, ForeignKey("campaigns.name"), primary_key=True)
+    site_count = Column(Integer, nullable=False, default=0)
+    impactos_mensuales_total = Column(Integer, nullable=False, default=0)
+    period_count = Column(Integer, nullable=False, default=0)
+    peak_period = Column(String)
+    peak_period_impactos = Column(Integer)
+
+class CampaignRollupMueble(Base):
+    """Site count per tipo_de_mueble of each campaign."""
+    __tablename__ = "campaign_rollup_muebles"
+
+    campaign_name = Column(String, ForeignKey("campaigns.name"), primary_key=True)
+    tipo_de_mueble = Column(String, primary_key=True)
+    site_count = Column(Integer, nullable=False, default=0)
+
+class SearchTerm(Base):
+    """A distinct searchable value: a campaign name, or a site code or location."""
+    __tablename__ = "search_terms"
+
+    id = Column(Integer, primary_key=True)
+    field = Column(String, nullable=False)
+    value = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index("ix_search_terms_field_value", "field", "value", unique=True),
+    )
+
+# PostgreSQL matches terms by a prefix of the lowercased value (see
+# search.matched_terms_statement); text_pattern_ops lets LIKE 'prefix%' seek it
+event.listen(
+    Base.metadata, "after_create",
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_search_terms_value_prefix ON search_terms (lower(value) text_pattern_ops)"
+    ).execute_if(dialect="postgresql")
+)
+
+class SearchPosting(Base):
+    """The campaigns in which each search term appears."""
+    __tablename__ = "search_postings"
+
+    term_id = Column(Integer, ForeignKey("search_terms.id"), primary_key=True)
+    campaign_name = Column(String, ForeignKey("campaigns.name"), primary_key=True)
+
+    __table_args__ = {"sqlite_with_rowid": False}
+
+# Fields of search terms, in the order ranking prefers them for equally long values
+SEARCH_FIELDS = ("name", "codigo_del_sitio", "municipio", "estado", "zm")
+# A term's search_ranked rowid packs its value's length (capped to 19 bits), its
+# field's position in SEARCH_FIELDS (4 bits) and its id (40 bits). FTS5 returns
+# matches in rowid order, so a query reads the shortest values first and can stop
+# after a few, whatever the number of terms.
+SEARCH_TERM_ID_BITS = 40
+_field_positions = " ".join(f"WHEN '{field}' THEN {position}" for position, field in enumerate(SEARCH_FIELDS))
+_new_term_key = (
+    f"(min(length(new.value), {(1 << 19) - 1}) << {SEARCH_TERM_ID_BITS + 4}) "
+    f"| (CASE new.field {_field_positions} END << {SEARCH_TERM_ID_BITS}) | new.id"
+)
 
-    campaign = relationship("Campaign", back_populates="sites")
+# On SQLite the terms are also indexed with FTS5. The index is contentless (the
+# values stay in search_terms) and keyed as above; the trigger indexes
+# each new term as it is inserted. Attached to the metadata so databases whose
+# search_terms predate it get the index too (filled by search.rebuild()).
+for statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_ranked USING fts5("
+    "value, field, content='', tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+    "CREATE TRIGGER IF NOT EXISTS search_terms_ranked AFTER INSERT ON search_terms BEGIN "
+    f"INSERT INTO search_ranked(rowid, value, field) VALUES ({_new_term_key}, new.value, new.field); END",
+):
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Base.metadata, "before_drop", DDL("DROP TABLE IF EXISTS search_ranked").execute_if(dialect="sqlite"))
 
 class User(Base):
     __tablename__ = "users"
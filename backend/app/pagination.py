@@ -0,0 +1,28 @@
+import base64
+import json
+from typing import Any
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(*key: Any) -> str:
+    """Serialize the sort key of the last row of a page into an opaque token."""
+    raw = json.dumps(list(key), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types: type) -> list:
+    """The sort key of a cursor; with `types`, it must hold one value of each, in order."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(key, list) or not key:
+        raise InvalidCursor("Malformed cursor")
+    if types and (
+        len(key) != len(types)
+        # bool is an int to isinstance, but never a sort key
+        or any(isinstance(value, bool) or not isinstance(value, kind) for value, kind in zip(key, types))
+    ):
+        raise InvalidCursor("Malformed cursor")
+    return key
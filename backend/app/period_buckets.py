@@ -0,0 +1,95 @@
+"""
+Calendar buckets for campaign periods. CampaignPeriod.period is free text:
+"YYYY-MM" for monthly campaigns and "YYYY-NN" (catorcena NN, 14-day blocks
+counted from January 1st) for catorcenal ones. Its first day is stored in the
+indexed period_start column so time series can range-scan and GROUP BY month,
+quarter or year without parsing strings.
+
+Periods stored before period_start existed are filled in by seed.py, or with
+
+    python -m app.period_buckets backfill
+
+and the API refuses to start until they are (see main.pending_maintenance).
+"""
+import argparse
+import time
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Optional
+from sqlalchemy import Integer, String, cast, func, select, type_coerce, update
+from . import models
+
+GRANULARITIES = ("month", "quarter", "year")
+
+@lru_cache(maxsize=4096)
+def period_start(period, tipo_campania: Optional[str] = None) -> Optional[date]:
+    """First day of a period label; None when it cannot be parsed."""
+    try:
+        year, number = (int(part) for part in period.split("-", 1))
+        if tipo_campania == "catorcenal":
+            if not 1 <= number <= 27:
+                return None
+            return date(year, 1, 1) + timedelta(days=14 * (number - 1))
+        return date(year, number, 1)
+    except (AttributeError, ValueError):
+        return None
+
+def bucket_expression(column, granularity: str, dialect_name: str):
+    """SQL label of the month ("2025-07"), quarter ("2025-Q3") or year ("2025") of a DATE column."""
+    if dialect_name == "sqlite":
+        if granularity == "month":
+            return func.strftime("%Y-%m", column)
+        year = type_coerce(func.strftime("%Y", column), String)
+        if granularity == "year":
+            return year
+        quarter = (cast(func.strftime("%m", column), Integer) + 2) // 3
+        return year + "-Q" + cast(quarter, String)
+    formats = {"month": "YYYY-MM", "quarter": 'YYYY-"Q"Q', "year": "YYYY"}
+    return func.to_char(column, formats[granularity])
+
+def _unbucketed_labels(conn):
+    """Distinct (period, tipo_campania) of the periods without period_start (a seek on ix_campaign_periods_start)."""
+    period = models.CampaignPeriod
+    campaign = models.Campaign
+    return conn.execute(
+        select(period.period, campaign.tipo_campania).distinct()
+        .join(campaign, campaign.name == period.campaign_name)
+        .where(period.period_start.is_(None))
+    ).all()
+
+def needs_backfill(conn) -> bool:
+    """
+    True when a period that has a first day lacks period_start, e.g. right after
+    an upgrade. Labels that cannot be parsed stay NULL and do not count.
+    """
+    return any(period_start(label, tipo_campania) is not None for label, tipo_campania in _unbucketed_labels(conn))
+
+def backfill(conn) -> int:
+    """Set period_start where it is missing. Returns the number of rows updated."""
+    period = models.CampaignPeriod
+    campaign = models.Campaign
+    updated = 0
+    for label, tipo_campania in _unbucketed_labels(conn):
+        start = period_start(label, tipo_campania)
+        if start is None:
+            continue
+        names = select(campaign.name).where(campaign.tipo_campania == tipo_campania)
+        updated += conn.execute(
+            update(period)
+            .where(period.period == label, period.period_start.is_(None), period.campaign_name.in_(names))
+            .values(period_start=start)
+        ).rowcount
+    return updated
+
+if __name__ == "__main__":
+    from .database import engine, sync_schema
+
+    parser = argparse.ArgumentParser(description="Maintain the period_start buckets of campaign periods.")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+
+    sync_schema(models.Base.metadata, engine)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        updated = backfill(conn)
+    print(f"{updated} periods backfilled in {time.perf_counter() - started:.2f}s")
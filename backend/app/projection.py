@@ -0,0 +1,49 @@
+"""
+Field projection and the columnar format of the campaign list endpoints.
+
+`fields=name,tipo_campania,fecha_inicio` narrows the SELECT to those columns and
+each campaign to those keys. `format=columnar` returns one array per field
+instead of one object per campaign, so keys are not repeated on every row.
+Both payloads are plain data that cache.encode dumps with orjson, without
+building a pydantic model per row.
+"""
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from . import schemas
+
+CAMPAIGN_FIELDS = list(schemas.Campaign.model_fields)
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Requested campaign fields in order, or None for all; 400 on unknown names."""
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in schemas.Campaign.model_fields]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested"
+        )
+    return names
+
+def is_projected(fields: Optional[List[str]], format: str) -> bool:
+    """Whether the page is built by page_data instead of the response models."""
+    return fields is not None or format == "columnar"
+
+def page_data(campaigns, fields: Optional[List[str]], format: str, rollups_by_name: Optional[Dict[str, dict]] = None) -> dict:
+    """
+    The `data` of a page: objects with only `fields` (all of them when None), or
+    with `format=columnar` a mapping of field to values. `rollups_by_name` adds
+    the rollup of each campaign as one more field.
+    """
+    fields = fields or CAMPAIGN_FIELDS
+    if format == "columnar":
+        data = {name: [getattr(c, name) for c in campaigns] for name in fields}
+        if rollups_by_name is not None:
+            data["rollup"] = [rollups_by_name.get(c.name) for c in campaigns]
+        return {"data": data}
+    rows = [{name: getattr(c, name) for name in fields} for c in campaigns]
+    if rollups_by_name is not None:
+        for row, campaign in zip(rows, campaigns):
+            row["rollup"] = rollups_by_name.get(campaign.name)
+    return {"data": rows}
@@ -0,0 +1,204 @@
+"""
+Campaign rollups: site counts per tipo_de_mueble, total impactos_mensuales,
+period count and peak period of every campaign, kept in the campaign_rollups
+and campaign_rollup_muebles tables so listings read them per page instead of
+aggregating the child tables.
+
+Writers call apply() in the same transaction as their inserts; rebuild()
+recomputes everything from the child tables:
+
+    python -m app.rollups rebuild
+"""
+import argparse
+import time
+from typing import Dict, Iterable, List
+from sqlalchemy import case, delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+from . import models
+from .database import dialect_insert
+
+UNKNOWN_MUEBLE = ""
+
+def _dialect_insert(conn, table):
+    bind = conn.get_bind() if isinstance(conn, Session) else conn
+    return dialect_insert(bind, table)
+
+def _upsert_rollups(conn, rows):
+    table = models.CampaignRollup.__table__
+    statement = _dialect_insert(conn, table)
+    excluded = statement.excluded
+    peak_is_new = excluded.peak_period_impactos > func.coalesce(table.c.peak_period_impactos, -1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.campaign_name],
+        set_={
+            "site_count": table.c.site_count + excluded.site_count,
+            "impactos_mensuales_total": table.c.impactos_mensuales_total + excluded.impactos_mensuales_total,
+            "period_count": table.c.period_count + excluded.period_count,
+            "peak_period": case((peak_is_new, excluded.peak_period), else_=table.c.peak_period),
+            "peak_period_impactos": case((peak_is_new, excluded.peak_period_impactos), else_=table.c.peak_period_impactos),
+        }
+    )
+    conn.execute(statement, rows)
+
+def _upsert_muebles(conn, rows):
+    table = models.CampaignRollupMueble.__table__
+    statement = _dialect_insert(conn, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.campaign_name, table.c.tipo_de_mueble],
+        set_={"site_count": table.c.site_count + statement.excluded.site_count}
+    )
+    conn.execute(statement, rows)
+
+def apply(
+    conn,
+    campaign_names: Iterable[str] = (),
+    sites: Iterable[dict] = (),
+    periods: Iterable[dict] = ()
+):
+    """
+    Fold newly inserted rows into the rollups. `conn` is the Connection or Session
+    doing the inserts, so the rollups commit together with them. `campaign_names`
+    get a rollup row even when they have no children yet.
+    """
+    deltas: Dict[str, dict] = {}
+    muebles: Dict[tuple, int] = {}
+
+    def delta(name):
+        if name not in deltas:
+            deltas[name] = {
+                "campaign_name": name,
+                "site_count": 0,
+                "impactos_mensuales_total": 0,
+                "period_count": 0,
+                "peak_period": None,
+                "peak_period_impactos": None,
+            }
+        return deltas[name]
+
+    for name in campaign_names:
+        delta(name)
+    for site in sites:
+        row = delta(site["campaign_name"])
+        row["site_count"] += 1
+        row["impactos_mensuales_total"] += site.get("impactos_mensuales") or 0
+        key = (site["campaign_name"], site.get("tipo_de_mueble") or UNKNOWN_MUEBLE)
+        muebles[key] = muebles.get(key, 0) + 1
+    for period in periods:
+        row = delta(period["campaign_name"])
+        row["period_count"] += 1
+        impactos = period.get("impactos_periodo_personas")
+        if impactos is not None and (row["peak_period_impactos"] is None or impactos > row["peak_period_impactos"]):
+            row["peak_period"] = period.get("period")
+            row["peak_period_impactos"] = impactos
+
+    deltas.pop(None, None)
+    if deltas:
+        _upsert_rollups(conn, list(deltas.values()))
+    muebles_rows = [
+        {"campaign_name": name, "tipo_de_mueble": mueble, "site_count": count}
+        for (name, mueble), count in muebles.items() if name is not None
+    ]
+    if muebles_rows:
+        _upsert_muebles(conn, muebles_rows)
+
+def rebuild(conn):
+    """Recompute every rollup from the campaigns, sites and periods tables."""
+    site = models.CampaignSite
+    period = models.CampaignPeriod
+    conn.execute(delete(models.CampaignRollupMueble))
+    conn.execute(delete(models.CampaignRollup))
+
+    sites = select(
+        site.campaign_name,
+        func.count(site.id).label("site_count"),
+        func.coalesce(func.sum(site.impactos_mensuales), 0).label("impactos_mensuales_total")
+    ).group_by(site.campaign_name).subquery()
+    period_counts = select(
+        period.campaign_name,
+        func.count(period.id).label("period_count")
+    ).group_by(period.campaign_name).subquery()
+    ranked = select(
+        period.campaign_name,
+        period.period,
+        period.impactos_periodo_personas,
+        func.row_number().over(
+            partition_by=period.campaign_name,
+            order_by=(period.impactos_periodo_personas.desc(), period.id)
+        ).label("rank")
+    ).where(period.impactos_periodo_personas.isnot(None)).subquery()
+    peaks = select(ranked).where(ranked.c.rank == 1).subquery()
+
+    campaign = models.Campaign
+    conn.execute(insert(models.CampaignRollup).from_select(
+        ["campaign_name", "site_count", "impactos_mensuales_total", "period_count", "peak_period", "peak_period_impactos"],
+        select(
+            campaign.name,
+            func.coalesce(sites.c.site_count, 0),
+            func.coalesce(sites.c.impactos_mensuales_total, 0),
+            func.coalesce(period_counts.c.period_count, 0),
+            peaks.c.period,
+            peaks.c.impactos_periodo_personas
+        )
+        .outerjoin(sites, sites.c.campaign_name == campaign.name)
+        .outerjoin(period_counts, period_counts.c.campaign_name == campaign.name)
+        .outerjoin(peaks, peaks.c.campaign_name == campaign.name)
+    ))
+    mueble = func.coalesce(site.tipo_de_mueble, literal(UNKNOWN_MUEBLE))
+    conn.execute(insert(models.CampaignRollupMueble).from_select(
+        ["campaign_name", "tipo_de_mueble", "site_count"],
+        select(site.campaign_name, mueble, func.count(site.id))
+        .where(site.campaign_name.isnot(None))
+        .group_by(site.campaign_name, mueble)
+    ))
+
+def needs_backfill(conn) -> bool:
+    """True when there are campaigns but no rollups, e.g. right after an upgrade."""
+    has_rollups = conn.execute(select(models.CampaignRollup.campaign_name).limit(1)).first()
+    has_campaigns = conn.execute(select(models.Campaign.name).limit(1)).first()
+    return has_campaigns is not None and has_rollups is None
+
+def rollup_statements(campaign_names: List[str]):
+    """SELECTs of the rollup and per-mueble rows of the given campaigns."""
+    return (
+        select(models.CampaignRollup).where(models.CampaignRollup.campaign_name.in_(campaign_names)),
+        select(models.CampaignRollupMueble).where(
+            models.CampaignRollupMueble.campaign_name.in_(campaign_names)
+        ).order_by(models.CampaignRollupMueble.campaign_name, models.CampaignRollupMueble.tipo_de_mueble)
+    )
+
+def merge_rollups(rollup_rows, mueble_rows) -> Dict[str, dict]:
+    rollups = {
+        row.campaign_name: {
+            "site_count": row.site_count,
+            "impactos_mensuales_total": row.impactos_mensuales_total,
+            "period_count": row.period_count,
+            "peak_period": row.peak_period,
+            "peak_period_impactos": row.peak_period_impactos,
+            "sites_by_mueble": {},
+        }
+        for row in rollup_rows
+    }
+    for row in mueble_rows:
+        if row.campaign_name in rollups:
+            rollups[row.campaign_name]["sites_by_mueble"][row.tipo_de_mueble] = row.site_count
+    return rollups
+
+def get_rollups(db: Session, campaign_names: List[str]) -> Dict[str, dict]:
+    """Rollups of the given campaigns, read with two indexed lookups."""
+    if not campaign_names:
+        return {}
+    rollups_statement, muebles_statement = rollup_statements(campaign_names)
+    return merge_rollups(db.scalars(rollups_statement), db.scalars(muebles_statement))
+
+if __name__ == "__main__":
+    from .database import engine, sync_schema
+
+    parser = argparse.ArgumentParser(description="Maintain the campaign rollup tables.")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    sync_schema(models.Base.metadata, engine)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        rebuild(conn)
+    print(f"Rollups rebuilt in {time.perf_counter() - started:.2f}s")
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from starlette.background import BackgroundTask
+from typing import List, Literal, Optional
 from datetime import datetime, timedelta
-from . import schemas, crud, auth, dependencies
+import anyio
+from . import schemas, crud, auth, database, dependencies, pagination, cache, metrics, rollups, search, sites, projection
 
 router = APIRouter()
 
@@ -12,14 +15,32 @@ def read_root():
     return {"message": "Welcome to Campaign Analytics API"}
 
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(dependencies.get_db)):
+def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(dependencies.get_read_db),
+    write_db: Session = Depends(dependencies.get_db)
+):
     user = crud.get_user_by_username(db, form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    # Give the read connection back before the slow password check
+    db.close()
+    verified, new_hash = False, None
+    if user:
+        try:
+            verified, new_hash = auth.verify_and_update(form_data.password, user.hashed_password)
+        except auth.HashingBusy:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many logins in progress, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash and not database.DATABASE_READ_ONLY:
+        crud.update_password_hash(write_db, user.username, new_hash)
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -28,67 +49,515 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
 
 @router.get("/health")
 def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "caches": {
+            "responses": cache.response_cache.stats(),
+            "auth_tokens": auth.token_cache.stats(),
+            "auth_users": auth.user_cache.stats(),
+        }
+    }
+
+@router.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """Request, SQL, pool, threadpool and cache metrics in the Prometheus text format."""
+    # Async so the threadpool limiter is read from the event loop that owns it
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    engines = {"write": database.engine, "read": database.read_engine}
+    if database.AsyncSessionLocal is not None:
+        engines["async"] = database.AsyncSessionLocal.kw["bind"].sync_engine
+        engines["async_read"] = database.AsyncReadSessionLocal.kw["bind"].sync_engine
+    body = metrics.render(
+        engines,
+        threadpool=(limiter.borrowed_tokens, limiter.total_tokens),
+        caches={
+            "responses": cache.response_cache.stats(),
+            "auth_tokens": auth.token_cache.stats(),
+            "auth_users": auth.user_cache.stats(),
+        },
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+def _with_rollups(db: Session, campaigns):
+    rollups_by_name = rollups.get_rollups(db, [c.name for c in campaigns])
+    return [
+        {**schemas.Campaign.model_validate(c).model_dump(), "rollup": rollups_by_name.get(c.name)}
+        for c in campaigns
+    ]
+
+def _page_data(db: Session, campaigns, fields: Optional[List[str]], format: str, include_rollups: bool) -> dict:
+    if projection.is_projected(fields, format):
+        rollups_by_name = rollups.get_rollups(db, [c.name for c in campaigns]) if include_rollups else None
+        return projection.page_data(campaigns, fields, format, rollups_by_name)
+    return {"data": _with_rollups(db, campaigns) if include_rollups else campaigns}
+
+def _page_model(fields: Optional[List[str]], format: str, include_rollups: bool):
+    """Response model of a campaign page; None (plain orjson) for projected pages."""
+    if projection.is_projected(fields, format):
+        return None
+    return schemas.CampaignPaginationWithRollups if include_rollups else schemas.CampaignPagination
 
 @router.get("/campaigns", response_model=schemas.CampaignPagination)
 def read_campaigns(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     tipo_campania: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(dependencies.get_db)
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    include_rollups: bool = False,
+    fields: Optional[str] = None,
+    format: Literal["json", "columnar"] = "json",
+    db: Session = Depends(dependencies.get_read_db)
 ):
     """
     Get all campaigns with pagination and optional filtering by campaign type.
+
+    Pass the `next_cursor` of a response as `cursor` to fetch the following page
+    by keyset instead of offset; `include_total=false` skips counting the rows.
+    `include_rollups=true` adds each campaign's site and period rollup.
+    `fields=name,tipo_campania,...` returns (and reads) only those fields;
+    `format=columnar` returns `data` as one array per field.
     """
-    campaigns, total = crud.get_campaigns(db, skip=skip, limit=limit, tipo_campania=tipo_campania, start_date=start_date, end_date=end_date)
-    return {
-        "data": campaigns,
-        "total": total,
-        "page": skip // limit,
-        "pageSize": limit
-    }
+    selected = projection.parse_fields(fields)
+
+    def build():
+        try:
+            campaigns, total, next_cursor = crud.get_campaigns(
+                db,
+                skip=skip,
+                limit=limit,
+                tipo_campania=tipo_campania,
+                start_date=start_date,
+                end_date=end_date,
+                cursor=cursor,
+                include_total=include_total,
+                fields=selected
+            )
+        except pagination.InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return {
+            **_page_data(db, campaigns, selected, format, include_rollups),
+            "total": total,
+            "page": skip // limit,
+            "pageSize": limit,
+            "next_cursor": next_cursor
+        }
 
-@router.post("/campaigns", response_model=schemas.Campaign)
+    return cache.cached_response(request, _page_model(selected, format, include_rollups), build)
+
+@router.post("/campaigns", response_model=schemas.Campaign, dependencies=[Depends(dependencies.require_writable)])
 def create_campaign(campaign: schemas.CampaignCreate, db: Session = Depends(dependencies.get_db), current_user: schemas.User = Depends(dependencies.get_current_user)):
     """
     Create a new campaign with all its details (sites, periods, demographics).
     """
-    existing_campaign = crud.get_campaign(db, campaign_id=campaign.name)
-    if existing_campaign:
+    created = crud.create_campaign_with_details(db=db, campaign=campaign)
+    if created is None:
         raise HTTPException(status_code=400, detail="Campaign with this name already exists")
-    
-    return crud.create_campaign_with_details(db=db, campaign=campaign)
+    return created
 
-@router.get("/campaigns/{campaign_id}", response_model=schemas.CampaignDetail)
-def read_campaign(campaign_id: str, db: Session = Depends(dependencies.get_db)):
+@router.post("/campaigns/bulk", dependencies=[Depends(dependencies.require_writable)])
+async def bulk_create_campaigns(
+    request: Request,
+    batch_size: int = Query(500, ge=1, le=10000),
+    db: Session = Depends(dependencies.get_db),
+    current_user: schemas.User = Depends(dependencies.get_current_user)
+):
     """
-    Get detailed information for a specific campaign.
+    Create campaigns from an NDJSON (`application/x-ndjson`, one CampaignCreate per
+    line) or CSV (`text/csv`, campaign columns only) request body.
+
+    The body is validated as it streams in and written every `batch_size` campaigns.
+    Responds with one NDJSON result per record (`created`, `conflict` or `invalid`)
+    and the totals in the X-Bulk-Created/Conflicts/Invalid headers.
     """
-    campaign = crud.get_campaign(db, campaign_id)
-    if campaign is None:
-        raise HTTPException(status_code=404, detail="Campaign not found")
-    return campaign
+    from . import bulk
+
+    fmt = bulk.detect_format(request.headers.get("content-type", ""))
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send application/x-ndjson or text/csv"
+        )
+
+    results, counts = await bulk.import_campaigns(
+        request.stream(),
+        fmt,
+        lambda batch: crud.bulk_create_campaigns(db, batch),
+        batch_size
+    )
+    return StreamingResponse(
+        iter(lambda: results.read(64 * 1024), b""),
+        media_type="application/x-ndjson",
+        headers={
+            "X-Bulk-Created": str(counts["created"]),
+            "X-Bulk-Conflicts": str(counts["conflict"]),
+            "X-Bulk-Invalid": str(counts["invalid"]),
+        },
+        background=BackgroundTask(results.close)
+    )
 
-@router.get("/campaigns/search-by-date", response_model=List[schemas.Campaign])
+@router.get("/campaigns/summary", response_model=schemas.CampaignSummary)
+def read_campaigns_summary(
+    request: Request,
+    group_by: schemas.CampaignGroupBy = "tipo_campania",
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Campaign counts and totals per campaign type, computed in the database.
+    """
+    return cache.cached_response(
+        request,
+        schemas.CampaignSummary,
+        lambda: {"group_by": group_by, "buckets": crud.summarize_campaigns(db, group_by)}
+    )
+
+@router.get("/campaigns/search-by-date", response_model=schemas.CampaignPagination)
 def search_campaigns_by_date(
+    request: Request,
     start_date: datetime,
     end_date: datetime,
-    db: Session = Depends(dependencies.get_db)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    tipo_campania: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    include_rollups: bool = False,
+    fields: Optional[str] = None,
+    format: Literal["json", "ndjson", "columnar"] = "json",
+    db: Session = Depends(dependencies.get_read_db)
 ):
     """
-    Search campaigns by date range.
+    Search campaigns running at any point of a date range.
+
+    Paginates like `/campaigns` (ordered by start date), with the same `fields`
+    and `format=columnar` options. `format=ndjson` streams every matching
+    campaign, one JSON object per line, ignoring pagination.
+    `include_rollups=true` adds each campaign's site and period rollup.
     """
     if start_date > end_date:
         raise HTTPException(
             status_code=400,
             detail="Start date must be before end date"
         )
-    
-    campaigns = crud.search_campaigns_by_date(
-        db,
-        start_date=start_date,
-        end_date=end_date
+    selected = projection.parse_fields(fields)
+
+    if format == "ndjson":
+        query = crud.search_campaigns_by_date(db, start_date, end_date, tipo_campania=tipo_campania)
+
+        def stream_campaigns():
+            if selected:
+                import orjson
+
+                rows = db.execute(query.with_only_columns(*crud.projected_columns(selected, [])).execution_options(yield_per=500))
+                for row in rows:
+                    yield orjson.dumps(row._asdict()) + b"\n"
+                return
+            for campaign in db.scalars(query.execution_options(yield_per=500)):
+                yield schemas.Campaign.model_validate(campaign).model_dump_json() + "\n"
+
+        return StreamingResponse(stream_campaigns(), media_type="application/x-ndjson")
+
+    def build():
+        try:
+            campaigns, total, next_cursor = crud.get_campaigns_by_date(
+                db,
+                start_date=start_date,
+                end_date=end_date,
+                skip=skip,
+                limit=limit,
+                tipo_campania=tipo_campania,
+                cursor=cursor,
+                include_total=include_total,
+                fields=selected
+            )
+        except pagination.InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return {
+            **_page_data(db, campaigns, selected, format, include_rollups),
+            "total": total,
+            "page": skip // limit,
+            "pageSize": limit,
+            "next_cursor": next_cursor
+        }
+
+    return cache.cached_response(request, _page_model(selected, format, include_rollups), build)
+
+@router.get("/campaigns/export")
+def export_campaigns(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    include: List[Literal["sites", "periods"]] = Query([]),
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Stream every campaign (optionally filtered like `/campaigns`) in name order.
+
+    `include=sites` / `include=periods` adds each campaign's sites and periods:
+    nested lists in NDJSON, one row per child in CSV (which joins only one of them).
+    """
+    from . import export
+
+    include = list(dict.fromkeys(include))
+    if format == "csv" and len(include) > 1:
+        raise HTTPException(status_code=400, detail="CSV exports can join either sites or periods, not both")
+    campaigns = export.iter_campaigns(db, include, tipo_campania, start_date, end_date)
+    if format == "csv":
+        chunks, media_type = export.csv_chunks(campaigns, include), "text/csv"
+    else:
+        chunks, media_type = export.ndjson_chunks(campaigns), "application/x-ndjson"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="campaigns.{format}"'}
     )
-    return campaigns
+
+@router.get("/search", response_model=schemas.SearchResults)
+def search_campaigns(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    field: Optional[schemas.SearchField] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Type-ahead search of campaigns by name or by the code, municipio, estado or zm
+    of their sites, ignoring case and accents. The last word matches as a prefix.
+
+    Campaigns come best match first, each once, with the `field` and `value` that
+    matched; `field` restricts the search to one of them.
+    """
+    def build():
+        hits, has_more = search.search(db, q, field, skip, limit)
+        return {"query": q, "data": hits, "page": skip // limit, "pageSize": limit, "has_more": has_more}
+
+    return cache.cached_response(request, schemas.SearchResults, build)
+
+@router.get("/campaigns/{campaign_id}", response_model=schemas.CampaignDetail)
+def read_campaign(
+    request: Request,
+    campaign_id: str,
+    sites_limit: Optional[int] = Query(None, ge=1, le=5000),
+    sites_cursor: Optional[str] = None,
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None,
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Get detailed information for a specific campaign.
+
+    All sites are returned unless `sites_limit` is given; then they come in pages
+    of that size, and `sites_next_cursor` goes back as `sites_cursor` for the next
+    page. `estado`, `municipio` and `tipo_de_mueble`
+    filter the sites.
+    """
+    def build():
+        try:
+            detail = crud.get_campaign_detail(
+                db,
+                campaign_id,
+                sites_limit=sites_limit,
+                sites_cursor=sites_cursor,
+                estado=estado,
+                municipio=municipio,
+                tipo_de_mueble=tipo_de_mueble
+            )
+        except pagination.InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if detail is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        campaign, sites, periods, next_cursor = detail
+        return schemas.CampaignDetail(
+            **schemas.Campaign.model_validate(campaign).model_dump(),
+            sites=[schemas.CampaignSite.model_validate(site) for site in sites],
+            periods=[schemas.CampaignPeriod.model_validate(period) for period in periods],
+            sites_next_cursor=next_cursor
+        )
+
+    return cache.cached_response(request, schemas.CampaignDetail, build)
+
+@router.get("/campaigns/{campaign_id}/sites/summary", response_model=schemas.SiteSummary)
+def read_campaign_sites_summary(
+    request: Request,
+    campaign_id: str,
+    group_by: schemas.SiteGroupBy = "estado",
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Site counts and impact totals of a campaign grouped by location or format.
+    Use `group_by=codigo_del_sitio&limit=10` for the top sites by impactos.
+    """
+    def build():
+        if crud.get_campaign(db, campaign_id) is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        buckets = crud.summarize_sites(db, campaign_id, group_by, limit=limit)
+        return {"group_by": group_by, "buckets": buckets}
+
+    return cache.cached_response(request, schemas.SiteSummary, build)
+
+@router.get("/campaigns/{campaign_id}/sites/demographics", response_model=schemas.SiteDemographics)
+def read_campaign_sites_demographics(
+    request: Request,
+    campaign_id: str,
+    weight: schemas.DemographicsWeight = "impactos_mensuales",
+    estado: Optional[str] = None,
+    municipio: Optional[str] = None,
+    tipo_de_mueble: Optional[str] = None,
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Audience shares (NSE, age, gender) and average exposure of a campaign's
+    sites, optionally only those of one estado, municipio or tipo_de_mueble.
+    Each site counts in proportion to its `weight` (`sites` counts them equally).
+    """
+    def build():
+        if crud.get_campaign(db, campaign_id) is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        summary = crud.site_demographics(
+            db, campaign_id, weight, estado=estado, municipio=municipio, tipo_de_mueble=tipo_de_mueble
+        )
+        return {"campaign_name": campaign_id, "weight": weight, **summary}
+
+    return cache.cached_response(request, schemas.SiteDemographics, build)
+
+@router.get("/campaigns/{campaign_id}/periods/summary", response_model=schemas.PeriodSummary)
+def read_campaign_periods_summary(request: Request, campaign_id: str, db: Session = Depends(dependencies.get_read_db)):
+    """
+    Impactos per period of a campaign, with totals and the peak period.
+    """
+    def build():
+        if crud.get_campaign(db, campaign_id) is None:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        return crud.summarize_periods(db, campaign_id)
+
+    return cache.cached_response(request, schemas.PeriodSummary, build)
+
+@router.get("/campaigns/{campaign_id}/traffic", response_model=schemas.TrafficProfile)
+def read_campaign_traffic(request: Request, campaign_id: str, db: Session = Depends(dependencies.get_read_db)):
+    """
+    Vehicles per hour of day (index 0 is 00:00-01:00) with the daily total and
+    the peak hour. All null when the campaign has no traffic profile.
+    """
+    from . import traffic
+
+    def build():
+        profile = crud.get_traffic_profile(db, campaign_id)
+        if profile is False:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        if profile is None:
+            return {"campaign_name": campaign_id}
+        return {"campaign_name": campaign_id, **traffic.describe(profile)}
+
+    return cache.cached_response(request, schemas.TrafficProfile, build)
+
+@router.get("/analytics/campaigns/top", response_model=schemas.TopCampaigns)
+def read_top_campaigns(
+    request: Request,
+    metric: schemas.CampaignMetric = "impactos_personas",
+    order: Literal["desc", "asc"] = "desc",
+    limit: int = Query(10, ge=1, le=1000),
+    tipo_campania: Optional[str] = None,
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Campaigns with the highest (or, with `order=asc`, lowest) `metric`, ties by name.
+    Campaigns without a value are left out.
+    """
+    def build():
+        campaigns = crud.top_campaigns(db, metric, limit, tipo_campania=tipo_campania, ascending=order == "asc")
+        return {"metric": metric, "order": order, "data": campaigns}
+
+    return cache.cached_response(request, schemas.TopCampaigns, build)
+
+@router.get("/analytics/sites/summary", response_model=schemas.SiteSummary)
+def read_all_sites_summary(
+    request: Request,
+    group_by: schemas.SiteGroupBy = "estado",
+    tipo_campania: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Site counts and impact totals across all campaigns (or those of `tipo_campania`)
+    grouped by location or format, largest impactos first.
+    """
+    def build():
+        buckets = crud.summarize_all_sites(db, group_by, tipo_campania=tipo_campania, limit=limit)
+        return {"group_by": group_by, "buckets": buckets}
+
+    return cache.cached_response(request, schemas.SiteSummary, build)
+
+@router.get("/sites/{codigo_del_sitio}", response_model=schemas.SiteUsage)
+def read_site_usage(request: Request, codigo_del_sitio: str, db: Session = Depends(dependencies.get_read_db)):
+    """
+    A site's format and location with the number of campaigns that used it
+    (`rows` counts each time a campaign listed it).
+    """
+    def build():
+        usage = sites.get_site_usage(db, codigo_del_sitio)
+        if usage is None:
+            raise HTTPException(status_code=404, detail="Site not found")
+        return usage
+
+    return cache.cached_response(request, schemas.SiteUsage, build)
+
+@router.get("/analytics/periods", response_model=schemas.PeriodSeries)
+def read_period_series(
+    request: Request,
+    granularity: schemas.PeriodGranularity = "month",
+    group_by: schemas.PeriodSeriesGroupBy = "tipo_campania",
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Impactos of every campaign's periods per month, quarter or year, one series
+    per campaign type (or a single one with `group_by=all`). Periods are placed
+    by their first day; the date range filters on that day too.
+    """
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date must be before end date")
+
+    def build():
+        series = crud.period_series(
+            db, granularity, group_by, tipo_campania=tipo_campania, start_date=start_date, end_date=end_date
+        )
+        return {"granularity": granularity, "group_by": group_by, "series": series}
+
+    return cache.cached_response(request, schemas.PeriodSeries, build)
+
+@router.get("/analytics/traffic", response_model=schemas.TrafficSummary)
+def read_traffic_summary(
+    request: Request,
+    group_by: schemas.TrafficGroupBy = "tipo_campania",
+    tipo_campania: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    percentile: List[float] = Query([50, 90]),
+    db: Session = Depends(dependencies.get_read_db)
+):
+    """
+    Hourly traffic of the campaigns within a date range: per group, the
+    hour-by-hour sum, mean and each requested `percentile` across campaigns.
+    Campaigns without a traffic profile are left out.
+    """
+    if any(p < 0 or p > 100 for p in percentile):
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="Start date must be before end date")
+
+    def build():
+        buckets = crud.summarize_traffic(
+            db, group_by, percentile, tipo_campania=tipo_campania, start_date=start_date, end_date=end_date
+        )
+        return {"group_by": group_by, "buckets": buckets}
+
+    return cache.cached_response(request, schemas.TrafficSummary, build)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, conint, conlist
 from datetime import date
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 class CampaignPeriodBase(BaseModel):
     period: str
@@ -10,6 +10,7 @@ class CampaignPeriodBase(BaseModel):
 class CampaignPeriod(CampaignPeriodBase):
     id: int
     campaign_name: str
+    period_start: Optional[date] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -25,6 +26,22 @@ class CampaignSiteBase(BaseModel):
     impactos_catorcenal: Optional[int] = None
     impactos_mensuales: Optional[int] = None
     alcance_mensual: Optional[float] = None
+    exposicion_promedio_catorcenal: Optional[float] = None
+    nivel_socioeconomico_ab: Optional[float] = None
+    nivel_socioeconomico_c_mas: Optional[float] = None
+    nivel_socioeconomico_c: Optional[float] = None
+    nivel_socioeconomico_d_mas: Optional[float] = None
+    nivel_socioeconomico_d: Optional[float] = None
+    nivel_socioeconomico_e: Optional[float] = None
+    cero_catorce: Optional[float] = None
+    quince_diecinueve: Optional[float] = None
+    veinte_veinticuatro: Optional[float] = None
+    veinticinco_treintaycuatro: Optional[float] = None
+    treintaycinco_cuarentaycuatro: Optional[float] = None
+    cuarentaycinco_sesentaycuatro: Optional[float] = None
+    sesentaycinco_mas: Optional[float] = None
+    per_muj: Optional[float] = None
+    per_hom: Optional[float] = None
 
 class CampaignSite(CampaignSiteBase):
     id: int
@@ -68,6 +85,8 @@ class CampaignPeriodCreate(CampaignPeriodBase):
 class CampaignCreate(CampaignBase):
     sites: List[CampaignSiteCreate] = []
     periods: List[CampaignPeriodCreate] = []
+    # Stored as int32 (see app.traffic)
+    hourly_vehicle_counts: Optional[conlist(conint(ge=0, le=2**31 - 1), min_length=24, max_length=24)] = None
 
 class Campaign(CampaignBase):
     model_config = ConfigDict(from_attributes=True)
@@ -75,15 +94,152 @@ class Campaign(CampaignBase):
 class CampaignDetail(Campaign):
     periods: List[CampaignPeriod]
     sites: List[CampaignSite]
+    sites_next_cursor: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 
 class CampaignPagination(BaseModel):
     data: List[Campaign]
-    total: int
+    total: Optional[int] = None
     page: int
+    pageSize: int
+    next_cursor: Optional[str] = None
+
+class CampaignRollup(BaseModel):
+    site_count: int = 0
+    impactos_mensuales_total: int = 0
+    period_count: int = 0
+    peak_period: Optional[str] = None
+    peak_period_impactos: Optional[int] = None
+    sites_by_mueble: Dict[str, int] = {}
+
+class CampaignWithRollup(Campaign):
+    rollup: Optional[CampaignRollup] = None
+
+class CampaignPaginationWithRollups(CampaignPagination):
+    data: List[CampaignWithRollup]
+
+SiteGroupBy = Literal["estado", "municipio", "zm", "tipo_de_mueble", "tipo_de_anuncio", "codigo_del_sitio"]
+CampaignGroupBy = Literal["tipo_campania"]
+
+class SiteSummaryBucket(BaseModel):
+    key: Optional[str] = None
+    sites: int
+    impactos_mensuales: int
+    impactos_catorcenal: int
+    alcance_mensual: float
+    frecuencia_mensual_promedio: Optional[float] = None
+
+class SiteSummary(BaseModel):
+    group_by: str
+    buckets: List[SiteSummaryBucket]
+
+class SiteUsage(BaseModel):
+    codigo_del_sitio: str
+    tipo_de_mueble: Optional[str] = None
+    tipo_de_anuncio: Optional[str] = None
+    estado: Optional[str] = None
+    municipio: Optional[str] = None
+    zm: Optional[str] = None
+    campaigns: int
+    rows: int
+
+class PeriodSummaryBucket(BaseModel):
+    period: str
+    impactos_periodo_personas: int
+    impactos_periodo_vehiculos: int
+
+class PeriodSummary(BaseModel):
+    periods: List[PeriodSummaryBucket]
+    total_personas: int
+    total_vehiculos: int
+    promedio_personas: Optional[float] = None
+    peak_period: Optional[str] = None
+
+class CampaignSummaryBucket(BaseModel):
+    key: Optional[str] = None
+    campaigns: int
+    impactos_personas: int
+    impactos_vehiculos: int
+    alcance: int
+    frecuencia_promedio: Optional[float] = None
+
+class CampaignSummary(BaseModel):
+    group_by: str
+    buckets: List[CampaignSummaryBucket]
+
+CampaignMetric = Literal[
+    "impactos_personas", "impactos_vehiculos", "alcance", "universo_zona_metro",
+    "frecuencia_calculada", "frecuencia_promedio"
+]
+
+class TopCampaigns(BaseModel):
+    metric: str
+    order: str
+    data: List[Campaign]
+
+PeriodGranularity = Literal["month", "quarter", "year"]
+PeriodSeriesGroupBy = Literal["tipo_campania", "all"]
+
+class PeriodSeriesPoint(BaseModel):
+    bucket: str
+    impactos_periodo_personas: int
+    impactos_periodo_vehiculos: int
+
+class PeriodSeriesLine(BaseModel):
+    key: Optional[str] = None
+    points: List[PeriodSeriesPoint]
+
+class PeriodSeries(BaseModel):
+    granularity: str
+    group_by: str
+    series: List[PeriodSeriesLine]
+
+DemographicsWeight = Literal["impactos_mensuales", "impactos_catorcenal", "sites"]
+
+class SiteDemographics(BaseModel):
+    campaign_name: str
+    weight: str
+    sites: int
+    total_weight: float
+    demographics: Dict[str, Optional[float]]
+
+class TrafficProfile(BaseModel):
+    campaign_name: str
+    hourly_vehicle_counts: Optional[List[int]] = None
+    total: Optional[int] = None
+    peak_hour: Optional[int] = None
+
+TrafficGroupBy = Literal["tipo_campania", "all"]
+
+class TrafficBucket(BaseModel):
+    key: Optional[str] = None
+    campaigns: int
+    sum: List[int]
+    mean: List[float]
+    percentiles: Dict[str, List[float]]
+    peak_hour: int
+
+class TrafficSummary(BaseModel):
+    group_by: str
+    buckets: List[TrafficBucket]
+
+SearchField = Literal["name", "codigo_del_sitio", "municipio", "estado", "zm"]
+
+class SearchHit(BaseModel):
+    name: str
+    tipo_campania: Optional[str] = None
+    fecha_inicio: Optional[date] = None
+    fecha_fin: Optional[date] = None
+    field: str
+    value: str
+
+class SearchResults(BaseModel):
+    query: str
+    data: List[SearchHit]
     page: int
     pageSize: int
+    has_more: bool
 
 class UserBase(BaseModel):
     username: str
@@ -0,0 +1,273 @@
+"""
+Type-ahead search over campaign names and the codes and locations of their sites.
+
+Every distinct (field, value) is stored once in search_terms and linked to the
+campaigns it appears in through search_postings. On SQLite the terms are indexed
+with FTS5 (see models.SEARCH_FIELDS), shortest value first, so a query reads
+the best matching terms first (a few thousand rows at most) and then their
+campaigns through the postings' primary key, whatever the number of sites.
+PostgreSQL matches terms by prefix of the whole value instead, read from an
+index on lower(value) (see models); apply() needs ON CONFLICT, so no other
+database is supported.
+
+A page lists the campaigns of the best SEARCH_MAX_TERMS terms; when those fall
+short of it while more terms match, it is read again over all the terms
+scanned. Matches past SEARCH_SCAN_TERMS are never returned.
+
+Writers call apply() in the same transaction as their inserts, like
+rollups.apply(); rebuild() recomputes the index from the campaigns and sites:
+
+    python -m app.search rebuild
+"""
+import argparse
+import os
+import re
+import time
+from typing import Iterable, List, Optional
+from sqlalchemy import bindparam, case, column, delete, func, insert, inspect, literal, literal_column, select, table, text, true, union
+from sqlalchemy.orm import Session
+from . import models
+from .database import dialect_insert
+
+FIELDS = models.SEARCH_FIELDS
+SITE_FIELDS = FIELDS[1:]
+# Matching terms ranked per query. They are read shortest first, then in FIELDS
+# order, so only terms tied on both with the last ones read can be left out;
+# keeps one-letter prefixes cheap on large catalogs.
+SEARCH_SCAN_TERMS = int(os.getenv("SEARCH_SCAN_TERMS", "1000"))
+# Best-ranked terms whose campaigns a page is read from first
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", "50"))
+
+search_ranked = table("search_ranked", column("rowid"))
+TERM_ID_MASK = (1 << models.SEARCH_TERM_ID_BITS) - 1
+# The index of before terms were ranked, which rebuild() replaces
+LEGACY_INDEX = "search_index"
+
+def _bind(conn):
+    return conn.get_bind() if isinstance(conn, Session) else conn
+
+def _dialect_insert(conn, table):
+    return dialect_insert(_bind(conn), table)
+
+def tokens(query: str) -> List[str]:
+    """Words of a query as FTS5's unicode61 tokenizer splits them."""
+    return re.findall(r"[^\W_]+", query)
+
+def match_expression(query: str, field: Optional[str] = None) -> Optional[str]:
+    """
+    FTS5 query for the phrase of the query's words in values, the last one a
+    prefix, and only of `field` if given; None without words.
+    """
+    words = tokens(query)
+    if not words:
+        return None
+    expression = 'value : "' + " ".join(words) + '"*'
+    if field:
+        expression += ' AND field : "' + " ".join(tokens(field)) + '"'
+    return expression
+
+
+def _postings(campaign_names: Iterable[str], sites: Iterable[dict]) -> set:
+    postings = {("name", name, name) for name in campaign_names if name is not None}
+    for site in sites:
+        for field in SITE_FIELDS:
+            value = site.get(field)
+            if value is not None and site.get("campaign_name") is not None:
+                postings.add((field, value, site["campaign_name"]))
+    return postings
+
+def apply(conn, campaign_names: Iterable[str] = (), sites: Iterable[dict] = ()):
+    """
+    Index newly inserted campaigns and sites. `conn` is the Connection or Session
+    doing the inserts, so the index commits together with them.
+    """
+    postings = _postings(campaign_names, sites)
+    if not postings:
+        return
+    terms = _dialect_insert(conn, models.SearchTerm.__table__).on_conflict_do_nothing()
+    conn.execute(terms, [{"field": field, "value": value} for field, value in sorted({(f, v) for f, v, _ in postings})])
+
+    term = models.SearchTerm
+    linked = _dialect_insert(conn, models.SearchPosting.__table__).from_select(
+        ["term_id", "campaign_name"],
+        select(term.id, bindparam("campaign_name")).where(term.field == bindparam("field"), term.value == bindparam("value"))
+    ).on_conflict_do_nothing()
+    conn.execute(linked, [{"field": f, "value": v, "campaign_name": name} for f, v, name in postings])
+
+def rebuild(conn):
+    """Recompute the terms, postings and full-text index from campaigns and sites."""
+    conn.execute(delete(models.SearchPosting))
+    conn.execute(delete(models.SearchTerm))
+    if _bind(conn).dialect.name == "sqlite":
+        conn.execute(text("DROP TRIGGER IF EXISTS search_terms_indexed"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {LEGACY_INDEX}"))
+        conn.execute(text("INSERT INTO search_ranked(search_ranked) VALUES ('delete-all')"))
+
+    campaign, site, term = models.Campaign, models.CampaignSite, models.SearchTerm
+    values = [select(literal("name").label("field"), campaign.name.label("value"))]
+    values += [
+        select(literal(field).label("field"), getattr(site, field).label("value")).where(getattr(site, field).isnot(None))
+        for field in SITE_FIELDS
+    ]
+    conn.execute(insert(term).from_select(["field", "value"], union(*values).order_by("field", "value")))
+
+    links = [select(term.id, campaign.name).join(campaign, (term.field == "name") & (term.value == campaign.name))]
+    links += [
+        select(term.id, site.campaign_name).distinct()
+        .join(site, (term.field == field) & (term.value == getattr(site, field)))
+        .where(site.campaign_name.isnot(None))
+        for field in SITE_FIELDS
+    ]
+    # Terms are distinct per field, so the statements never insert the same posting
+    for statement in links:
+        conn.execute(insert(models.SearchPosting).from_select(["term_id", "campaign_name"], statement))
+
+def needs_backfill(conn) -> bool:
+    """
+    True when there are campaigns but no search terms, e.g. right after an
+    upgrade, or the terms are still in the index of before they were ranked.
+    """
+    if inspect(conn.connection() if isinstance(conn, Session) else conn).has_table(LEGACY_INDEX):
+        return True
+    has_terms = conn.execute(select(models.SearchTerm.id).limit(1)).first()
+    has_campaigns = conn.execute(select(models.Campaign.name).limit(1)).first()
+    return has_campaigns is not None and has_terms is None
+
+def _field_order(field_column):
+    return case({name: position for position, name in enumerate(FIELDS)}, value=field_column)
+
+def matched_terms_statement(dialect_name: str, query: str, field: Optional[str] = None, terms: int = SEARCH_MAX_TERMS):
+    """
+    The best `terms` terms matching `query`, numbered by `position`: shortest
+    value first (the closest completion of the query), then FIELDS order and
+    value, each with the number of terms `matched` among the SEARCH_SCAN_TERMS
+    read. Returns None when the query has no words.
+    """
+    term = models.SearchTerm
+    matched = select(term.id.label("term_id"), term.field, term.value)
+    if dialect_name == "sqlite":
+        expression = match_expression(query, field)
+        if expression is None:
+            return None
+        # The rowid orders matches by length and field (see models.SEARCH_FIELDS)
+        ranked = search_ranked.c.rowid
+        matched = matched.select_from(search_ranked).join(term, term.id == ranked.op("&")(TERM_ID_MASK)).where(
+            literal_column("search_ranked").op("MATCH")(expression)
+        ).order_by(ranked)
+    else:
+        # PostgreSQL: a prefix of the lowercased value, read from
+        # ix_search_terms_value_prefix (see models)
+        words = query.strip().lower()
+        if not tokens(words):
+            return None
+        pattern = words.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        matched = matched.where(func.lower(term.value).like(pattern, escape="\\")).order_by(
+            func.length(term.value), _field_order(term.field)
+        )
+        if field:
+            matched = matched.where(term.field == field)
+    # One past `terms`, so callers can tell whether more terms matched
+    matched = matched.limit(max(SEARCH_SCAN_TERMS, terms + 1)).subquery()
+
+    position = func.row_number().over(
+        order_by=(func.length(matched.c.value), _field_order(matched.c.field), matched.c.value)
+    )
+    return select(
+        matched.c.term_id, matched.c.field, matched.c.value, position.label("position"),
+        func.count().over().label("matched")
+    ).order_by(position).limit(terms).cte("best_terms")
+
+def search_statement(
+    dialect_name: str, query: str, field: Optional[str] = None, skip: int = 0, limit: int = 10,
+    terms: int = SEARCH_MAX_TERMS
+):
+    """
+    Campaigns of the best `terms` matching terms, best term first and by name
+    within a term, each listed once (under its best term) with the value that
+    matched. Fetches limit + 1 rows so the caller can tell whether there are
+    more, each with the number of terms `matched` (see matched_terms_statement);
+    with no campaign on the page, a single row of NULLs but `matched`.
+
+    Each term contributes its first skip + limit + 1 campaigns, read in order from
+    the postings' primary key, so popular terms cost no more than rare ones. That
+    is enough for the page: a campaign a term leaves out because of the cap can
+    only be missed when the terms before it already fill the page.
+    """
+    best = matched_terms_statement(dialect_name, query, field, terms)
+    if best is None:
+        return None
+    campaign, posting = models.Campaign, models.SearchPosting
+    first_campaigns = (
+        select(posting.campaign_name)
+        .where(posting.term_id == best.c.term_id)
+        .order_by(posting.campaign_name)
+        .limit(skip + limit + 1)
+        .correlate(best)
+    )
+    occurrence = func.row_number().over(partition_by=campaign.name, order_by=best.c.position)
+    hits = (
+        select(
+            campaign.name, campaign.tipo_campania, campaign.fecha_inicio, campaign.fecha_fin,
+            best.c.field, best.c.value, best.c.position, occurrence.label("occurrence")
+        )
+        .select_from(best)
+        .join(campaign, campaign.name.in_(first_campaigns))
+        .subquery()
+    )
+    page = (
+        select(hits.c.name, hits.c.tipo_campania, hits.c.fecha_inicio, hits.c.fecha_fin, hits.c.field, hits.c.value, hits.c.position)
+        .where(hits.c.occurrence == 1)
+        .order_by(hits.c.position, hits.c.name)
+        .offset(skip)
+        .limit(limit + 1)
+        .subquery()
+    )
+    summary = select(func.coalesce(func.max(best.c.matched), 0).label("matched")).subquery()
+    return (
+        select(page.c.name, page.c.tipo_campania, page.c.fecha_inicio, page.c.fecha_fin, page.c.field, page.c.value, summary.c.matched)
+        .select_from(summary)
+        .outerjoin(page, true())
+        .order_by(page.c.position, page.c.name)
+    )
+
+def page_of(rows, limit: int, terms: int):
+    """
+    (hits, has_more, complete) from the rows of search_statement. The page is
+    not complete when the best `terms` terms left it short while more matched:
+    their campaigns can still belong on it.
+    """
+    hits = [row._asdict() for row in rows]
+    matched = hits[0]["matched"] if hits else 0
+    for hit in hits:
+        del hit["matched"]
+    hits = [hit for hit in hits if hit["name"] is not None]
+    return hits[:limit], len(hits) > limit, len(hits) > limit or matched <= terms
+
+def search(db: Session, query: str, field: Optional[str] = None, skip: int = 0, limit: int = 10):
+    """
+    A page of campaign hits (dicts) and whether more follow. A page the best
+    SEARCH_MAX_TERMS terms leave incomplete is read again over all the terms
+    scanned.
+    """
+    dialect_name = db.get_bind().dialect.name
+    statement = search_statement(dialect_name, query, field, skip, limit)
+    if statement is None:
+        return [], False
+    hits, has_more, complete = page_of(db.execute(statement), limit, SEARCH_MAX_TERMS)
+    if not complete:
+        statement = search_statement(dialect_name, query, field, skip, limit, SEARCH_SCAN_TERMS)
+        hits, has_more, _ = page_of(db.execute(statement), limit, SEARCH_SCAN_TERMS)
+    return hits, has_more
+
+if __name__ == "__main__":
+    from .database import engine, sync_schema
+
+    parser = argparse.ArgumentParser(description="Maintain the campaign search index.")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    sync_schema(models.Base.metadata, engine)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        rebuild(conn)
+    print(f"Search index rebuilt in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,195 @@
+"""
+Campaign sites are split into a `sites` dimension, holding each physical site's
+code, categorical attributes and audience shares once, and `campaign_site_facts`,
+holding only a site's figures in one campaign. The categorical attributes
+(tipo_de_mueble, tipo_de_anuncio, estado, municipio, zm) are dictionary encoded
+as integer codes of `site_categories`, so group-bys compare integers and the
+strings are stored once. models.CampaignSite reads the three back as the rows of
+the former campaign_sites table.
+
+Writers pass site rows in that same shape to insert(). A code whose attributes
+differ from the stored ones (say a campaign reports a site in another estado)
+gets a further sites row, so every campaign reads back exactly what it wrote.
+
+Databases created before the split keep their campaign_sites table until it is
+migrated, by seed.py or with
+
+    python -m app.sites migrate
+
+The migration drops that table, so it never runs implicitly: the API refuses to
+start while the table is there (see main.pending_maintenance).
+"""
+import argparse
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, insert as sql_insert, inspect, literal, select, text, update
+from sqlalchemy.orm import Session
+from . import models
+from .database import dialect_insert
+
+CATEGORY_FIELDS = models.SITE_CATEGORY_FIELDS
+CATEGORY_IDS = tuple(f"{field}_id" for field in CATEGORY_FIELDS)
+# Site attributes stored as they are: the code and the audience shares
+SITE_VALUE_COLUMNS = tuple(
+    c.name for c in models.Site.__table__.columns if c.name != "id" and c.name not in CATEGORY_IDS
+)
+FACT_COLUMNS = tuple(
+    c.name for c in models.CampaignSiteFact.__table__.columns if c.name not in ("id", "site_id")
+)
+SITE_KEY_COLUMNS = SITE_VALUE_COLUMNS + CATEGORY_IDS
+# Codes looked up per statement, well under SQLite's limit of bound parameters
+LOOKUP_CHUNK_SIZE = 10_000
+LEGACY_TABLE = "campaign_sites"
+MIGRATE_CHUNK_SIZE = 50_000
+
+def _bind(conn):
+    return conn.get_bind() if isinstance(conn, Session) else conn
+
+def _category_codes(conn, rows: List[dict]) -> Dict[Tuple[str, str], int]:
+    """Code of every categorical value of `rows`, adding the new ones to the dictionary."""
+    values = sorted({(field, row[field]) for row in rows for field in CATEGORY_FIELDS if row.get(field) is not None})
+    if not values:
+        return {}
+    category = models.SiteCategory.__table__
+    statement = dialect_insert(_bind(conn), category)
+    # Updating the conflicting row to itself makes RETURNING report existing codes too
+    statement = statement.on_conflict_do_update(
+        index_elements=[category.c.field, category.c.value], set_={"value": statement.excluded.value}
+    ).returning(category.c.id, category.c.field, category.c.value)
+    result = conn.execute(statement, [{"field": field, "value": value} for field, value in values])
+    return {(row.field, row.value): row.id for row in result}
+
+def _site_key(site: dict) -> tuple:
+    return tuple(site.get(name) for name in SITE_KEY_COLUMNS)
+
+def _existing_sites(conn, codes: List[Optional[str]]) -> Dict[tuple, int]:
+    site = models.Site
+    columns = [site.id] + [getattr(site, name) for name in SITE_KEY_COLUMNS]
+    found = {}
+    named = [code for code in codes if code is not None]
+    statements = [
+        select(*columns).where(site.codigo_del_sitio.in_(named[start:start + LOOKUP_CHUNK_SIZE]))
+        for start in range(0, len(named), LOOKUP_CHUNK_SIZE)
+    ]
+    if len(named) < len(codes):
+        statements.append(select(*columns).where(site.codigo_del_sitio.is_(None)))
+    for statement in statements:
+        for row in conn.execute(statement):
+            found.setdefault(tuple(row[1:]), row.id)
+    return found
+
+def site_ids(conn, rows: List[dict]) -> List[int]:
+    """The sites row of each of `rows`, inserting the sites (or attribute versions) not stored yet."""
+    codes = _category_codes(conn, rows)
+    keyed = []
+    for row in rows:
+        site = {name: row.get(name) for name in SITE_VALUE_COLUMNS}
+        for field, column in zip(CATEGORY_FIELDS, CATEGORY_IDS):
+            site[column] = codes.get((field, row.get(field)))
+        keyed.append(site)
+
+    ids = _existing_sites(conn, list({site["codigo_del_sitio"] for site in keyed}))
+    new = {}
+    for site in keyed:
+        key = _site_key(site)
+        if key not in ids:
+            new.setdefault(key, site)
+    if new:
+        # Matched back by key: keeping the parameter order would cost a statement per row on SQLite
+        site = models.Site
+        statement = sql_insert(site).returning(site.id, *(getattr(site, name) for name in SITE_KEY_COLUMNS))
+        ids.update((tuple(row[1:]), row.id) for row in conn.execute(statement, list(new.values())))
+    return [ids[_site_key(site)] for site in keyed]
+
+def insert(conn, rows: Iterable[dict]):
+    """
+    Insert campaign sites given as rows of models.CampaignSite's columns (`id`
+    optional, then it must be in every row). `conn` is the Connection or Session
+    doing the campaign's inserts, so the sites commit together with them.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    facts = []
+    for row, site_id in zip(rows, site_ids(conn, rows)):
+        fact = {name: row.get(name) for name in FACT_COLUMNS}
+        fact["site_id"] = site_id
+        if "id" in row:
+            fact["id"] = row["id"]
+        facts.append(fact)
+    conn.execute(sql_insert(models.CampaignSiteFact), facts)
+
+def site_usage_statement(codigo_del_sitio: str):
+    """
+    A site's attributes (of its newest version) with the number of campaigns and
+    of campaign rows that used it: index lookups on ix_sites_codigo and
+    ix_campaign_site_facts_site, whatever the size of the catalog.
+    """
+    site, fact = models.Site, models.CampaignSiteFact
+    versions = select(site.id).where(site.codigo_del_sitio == codigo_del_sitio)
+    categories = {field: models.SiteCategory.__table__.alias(f"{field}_category") for field in CATEGORY_FIELDS}
+    joined = site.__table__
+    for field, category in categories.items():
+        joined = joined.outerjoin(category, category.c.id == getattr(site, f"{field}_id"))
+    counts = select(
+        func.count(func.distinct(fact.campaign_name)).label("campaigns"), func.count().label("rows")
+    ).where(fact.site_id.in_(versions)).subquery()
+    return select(
+        site.codigo_del_sitio, *(category.c.value.label(field) for field, category in categories.items()),
+        counts.c.campaigns, counts.c.rows
+    ).select_from(joined).join(counts, literal(True)).where(
+        site.codigo_del_sitio == codigo_del_sitio
+    ).order_by(site.id.desc()).limit(1)
+
+def get_site_usage(db: Session, codigo_del_sitio: str) -> Optional[dict]:
+    """None when no campaign has used the site."""
+    row = db.execute(site_usage_statement(codigo_del_sitio)).first()
+    return row._asdict() if row is not None else None
+
+def needs_migration(conn) -> bool:
+    """True while the database still has the campaign_sites table of before the split."""
+    return inspect(conn).has_table(LEGACY_TABLE)
+
+def migrate(conn, chunk_size: int = MIGRATE_CHUNK_SIZE) -> int:
+    """
+    Move the rows of the former campaign_sites table into sites and facts,
+    keeping their ids (so site cursors stay valid), then drop it. Returns the
+    number of rows moved.
+    """
+    columns = [c["name"] for c in inspect(conn).get_columns(LEGACY_TABLE)]
+    # Facts written before the migration ran (by a version that did not run it at
+    # startup) are renumbered after the legacy rows, whose ids are kept
+    fact = models.CampaignSiteFact.__table__
+    legacy_last = conn.execute(text(f"SELECT max(id) FROM {LEGACY_TABLE}")).scalar()
+    first, last = conn.execute(select(func.min(fact.c.id), func.max(fact.c.id))).one()
+    if legacy_last is not None and first is not None and first <= legacy_last:
+        conn.execute(update(fact).values(id=fact.c.id + max(last, legacy_last)))
+    moved, last_id = 0, 0
+    while True:
+        chunk = conn.execute(
+            text(f"SELECT {', '.join(columns)} FROM {LEGACY_TABLE} WHERE id > :last_id ORDER BY id LIMIT :size"),
+            {"last_id": last_id, "size": chunk_size}
+        ).mappings().all()
+        if not chunk:
+            break
+        insert(conn, [dict(row) for row in chunk])
+        moved += len(chunk)
+        last_id = chunk[-1]["id"]
+    conn.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+    return moved
+
+if __name__ == "__main__":
+    from .database import engine, sync_schema
+
+    parser = argparse.ArgumentParser(description="Maintain the sites dimension.")
+    parser.add_argument("command", choices=["migrate"])
+    args = parser.parse_args()
+
+    sync_schema(models.Base.metadata, engine)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        moved = migrate(conn) if needs_migration(conn) else None
+    if moved is None:
+        print("Nothing to migrate")
+    else:
+        print(f"{moved} campaign sites migrated in {time.perf_counter() - started:.2f}s")
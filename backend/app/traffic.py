@@ -0,0 +1,68 @@
+"""
+24-hour vehicle traffic profiles. Each campaign stores its hourly counts as one
+packed little-endian int32 blob (96 bytes), so a set of profiles loads into an
+(n, 24) array with a single np.frombuffer.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+
+HOURS = 24
+DTYPE = np.dtype("<i4")
+CSV_COLUMNS = [f"hourly_vehicle_count_{hour:02d}" for hour in range(HOURS)]
+
+def pack(counts: Optional[Sequence[int]]) -> Optional[bytes]:
+    if counts is None:
+        return None
+    return np.asarray(counts, dtype=DTYPE).tobytes()
+
+def unpack(blob: Optional[bytes]) -> Optional[np.ndarray]:
+    if blob is None:
+        return None
+    return np.frombuffer(blob, dtype=DTYPE)
+
+def pack_rows(matrix: np.ndarray) -> List[Optional[bytes]]:
+    """
+    Blob per row of an (n, 24) float array of CSV values; rows missing any hour
+    get None.
+    """
+    complete = ~np.isnan(matrix).any(axis=1)
+    packed = np.zeros(matrix.shape, dtype=DTYPE)
+    packed[complete] = np.rint(matrix[complete])
+    return [row.tobytes() if ok else None for row, ok in zip(packed, complete)]
+
+def matrix(blobs: Iterable[bytes]) -> np.ndarray:
+    """Stack profiles into an (n, 24) int64 array."""
+    joined = b"".join(blobs)
+    return np.frombuffer(joined, dtype=DTYPE).reshape(-1, HOURS).astype(np.int64)
+
+def describe(profile: np.ndarray) -> dict:
+    return {
+        "hourly_vehicle_counts": profile.tolist(),
+        "total": int(profile.sum()),
+        "peak_hour": int(profile.argmax()),
+    }
+
+def aggregate(keys: Sequence[Optional[str]], profiles: np.ndarray, percentiles: Sequence[float]) -> List[Dict]:
+    """
+    Per-key hourly sum, mean and percentiles of a stack of profiles, plus the
+    peak hour of the summed profile. Keys are sorted with None first.
+    """
+    labels = sorted(set(keys), key=lambda key: (key is not None, key or ""))
+    index = {key: code for code, key in enumerate(labels)}
+    codes = np.fromiter((index[key] for key in keys), dtype=np.int64, count=len(keys))
+    buckets = []
+    for code, key in enumerate(labels):
+        group = profiles[codes == code]
+        total = group.sum(axis=0)
+        buckets.append({
+            "key": key,
+            "campaigns": len(group),
+            "sum": total.tolist(),
+            "mean": group.mean(axis=0).tolist(),
+            "percentiles": {
+                f"{p:g}": values.tolist()
+                for p, values in zip(percentiles, np.percentile(group, percentiles, axis=0))
+            },
+            "peak_hour": int(total.argmax()),
+        })
+    return buckets
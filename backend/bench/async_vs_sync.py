@@ -0,0 +1,153 @@
+"""
+Compare the sync and async (DB_ASYNC=1) database paths under concurrent clients.
+
+Builds a synthetic database, starts uvicorn once per mode with the response cache
+disabled so every request reaches the database, and reports req/s, p50 and p99.
+
+    python bench/async_vs_sync.py --campaigns 5000 --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import httpx
+from sqlalchemy import create_engine, insert
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app import models, rollups, search, sites  # noqa: E402
+from app.database import sync_schema  # noqa: E402
+
+def build_database(path, campaigns, sites_per_campaign):
+    engine = create_engine(f"sqlite:///{path}")
+    sync_schema(models.Base.metadata, engine)
+    rng = random.Random(7)
+    with engine.begin() as conn:
+        campaign_rows, site_rows = [], []
+        for i in range(campaigns):
+            inicio = date(2023, 1, 1) + timedelta(days=rng.randrange(900))
+            campaign_rows.append({
+                "name": f"campania_{i:07d}",
+                "tipo_campania": rng.choice(["mensual", "catorcenal"]),
+                "fecha_inicio": inicio,
+                "fecha_fin": inicio + timedelta(days=rng.choice([14, 30, 90])),
+                "impactos_personas": rng.randrange(10**6),
+                "alcance": rng.randrange(10**5),
+            })
+            for j in range(sites_per_campaign):
+                site_rows.append({
+                    "campaign_name": f"campania_{i:07d}",
+                    "codigo_del_sitio": f"SITE-{j:05d}",
+                    "tipo_de_mueble": rng.choice(["Pantalla Digital", "Espectacular", "Muro"]),
+                    "tipo_de_anuncio": "Digital",
+                    "estado": rng.choice(["Ciudad de Mexico", "Jalisco", "Nuevo Leon"]),
+                    "municipio": "Centro",
+                    "zm": "Valle de Mexico",
+                    "impactos_mensuales": rng.randrange(10**6),
+                })
+        conn.execute(insert(models.Campaign), campaign_rows)
+        sites.insert(conn, site_rows)
+        rollups.rebuild(conn)
+        search.rebuild(conn)
+    engine.dispose()
+
+def request_urls(campaigns):
+    rng = random.Random(11)
+    while True:
+        name = f"campania_{rng.randrange(campaigns):07d}"
+        yield rng.choice([
+            f"/campaigns?skip={rng.randrange(campaigns - 10)}&limit=10",
+            f"/campaigns/{name}?sites_limit=50",
+            f"/campaigns/{name}/sites/summary?group_by=estado",
+            "/campaigns/search-by-date?start_date=2024-01-01T00:00:00&end_date=2024-03-01T00:00:00",
+        ])
+
+async def drive(base_url, campaigns, concurrency, duration):
+    latencies = []
+    errors = 0
+    urls = request_urls(campaigns)
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get(next(urls))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "req_per_sec": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+def wait_until_up(base_url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            if httpx.get(base_url + "/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError("uvicorn did not start")
+
+def run_mode(workdir, db_async, port, args):
+    env = {
+        **os.environ,
+        "PYTHONPATH": BACKEND_DIR,
+        "DB_ASYNC": "1" if db_async else "0",
+        "RESPONSE_CACHE_MAX_ENTRIES": "0",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base_url, process)
+        return asyncio.run(drive(base_url, args.campaigns, args.concurrency, args.duration))
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--campaigns", type=int, default=5000)
+    parser.add_argument("--sites-per-campaign", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        build_database(os.path.join(workdir, "campaigns.db"), args.campaigns, args.sites_per_campaign)
+        for label, db_async in (("sync", False), ("async", True)):
+            result = run_mode(workdir, db_async, args.port, args)
+            print(
+                f"{label:>5}: {result['req_per_sec']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+                f"p99 {result['p99_ms']:7.1f} ms  ({result['requests']} requests, {result['errors']} errors)"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+JSON baselines of benchmark results and regression checks against them.
+
+A report maps each benchmark name to its metrics. p50, p95 and "seconds" regress
+when they grow, "per_sec" metrics when they shrink; a change beyond the
+threshold (a fraction, 0.25 = 25%) is flagged. p99 and the mean are reported but
+not compared: a few slow calls move them too much between runs.
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+from datetime import datetime, timezone
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def latency_metrics(seconds):
+    """p50/p95/p99 and mean, in milliseconds, of a list of durations in seconds."""
+    values = sorted(seconds)
+    return {
+        "p50_ms": statistics.median(values) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "mean_ms": statistics.fmean(values) * 1000,
+    }
+
+def default_path(suite, scale):
+    return os.path.join(BASELINE_DIR, f"{suite}-{scale}.json")
+
+def make_report(suite, scale, rows, results):
+    return {
+        "suite": suite,
+        "scale": scale,
+        "rows": rows,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+def save(path, report):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as out:
+        json.dump(report, out, indent=2, sort_keys=True)
+        out.write("\n")
+
+def load(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def direction(metric):
+    """+1 when larger values are worse, -1 when smaller ones are, 0 when not compared."""
+    if metric in ("p50_ms", "p95_ms", "seconds"):
+        return 1
+    if metric.endswith("per_sec"):
+        return -1
+    return 0
+
+def compare(results, baseline_results, threshold):
+    """(benchmark, metric, baseline, current, change) for every metric worse by more than threshold."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline_results.get(name, {}).get(metric)
+            sign = direction(metric)
+            if not sign or not old or value is None:
+                continue
+            change = (value - old) / old
+            if change * sign > threshold:
+                regressions.append((name, metric, old, value, change))
+    return regressions
+
+def add_arguments(parser, suite):
+    parser.add_argument("--baseline", help=f"baseline file (default: bench/baselines/{suite}-<scale>.json)")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative change that counts as a regression (default: 0.25)")
+
+def finish(args, report):
+    """Save or compare `report` as the arguments ask; exits with 1 on regressions."""
+    path = args.baseline or default_path(report["suite"], report["scale"])
+    if args.save:
+        save(path, report)
+        print(f"Baseline saved to {path}")
+        return
+    baseline = load(path)
+    if baseline is None:
+        print(f"No baseline at {path}; run with --save to create it")
+        return
+    if baseline.get("rows") != report["rows"]:
+        print(f"Warning: the baseline was measured on different data ({baseline.get('rows')})")
+    regressions = compare(report["results"], baseline["results"], args.threshold)
+    if not regressions:
+        print(f"No regressions against {path} (threshold {args.threshold:.0%})")
+        return
+    print(f"Regressions against {path} (threshold {args.threshold:.0%}):")
+    for name, metric, old, value, change in regressions:
+        print(f"  {name:<32} {metric:<12} {old:10.2f} -> {value:10.2f} ({change:+.0%})")
+    sys.exit(1)
@@ -0,0 +1,86 @@
+"""
+Cold-start cost of the Lambda handler: import time of app.main and time until
+the first response, measured in a fresh interpreter per run.
+
+"bootstrap" is the previous behaviour (database copied to /tmp, schema sync and
+admin bootstrap at startup); "read-only" opens the packaged database in place
+and skips the bootstrap.
+
+    python bench/cold_start.py --runs 5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_TMP_DB = "/tmp/campaigns.db"
+
+MODES = {
+    "bootstrap": {"DATABASE_READ_ONLY": "0", "BOOTSTRAP_ON_STARTUP": "1"},
+    "read-only": {"DATABASE_READ_ONLY": "1", "BOOTSTRAP_ON_STARTUP": "0"},
+}
+
+# Runs inside the fresh interpreter: time the import, then one API Gateway event
+PROBE = r"""
+import json, time
+started = time.perf_counter()
+from app.main import handler
+imported = time.perf_counter()
+event = {
+    "resource": "/{proxy+}", "path": "/campaigns", "httpMethod": "GET",
+    "headers": {"Host": "localhost"}, "multiValueHeaders": {"Host": ["localhost"]},
+    "queryStringParameters": {"limit": "10"}, "multiValueQueryStringParameters": {"limit": ["10"]},
+    "pathParameters": {"proxy": "campaigns"}, "stageVariables": None,
+    "requestContext": {"resourcePath": "/{proxy+}", "httpMethod": "GET", "path": "/Prod/campaigns",
+                       "stage": "Prod", "requestId": "bench", "identity": {"sourceIp": "127.0.0.1"}},
+    "body": None, "isBase64Encoded": False,
+}
+response = handler(event, None)
+answered = time.perf_counter()
+print(json.dumps({"status": response["statusCode"], "import": imported - started, "first_response": answered - started}))
+"""
+
+def run_once(workdir, label):
+    env = {
+        **os.environ,
+        **MODES[label],
+        "PYTHONPATH": BACKEND_DIR,
+        "AWS_LAMBDA_FUNCTION_NAME": "cold-start-bench",
+        "PASSWORD_HASH_WORKERS": "0",
+    }
+    try:
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE], cwd=workdir, env=env, check=True, capture_output=True, text=True
+        ).stdout
+    finally:
+        if os.path.exists(LAMBDA_TMP_DB):
+            os.remove(LAMBDA_TMP_DB)
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database", default=os.path.join(BACKEND_DIR, "campaigns.db"))
+    args = parser.parse_args()
+
+    if os.path.exists(LAMBDA_TMP_DB):
+        sys.exit(f"{LAMBDA_TMP_DB} exists; move it away so the bootstrap runs copy the database like a cold container")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy2(args.database, os.path.join(workdir, "campaigns.db"))
+        for label in MODES:
+            results = [run_once(workdir, label) for _ in range(args.runs)]
+            statuses = sorted({r["status"] for r in results})
+            print(
+                f"{label:>9}: import {statistics.median(r['import'] for r in results) * 1000:7.1f} ms  "
+                f"first response {statistics.median(r['first_response'] for r in results) * 1000:7.1f} ms  "
+                f"(median of {args.runs}, status {statuses})"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Read latency while a large write is in progress, with SQLite's default rollback
+journal and page cache and with the WAL settings of app.database.
+
+Reader threads query through the read engine while one transaction on the write
+engine inserts many sites. With WAL the readers keep reading the last committed
+data; with the rollback journal they stall once the writer spills its cache and
+takes the exclusive lock.
+
+    python bench/concurrent_reads.py --readers 8 --write-sites 300000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app import crud, database, models, rollups, sites  # noqa: E402
+from async_vs_sync import build_database  # noqa: E402
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def reader(read_engine, campaigns, stop, samples, errors):
+    rng = random.Random(threading.get_ident())
+    while not stop.is_set():
+        name = f"campania_{rng.randrange(campaigns):07d}"
+        started = time.perf_counter()
+        try:
+            with Session(read_engine) as db:
+                crud.get_campaigns(db, skip=rng.randrange(campaigns - 10), limit=10, include_total=False)
+                crud.summarize_sites(db, name, "estado")
+        except Exception as e:
+            errors.append(repr(e))
+            continue
+        samples.append((started, time.perf_counter() - started))
+
+def large_write(write_engine, site_count):
+    rows = [
+        {
+            "campaign_name": f"campania_{i % 100:07d}",
+            "codigo_del_sitio": f"BULK-{i:07d}",
+            "tipo_de_mueble": "Pantalla Digital",
+            "estado": "Jalisco",
+            "impactos_mensuales": i,
+        }
+        for i in range(site_count)
+    ]
+    started = time.perf_counter()
+    with write_engine.begin() as conn:
+        sites.insert(conn, rows)
+        rollups.apply(conn, sites=rows)
+    return started, time.perf_counter()
+
+SETTINGS = {
+    "default": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_CACHE_SIZE_KB": 2000, "SQLITE_MMAP_SIZE": 0},
+    "wal": {},
+}
+DEFAULTS = {name: getattr(database, name) for name in SETTINGS["default"]}
+
+def run(label, args):
+    for name in SETTINGS["default"]:
+        setattr(database, name, DEFAULTS[name])
+    for name, value in SETTINGS[label].items():
+        setattr(database, name, value)
+    with tempfile.TemporaryDirectory() as workdir:
+        url = f"sqlite:///{os.path.join(workdir, 'campaigns.db')}"
+        build_database(os.path.join(workdir, "campaigns.db"), args.campaigns, 20)
+        write_engine = database.create_write_engine(url)
+        read_engine = database.create_read_engine(url)
+
+        stop = threading.Event()
+        samples, errors = [], []
+        threads = [
+            threading.Thread(target=reader, args=(read_engine, args.campaigns, stop, samples, errors))
+            for _ in range(args.readers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+        write_started, write_ended = large_write(write_engine, args.write_sites)
+        time.sleep(1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        write_engine.dispose()
+        read_engine.dispose()
+
+    during = [latency for started, latency in samples if write_started <= started < write_ended]
+    write_seconds = write_ended - write_started
+    print(
+        f"{label:>7}: write {write_seconds:6.2f}s | reads during write {len(during) / write_seconds:8.1f}/s "
+        f"p50 {percentile(during, 0.5) * 1000:7.1f} ms p99 {percentile(during, 0.99) * 1000:7.1f} ms "
+        f"max {max(during, default=float('nan')) * 1000:7.1f} ms | errors {len(errors)}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--campaigns", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--write-sites", type=int, default=300000)
+    args = parser.parse_args()
+    for label in SETTINGS:
+        run(label, args)
+
+if __name__ == "__main__":
+    main()
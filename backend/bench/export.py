@@ -0,0 +1,85 @@
+"""
+Throughput and peak memory of app.export for growing catalogs. Each export runs
+in a fresh process so its peak RSS is its own; with streaming cursors it should
+stay roughly flat as the number of rows grows.
+
+    python bench/export.py --campaigns 5000 20000 --sites-per-campaign 20
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from async_vs_sync import build_database  # noqa: E402
+
+FORMATS = ["ndjson", "csv", "parquet"]
+
+def peak_rss_mb():
+    # ru_maxrss survives exec, so a child started by a big parent would report
+    # the parent's peak; VmHWM belongs to this process image only.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_export(db_path, output, fmt):
+    """Export in this process and print the stats with the peak RSS in MB."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from app import export
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    with Session(engine) as db:
+        stats = export.export(db, output, fmt, ["sites"])
+    stats["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(stats))
+
+def measure(db_path, workdir, fmt):
+    output = os.path.join(workdir, f"export.{fmt}")
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run", db_path, output, fmt],
+        capture_output=True, text=True, cwd=BACKEND_DIR
+    )
+    if completed.returncode != 0:
+        return None, completed.stderr.strip().splitlines()[-1]
+    stats = json.loads(completed.stdout.splitlines()[-1])
+    stats["mb"] = os.path.getsize(output) / 1e6
+    return stats, None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--campaigns", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--sites-per-campaign", type=int, default=20)
+    parser.add_argument("--run", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_export(*args.run)
+        return
+
+    for campaigns in args.campaigns:
+        with tempfile.TemporaryDirectory() as workdir:
+            db_path = os.path.join(workdir, "campaigns.db")
+            build_database(db_path, campaigns, args.sites_per_campaign)
+            for fmt in FORMATS:
+                stats, error = measure(db_path, workdir, fmt)
+                if error:
+                    print(f"{campaigns:>7} campaigns {fmt:>7}: skipped ({error})")
+                    continue
+                print(
+                    f"{campaigns:>7} campaigns {fmt:>7}: {stats['rows']:>9,} rows in {stats['seconds']:6.2f}s "
+                    f"({stats['rows_per_sec']:>9,.0f} rows/sec) | {stats['mb']:7.1f} MB written "
+                    f"| peak RSS {stats['peak_rss_mb']:6.1f} MB"
+                )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Deterministic synthetic copies of the three CSV exports in data/, at any scale.
+
+Every generated campaign clones a sample campaign (chosen with a seeded RNG)
+under a new name, shifted by whole years and with its impacts, reach and hourly
+counts scaled, together with the template's periods and site rows. Values keep
+the quirks of the real exports (e.g. numbers written as dates), so the output
+goes through seed.py like the originals:
+
+    python bench/generate.py /tmp/data-100k --scale 100k
+    python seed.py --data-dir /tmp/data-100k
+
+--scale sets the number of campaigns; sites and periods follow the sample's
+per-campaign distribution (about 21 site rows and 3 periods per campaign)
+unless --sites gives the total number of site rows.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from seed import CAMPAIGNS_CSV, PERIODS_CSV, SITES_CSV  # noqa: E402
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+# Fixed so the output only depends on the seed, not on how it was chunked
+CHUNK_CAMPAIGNS = 20_000
+DATE_COLUMNS = ["fecha_inicio", "fecha_fin", "fecha_uso_inicio", "fecha_uso_fin"]
+# "YYYY-MM" and "YYYY-NN" (catorcena) labels
+LABEL_COLUMNS = ["periods", "period", "mes", "id_fourteen"]
+SCALED_PREFIXES = ("impactos", "alcance", "hourly_vehicle_count")
+
+def campaign_name(i):
+    return f"campania_{i:07d}"
+
+YEAR = r"\b(\d{4})(?=-)"
+
+def shift_years(values, years):
+    """
+    Add `years` to every year of date and label strings (labels may be lists like
+    "2025-03,2025-04"); Feb 29 becomes Feb 28.
+    """
+    values = values.astype("string")
+    shifted = values.copy()
+    for offset in np.unique(years):
+        rows = years == offset
+        shifted[rows] = values[rows].str.replace(YEAR, lambda m: str(int(m.group(1)) + offset), regex=True)
+    return shifted.str.replace("-02-29", "-02-28", regex=False)
+
+def scale_numbers(df, factors):
+    for column in df.columns:
+        if column.startswith(SCALED_PREFIXES) and pd.api.types.is_numeric_dtype(df[column]):
+            scaled = df[column] * factors
+            df[column] = scaled.round().astype("Int64") if pd.api.types.is_integer_dtype(df[column]) else scaled
+    return df
+
+def shift_dates(df, years):
+    for column in DATE_COLUMNS + LABEL_COLUMNS:
+        if column in df.columns and not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = shift_years(df[column], years)
+    return df
+
+class Sample:
+    """The source CSVs with each campaign's child rows located by position."""
+
+    def __init__(self, data_dir):
+        self.campaigns = pd.read_csv(os.path.join(data_dir, CAMPAIGNS_CSV)).drop_duplicates("name").reset_index(drop=True)
+        self.periods = self._children(pd.read_csv(os.path.join(data_dir, PERIODS_CSV)))
+        self.sites = self._children(pd.read_csv(os.path.join(data_dir, SITES_CSV)))
+        names = self.campaigns["name"]
+        self.period_start, self.period_count = self._offsets(self.periods, names)
+        self.site_start, self.site_count = self._offsets(self.sites, names)
+
+    def _children(self, df):
+        order = pd.Categorical(df["name"], categories=list(dict.fromkeys(df["name"])))
+        return df.iloc[np.argsort(order.codes, kind="stable")].reset_index(drop=True)
+
+    def _offsets(self, children, names):
+        counts = children.groupby("name", sort=False).size()
+        counts = counts.reindex(names, fill_value=0).to_numpy()
+        starts = children.reset_index().groupby("name", sort=False)["index"].min()
+        starts = starts.reindex(names, fill_value=0).to_numpy()
+        return starts, counts
+
+def _child_rows(sample_rows, starts, counts, per_campaign, templates, first_id):
+    """
+    Child rows of a chunk of campaigns: campaign k gets per_campaign[k] rows that
+    cycle over its template's rows. Cycled copies of a site get a "-N" suffix.
+    """
+    owner = np.repeat(np.arange(len(templates)), per_campaign)
+    if not len(owner):
+        return sample_rows.iloc[:0].copy(), owner
+    position = np.arange(len(owner)) - np.repeat(np.cumsum(per_campaign) - per_campaign, per_campaign)
+    template_count = counts[templates][owner]
+    rows = sample_rows.iloc[starts[templates][owner] + position % template_count].reset_index(drop=True)
+    rows["name"] = [campaign_name(first_id + k) for k in owner]
+    if "codigo_del_sitio" in rows.columns:
+        cycle = position // template_count
+        suffix = np.where(cycle > 0, "-" + cycle.astype(str), "")
+        rows["codigo_del_sitio"] = rows["codigo_del_sitio"].astype(str) + suffix
+    return rows, owner
+
+def generate(out_dir, campaigns, sites=None, seed=7, source=os.path.join(BACKEND_DIR, "data")):
+    """
+    Write the three CSVs for `campaigns` campaigns to out_dir. `sites` is the total
+    number of site rows (default: the sample's ratio). Returns the row counts.
+    """
+    sample = Sample(source)
+    # Templates with sites, so a requested site total can always be met
+    with_sites = np.flatnonzero(sample.site_count > 0)
+    site_factor = 1.0
+    if sites is not None:
+        site_factor = sites / (campaigns * sample.site_count[with_sites].mean())
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {"campaigns": 0, "campaign_periods": 0, "campaign_sites": 0}
+    paths = {name: os.path.join(out_dir, name) for name in (CAMPAIGNS_CSV, PERIODS_CSV, SITES_CSV)}
+
+    for first_id in range(0, campaigns, CHUNK_CAMPAIGNS):
+        size = min(CHUNK_CAMPAIGNS, campaigns - first_id)
+        templates = with_sites[rng.integers(len(with_sites), size=size)]
+        years = rng.integers(-2, 1, size=size)
+        factors = rng.uniform(0.5, 1.5, size=size)
+
+        # Rounded up or down at random so the total is close to `sites` at any factor
+        expected = sample.site_count[templates] * site_factor
+        site_rows_per = (np.floor(expected) + (rng.random(size) < expected % 1)).astype(int)
+        site_rows, site_owner = _child_rows(
+            sample.sites, sample.site_start, sample.site_count, site_rows_per, templates, first_id
+        )
+        period_rows, period_owner = _child_rows(
+            sample.periods, sample.period_start, sample.period_count, sample.period_count[templates], templates, first_id
+        )
+
+        chunk = sample.campaigns.iloc[templates].reset_index(drop=True)
+        chunk["name"] = [campaign_name(first_id + k) for k in range(size)]
+        # Distinct sites grow with the rows when a template's sites are cycled
+        chunk["sites"] = np.ceil(chunk["sites"] * site_rows_per / sample.site_count[templates]).astype(int)
+        chunk = shift_dates(scale_numbers(chunk, factors), years)
+        period_rows = shift_dates(scale_numbers(period_rows, factors[period_owner]), years[period_owner])
+        site_rows = shift_dates(scale_numbers(site_rows, factors[site_owner]), years[site_owner])
+
+        for name, frame in ((CAMPAIGNS_CSV, chunk), (PERIODS_CSV, period_rows), (SITES_CSV, site_rows)):
+            frame.to_csv(paths[name], mode="w" if first_id == 0 else "a", header=first_id == 0, index=False)
+        counts["campaigns"] += size
+        counts["campaign_periods"] += len(period_rows)
+        counts["campaign_sites"] += len(site_rows)
+    return counts
+
+def campaign_payload(name, sites=20, periods=3):
+    """A POST /campaigns body with the given number of sites and monthly periods."""
+    return {
+        "name": name, "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-03-31",
+        "impactos_personas": 1_000_000, "alcance": 100_000,
+        "hourly_vehicle_counts": [1000 + 100 * hour for hour in range(24)],
+        "sites": [
+            {
+                "codigo_del_sitio": f"BENCH-{i:05d}", "tipo_de_mueble": "Pantalla Digital", "tipo_de_anuncio": "Digital",
+                "estado": "Jalisco", "municipio": "Zapopan", "zm": "Guadalajara", "impactos_mensuales": 50_000 + i,
+            }
+            for i in range(sites)
+        ],
+        "periods": [
+            {"period": f"2025-{month:02d}", "impactos_periodo_personas": 300_000, "impactos_periodo_vehiculos": 200_000}
+            for month in range(1, periods + 1)
+        ],
+    }
+
+def campaigns_for(scale):
+    return SCALES[scale] if scale in SCALES else int(scale)
+
+def add_scale_arguments(parser):
+    parser.add_argument("--scale", default="10k", help=f"number of campaigns: {', '.join(SCALES)} or any integer")
+    parser.add_argument("--sites", type=int, help="total site rows (default: the sample's ratio)")
+    parser.add_argument("--seed", type=int, default=7)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("out_dir")
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    counts = generate(args.out_dir, campaigns_for(args.scale), args.sites, args.seed)
+    print(", ".join(f"{count:,} {table}" for table, count in counts.items()) + f" written to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Concurrent HTTP load on a local uvicorn serving generated data (see generate.py),
+one endpoint at a time, reporting req/s, p50, p95 and p99 of each and comparing
+them with a saved JSON baseline.
+
+The response cache is disabled unless --cache is given, so reads reach the
+database. POST /campaigns runs last and creates a campaign per request.
+
+    python bench/load.py --scale 100k --concurrency 32 --duration 10 --save
+    python bench/load.py --scale 100k --concurrency 32 --duration 10
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import baseline  # noqa: E402
+from async_vs_sync import wait_until_up  # noqa: E402
+from generate import add_scale_arguments, campaign_name, campaign_payload, campaigns_for, generate  # noqa: E402
+
+# Keystrokes of a few searches, from one letter on
+SEARCH_PREFIXES = [word[:length] for word in ("prueba", "cuauhtemoc", "guadalajara", "campania_00") for length in range(1, 6)]
+
+def search_window(rng):
+    start = rng.randrange(2022, 2026), rng.randrange(1, 11)
+    return (
+        f"/campaigns/search-by-date?start_date={start[0]}-{start[1]:02d}-01T00:00:00"
+        f"&end_date={start[0]}-{start[1] + 2:02d}-01T00:00:00"
+    )
+
+def endpoints(campaigns):
+    """Endpoint label -> function of (rng, n) returning the (method, url, json body) of a request."""
+    def name(rng):
+        return campaign_name(rng.randrange(campaigns))
+
+    return {
+        "GET /campaigns": lambda rng, n: ("GET", f"/campaigns?skip={rng.randrange(max(1, campaigns - 10))}&limit=10", None),
+        "GET /campaigns/{id}": lambda rng, n: ("GET", f"/campaigns/{name(rng)}?sites_limit=50", None),
+        "GET /campaigns/{id}/sites/summary": lambda rng, n: ("GET", f"/campaigns/{name(rng)}/sites/summary?group_by=estado", None),
+        "GET /campaigns/search-by-date": lambda rng, n: ("GET", search_window(rng), None),
+        "GET /campaigns/summary": lambda rng, n: ("GET", "/campaigns/summary?group_by=tipo_campania", None),
+        "GET /search": lambda rng, n: ("GET", f"/search?q={rng.choice(SEARCH_PREFIXES)}", None),
+        "POST /campaigns": lambda rng, n: ("POST", "/campaigns", campaign_payload(f"bench_load_{n:07d}")),
+    }
+
+async def drive_endpoint(base_url, make_request, concurrency, duration, headers):
+    latencies = []
+    errors = 0
+    rng = random.Random(11)
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            method, url, body = make_request(rng, next(counter))
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120, headers=headers) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "req_per_sec": len(latencies) / elapsed,
+        **baseline.latency_metrics(latencies),
+    }
+
+def seed_database(data_dir, env):
+    completed = subprocess.run(
+        [sys.executable, "seed.py", "--data-dir", data_dir], cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        sys.exit(completed.stderr)
+    rows = {}
+    for line in completed.stdout.splitlines():
+        table, _, count = line.partition(": ")
+        if count.endswith(" rows"):
+            rows[table] = int(count.split()[0])
+    return rows
+
+def run_load(env, campaigns, args):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    try:
+        wait_until_up(base_url, process)
+        token = httpx.post(base_url + "/token", data={"username": "admin", "password": "admin123"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for label, make_request in endpoints(campaigns).items():
+            if args.endpoint and not any(part in label for part in args.endpoint):
+                continue
+            results[label] = asyncio.run(drive_endpoint(base_url, make_request, args.concurrency, args.duration, headers))
+            result = results[label]
+            print(
+                f"{label:<36} {result['req_per_sec']:8.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+                f"p95 {result['p95_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  "
+                f"({result['requests']} requests, {result['errors']} errors)"
+            )
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_scale_arguments(parser)
+    parser.add_argument("--data-dir", help="reuse CSVs written by generate.py instead of generating them")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per endpoint")
+    parser.add_argument("--endpoint", nargs="*", help="only endpoints whose label contains one of these")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache enabled")
+    parser.add_argument("--port", type=int, default=8765)
+    baseline.add_arguments(parser, "load")
+    args = parser.parse_args()
+
+    campaigns = campaigns_for(args.scale)
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(workdir, "data")
+            generate(data_dir, campaigns, args.sites, args.seed)
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'campaigns.db')}"}
+        if not args.cache:
+            env["RESPONSE_CACHE_MAX_ENTRIES"] = "0"
+        rows = seed_database(data_dir, env)
+        results = run_load(env, campaigns, args)
+
+    scale = args.scale + ("-cache" if args.cache else "")
+    baseline.finish(args, baseline.make_report("load", scale, rows, results))
+
+if __name__ == "__main__":
+    main()
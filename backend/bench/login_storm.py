@@ -0,0 +1,99 @@
+"""
+/campaigns latency while clients hammer POST /token.
+
+Measures /campaigns p50/p99 alone and during a login storm, with bcrypt run
+inline in the request threads (the old behaviour) and in the hashing process
+pool with admission control.
+
+    python bench/login_storm.py --readers 16 --logins 64 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from async_vs_sync import build_database, wait_until_up  # noqa: E402
+
+MODES = {
+    "inline": {"PASSWORD_HASH_WORKERS": "0", "PASSWORD_HASH_MAX_PENDING": "100000"},
+    "pool": {},
+}
+
+async def read_campaigns(client, campaigns, deadline, latencies):
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await client.get(f"/campaigns?skip={rng.randrange(campaigns - 10)}&limit=10")
+        latencies.append(time.perf_counter() - started)
+
+async def log_in(client, deadline, statuses):
+    while time.perf_counter() < deadline:
+        response = await client.post("/token", data={"username": "admin", "password": "admin123"})
+        statuses[response.status_code] += 1
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+
+async def phase(base_url, args, logins):
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + args.duration
+    limits = httpx.Limits(max_connections=args.readers + logins)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        await asyncio.gather(
+            *(read_campaigns(client, args.campaigns, deadline, latencies) for _ in range(args.readers)),
+            *(log_in(client, deadline, statuses) for _ in range(logins)),
+        )
+    latencies.sort()
+    return latencies, statuses
+
+def describe(latencies):
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    return f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p99 {p99 * 1000:7.1f} ms"
+
+def run_mode(workdir, label, args):
+    env = {
+        **os.environ,
+        **MODES[label],
+        "PYTHONPATH": BACKEND_DIR,
+        "RESPONSE_CACHE_MAX_ENTRIES": "0",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_up(base_url, process)
+        baseline, _ = asyncio.run(phase(base_url, args, 0))
+        storm, statuses = asyncio.run(phase(base_url, args, args.logins))
+    finally:
+        process.terminate()
+        process.wait()
+    print(f"{label:>6}: alone {describe(baseline)} | during storm {describe(storm)} | logins {dict(statuses)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--campaigns", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        build_database(os.path.join(workdir, "campaigns.db"), args.campaigns, 5)
+        for label in MODES:
+            run_mode(workdir, label, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Micro-benchmarks of seed.load_data, the crud read paths and POST /campaigns on
+generated data (see generate.py), compared with a saved JSON baseline.
+
+The seeder loads the generated CSVs into a fresh SQLite file in a child process,
+which then times each case `--repeat` times. Read cases start from empty memo and
+response caches, so they measure the queries rather than the caches.
+
+    python bench/micro.py --scale 100k --save    # record the baseline
+    python bench/micro.py --scale 100k           # flag regressions against it
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import baseline  # noqa: E402
+from generate import add_scale_arguments, campaign_name, campaign_payload, campaigns_for, generate  # noqa: E402
+
+WARMUP_CALLS = 3
+
+def time_calls(call, repeat, reset):
+    for i in range(WARMUP_CALLS):
+        reset()
+        call(i)
+    durations = []
+    for i in range(repeat):
+        reset()
+        started = time.perf_counter()
+        call(i)
+        durations.append(time.perf_counter() - started)
+    return {**baseline.latency_metrics(durations), "calls": repeat}
+
+def run_benchmarks(data_dir, campaigns, repeat):
+    """Seed DATABASE_URL from data_dir, time every case and print the results as JSON."""
+    from fastapi.testclient import TestClient
+    import seed
+    from app import auth, crud, models
+    from app.database import ReadSessionLocal, SessionLocal
+    from app.main import app
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = seed.load_data(data_dir=data_dir)
+    seconds = time.perf_counter() - started
+    results = {"seed.load_data": {"seconds": seconds, "rows_per_sec": sum(stats.rows.values()) / seconds}}
+
+    rng = random.Random(3)
+    names = [campaign_name(rng.randrange(campaigns)) for _ in range(repeat + WARMUP_CALLS)]
+    db = ReadSessionLocal()
+
+    def reset():
+        db.expunge_all()
+        crud.invalidate_read_caches()
+
+    middle_cursor = crud.get_campaigns(db, skip=campaigns // 2, limit=10, include_total=False)[2]
+    cases = {
+        "get_campaigns first page": lambda i: crud.get_campaigns(db, limit=10),
+        "get_campaigns deep offset": lambda i: crud.get_campaigns(db, skip=max(0, campaigns - 20), limit=10),
+        "get_campaigns cursor": lambda i: crud.get_campaigns(db, limit=10, cursor=middle_cursor, include_total=False),
+        "get_campaign": lambda i: crud.get_campaign(db, names[i]),
+        "get_campaign_detail": lambda i: crud.get_campaign_detail(db, names[i], sites_limit=50),
+        "search_campaigns_by_date": lambda i: crud.get_campaigns_by_date(
+            db, datetime(2024, 1, 1), datetime(2024, 3, 1), limit=10
+        ),
+    }
+    try:
+        for label, call in cases.items():
+            results[label] = time_calls(call, repeat, reset)
+
+        # One campaign running for years, the case that used to stretch the
+        # overlap search over every campaign started since
+        with SessionLocal() as writer:
+            writer.add(models.Campaign(
+                name="bench_long_running", tipo_campania="mensual",
+                fecha_inicio=datetime(2015, 1, 1).date(), fecha_fin=datetime(2030, 1, 1).date()
+            ))
+            writer.commit()
+        results["search_campaigns_by_date long"] = time_calls(cases["search_campaigns_by_date"], repeat, reset)
+    finally:
+        db.close()
+
+    headers = {"Authorization": f"Bearer {auth.create_access_token(data={'sub': 'admin'})}"}
+    with TestClient(app) as client:
+        def post(i):
+            response = client.post("/campaigns", json=campaign_payload(f"bench_post_{i:06d}"), headers=headers)
+            response.raise_for_status()
+
+        counter = iter(range(repeat + WARMUP_CALLS))
+        results["POST /campaigns"] = time_calls(lambda i: post(next(counter)), repeat, lambda: None)
+
+    print(json.dumps({"rows": stats.rows, "results": results}))
+
+def measure(workdir, data_dir, campaigns, repeat):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'campaigns.db')}"}
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run", data_dir, str(campaigns), str(repeat)],
+        capture_output=True, text=True, cwd=BACKEND_DIR, env=env
+    )
+    if completed.returncode != 0:
+        sys.exit(completed.stderr)
+    return json.loads(completed.stdout.splitlines()[-1])
+
+def print_results(results):
+    seeding = results["seed.load_data"]
+    print(f"{'seed.load_data':<30} {seeding['seconds']:8.2f} s      {seeding['rows_per_sec']:>10,.0f} rows/sec")
+    for label, metrics in results.items():
+        if label == "seed.load_data":
+            continue
+        print(
+            f"{label:<30} p50 {metrics['p50_ms']:8.2f} ms  p95 {metrics['p95_ms']:8.2f} ms  "
+            f"p99 {metrics['p99_ms']:8.2f} ms  mean {metrics['mean_ms']:8.2f} ms"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_scale_arguments(parser)
+    parser.add_argument("--data-dir", help="reuse CSVs written by generate.py instead of generating them")
+    parser.add_argument("--repeat", type=int, default=200, help="timed calls per case")
+    baseline.add_arguments(parser, "micro")
+    parser.add_argument("--run", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        data_dir, campaigns, repeat = args.run
+        run_benchmarks(data_dir, int(campaigns), int(repeat))
+        return
+
+    campaigns = campaigns_for(args.scale)
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(workdir, "data")
+            generate(data_dir, campaigns, args.sites, args.seed)
+        measured = measure(workdir, data_dir, campaigns, args.repeat)
+
+    print_results(measured["results"])
+    baseline.finish(args, baseline.make_report("micro", args.scale, measured["rows"], measured["results"]))
+
+if __name__ == "__main__":
+    main()
@@ -1,122 +1,180 @@
+import argparse
+import os
+import time
 import pandas as pd
-import numpy as np
-from datetime import datetime
-from app.database import SessionLocal, engine
+from sqlalchemy import Date, Float, Integer, insert, select
+from app.database import SessionLocal, checkpoint, engine, sync_schema
 from app.models import Base, Campaign, CampaignPeriod, CampaignSite
-from app import crud, schemas
+from app import crud, period_buckets, rollups, schemas, search, sites, traffic
 
-def clean_number(x):
-    if isinstance(x, str) and '-' in x:
-        # Handle cases where numbers are formatted as dates
-        return int(x.split('-')[0])
-    return x
+DEFAULT_CHUNK_SIZE = 50_000
 
-def load_data():
+CAMPAIGNS_CSV = 'bd_campanias_agrupado.csv'
+PERIODS_CSV = 'bd_campanias_periodos.csv'
+SITES_CSV = 'bd_campanias_sitios.csv'
+
+# CSV headers that differ from the model column names
+RENAMES = {
+    'impactos_periodo_vehículos': 'impactos_periodo_vehiculos',
+    'name': 'campaign_name',
+}
+
+def clean_number(series):
+    """
+    Numbers exported as dates (e.g. "14566-06-26") keep only the leading integer.
+    Works on a whole column at once; numeric columns are returned as numbers.
+    """
+    if not pd.api.types.is_numeric_dtype(series):
+        series = series.astype(str).str.split('-', n=1).str[0]
+    return pd.to_numeric(series, errors='coerce')
+
+def prepare_chunk(df, table):
+    """
+    Keep the columns of `table` present in the CSV chunk and cast them with
+    vectorized operations. Returns a frame ready for to_records().
+    """
+    columns = [c for c in table.columns if c.name in df.columns]
+    prepared = {}
+    for column in columns:
+        values = df[column.name]
+        if isinstance(column.type, Integer):
+            prepared[column.name] = clean_number(values).round().astype('Int64')
+        elif isinstance(column.type, Float):
+            prepared[column.name] = pd.to_numeric(values, errors='coerce')
+        elif isinstance(column.type, Date):
+            prepared[column.name] = pd.to_datetime(values, format='%Y-%m-%d', errors='coerce').dt.date
+        else:
+            prepared[column.name] = values
+    return pd.DataFrame(prepared, index=df.index)
+
+def to_records(df):
+    """Plain Python rows with NaN/NaT as None, as the DB-API driver expects."""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def with_traffic_profile(df):
+    """Pack the 24 hourly_vehicle_count_HH columns into the hourly_vehicle_counts blob."""
+    if not set(traffic.CSV_COLUMNS) <= set(df.columns):
+        return df
+    hours = df[traffic.CSV_COLUMNS].apply(clean_number).to_numpy(dtype=float)
+    return df.assign(hourly_vehicle_counts=traffic.pack_rows(hours))
+
+def period_starts(df):
+    """First day of each period label, read as monthly unless the row says catorcenal."""
+    types = df['tipo_campania'] if 'tipo_campania' in df.columns else [None] * len(df)
+    return [period_buckets.period_start(period, tipo) for period, tipo in zip(df['period'], types)]
+
+def existing_campaign_names(conn, names):
+    """Names from `names` that are already stored, resolved with a single IN query."""
+    if not names:
+        return set()
+    return set(conn.execute(select(Campaign.name).where(Campaign.name.in_(names))).scalars())
+
+def load_campaigns(bind, path, chunk_size, stats):
+    """
+    Insert the campaigns of the agrupado CSV that are not stored yet. Returns the
+    names that already existed, whose periods and sites must not be loaded again.
+    """
+    preexisting = set()
+    seen = set()
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        chunk = chunk.drop_duplicates(subset=['name'])
+        chunk = chunk[~chunk['name'].isin(seen)]
+        seen.update(chunk['name'])
+
+        chunk = with_traffic_profile(chunk)
+
+        with bind.begin() as conn:
+            existing = existing_campaign_names(conn, chunk['name'].tolist())
+            preexisting |= existing
+            new_rows = prepare_chunk(chunk[~chunk['name'].isin(existing)], Campaign.__table__)
+            if len(new_rows):
+                conn.execute(insert(Campaign), to_records(new_rows))
+                rollups.apply(conn, campaign_names=new_rows['name'].tolist())
+                search.apply(conn, campaign_names=new_rows['name'].tolist())
+        stats.add('campaigns', len(new_rows))
+    return preexisting
+
+def load_children(bind, path, model, skip_campaigns, chunk_size, stats):
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        chunk = chunk.rename(columns=RENAMES)
+        chunk = chunk[~chunk['campaign_name'].isin(skip_campaigns)]
+        rows = prepare_chunk(chunk, model.__table__).drop(columns=['id'], errors='ignore')
+        if model is CampaignPeriod:
+            rows['period_start'] = period_starts(chunk)
+        if len(rows):
+            records = to_records(rows)
+            with bind.begin() as conn:
+                if model is CampaignSite:
+                    sites.insert(conn, records)
+                    rollups.apply(conn, sites=records)
+                    search.apply(conn, sites=records)
+                else:
+                    conn.execute(insert(model), records)
+                    rollups.apply(conn, periods=records)
+        stats.add(model.__table__.name, len(rows))
+
+class LoadStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = {}
+
+    def add(self, table, count):
+        self.rows[table] = self.rows.get(table, 0) + count
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.rows.values())
+        for table, count in self.rows.items():
+            print(f"{table}: {count} rows")
+        print(f"Loaded {total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} rows/sec)")
+
+def load_data(chunk_size=DEFAULT_CHUNK_SIZE, data_dir='data', bind=None):
+    bind = bind or engine
     # Create tables
-    Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
+    sync_schema(Base.metadata, bind)
+    with bind.begin() as conn:
+        if sites.needs_migration(conn):
+            print("Moving campaign sites into the sites dimension...")
+            sites.migrate(conn)
+    stats = LoadStats()
 
     try:
-        # Read and clean agrupado data
-        df_agrupado = pd.read_csv('data/bd_campanias_agrupado.csv')
-        df_agrupado = df_agrupado.drop_duplicates(subset=['name'])
-        # Read and clean periodos data
-        df_periodos = pd.read_csv('data/bd_campanias_periodos.csv')
-        df_periodos['impactos_periodo_vehiculos'] = df_periodos['impactos_periodo_vehículos'].apply(clean_number)
-        
-        # Read and clean sitios data
-        df_sitios = pd.read_csv('data/bd_campanias_sitios.csv')
-
-        # Process campaigns
-        for _, row in df_agrupado.iterrows():
-            # Check if exists
-            existing = db.query(Campaign).filter(Campaign.name == row['name']).first()
-            if existing:
-                continue
-
-            campaign = Campaign(
-                name=row['name'],
-                tipo_campania=row['tipo_campania'],
-                fecha_inicio=datetime.strptime(row['fecha_inicio'], '%Y-%m-%d').date(),
-                fecha_fin=datetime.strptime(row['fecha_fin'], '%Y-%m-%d').date(),
-                universo_zona_metro=row['universo_zona_metro'],
-                impactos_personas=row['impactos_personas'],
-                impactos_vehiculos=row['impactos_vehiculos'],
-                frecuencia_calculada=row['frecuencia_calculada'],
-                frecuencia_promedio=row['frecuencia_promedio'],
-                alcance=row['alcance'],
-                nse_ab=row['nse_ab'],
-                nse_c=row['nse_c'],
-                nse_cmas=row['nse_cmas'],
-                nse_d=row['nse_d'],
-                nse_dmas=row['nse_dmas'],
-                nse_e=row['nse_e'],
-                edad_0a14=row['edad_0a14'],
-                edad_15a19=row['edad_15a19'],
-                edad_20a24=row['edad_20a24'],
-                edad_25a34=row['edad_25a34'],
-                edad_35a44=row['edad_35a44'],
-                edad_45a64=row['edad_45a64'],
-                edad_65mas=row['edad_65mas'],
-                hombres=row['hombres'],
-                mujeres=row['mujeres']
-            )
-            db.add(campaign)
-
-        # Process periods (Optimized check: if campaign was skipped, maybe assume periods exist or check them too. 
-        # For simplicity, we can wrap the whole block in try-except or check individually. 
-        # Better: Check existing campaign names to filter inserts)
-        
-        # NOTE: For simplicity in this script, we can just use merge or ignore errors, but clean check is better.
-        # Since relationships are not cascade-deleted here, duplicate inserts on child tables might fails too if PKs clash,
-        # but child tables utilize auto-increment IDs usually. Let's check models.py
-        
-
-
-        # Process periods
-        for _, row in df_periodos.iterrows():
-            period = CampaignPeriod(
-                campaign_name=row['name'],
-                period=row['period'],
-                impactos_periodo_personas=row['impactos_periodo_personas'],
-                impactos_periodo_vehiculos=row['impactos_periodo_vehiculos']
-            )
-            db.add(period)
-
-        # Process sites
-        for _, row in df_sitios.iterrows():
-            site = CampaignSite(
-                campaign_name=row['name'],
-                codigo_del_sitio=row['codigo_del_sitio'],
-                tipo_de_mueble=row['tipo_de_mueble'],
-                tipo_de_anuncio=row['tipo_de_anuncio'],
-                estado=row['estado'],
-                municipio=row['municipio'],
-                zm=row['zm'],
-                frecuencia_catorcenal=row['frecuencia_catorcenal'],
-                frecuencia_mensual=row['frecuencia_mensual'],
-                impactos_catorcenal=row['impactos_catorcenal'],
-                impactos_mensuales=row['impactos_mensuales'],
-                alcance_mensual=row['alcance_mensual']
-            )
-            db.add(site)
-
-        db.commit()
-
-        # Create Admin User
+        preexisting = load_campaigns(bind, os.path.join(data_dir, CAMPAIGNS_CSV), chunk_size, stats)
+        load_children(bind, os.path.join(data_dir, PERIODS_CSV), CampaignPeriod, preexisting, chunk_size, stats)
+        load_children(bind, os.path.join(data_dir, SITES_CSV), CampaignSite, preexisting, chunk_size, stats)
+        with bind.begin() as conn:
+            if rollups.needs_backfill(conn):
+                print("Backfilling campaign rollups...")
+                rollups.rebuild(conn)
+            if search.needs_backfill(conn):
+                print("Building the search index...")
+                search.rebuild(conn)
+            if period_buckets.backfill(conn):
+                print("Backfilled period_start of older periods.")
+    finally:
+        crud.invalidate_read_caches()
+
+    stats.report()
+
+    # Create Admin User
+    db = SessionLocal(bind=bind)
+    try:
         user = crud.get_user_by_username(db, "admin")
         if not user:
             print("Creating admin user...")
             crud.create_user(db, schemas.UserCreate(username="admin", password="admin123"))
         else:
             print("Admin user already exists.")
-
-    except Exception as e:
-        print(f"Error: {e}")
-        db.rollback()
     finally:
         db.close()
-        print("Database seeded successfully.")
+    checkpoint(bind)
+    print("Database seeded successfully.")
+    return stats
 
 if __name__ == "__main__":
-    load_data()
+    parser = argparse.ArgumentParser(description="Load the campaign CSV exports into the database.")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows read and inserted per transaction")
+    parser.add_argument('--data-dir', default='data', help="directory containing the CSV exports")
+    args = parser.parse_args()
+    load_data(chunk_size=args.chunk_size, data_dir=args.data_dir)
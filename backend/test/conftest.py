@@ -1,12 +1,25 @@
+import os
+import tempfile
+from contextlib import contextmanager
 from typing import Generator
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
+from starlette.routing import Match
+
+# app.database builds its engines and session factories on import, from
+# DATABASE_URL: point them at a throwaway file first, so neither the startup
+# event nor any module-level engine touches ./campaigns.db
+_database_dir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_database_dir.name, 'campaigns.db')}"
+os.environ.pop("DATABASE_READ_URL", None)
 
 from app.database import Base
 from app.main import app, get_db
+from app.dependencies import get_read_db
+from app import auth, crud, models, routes
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 
@@ -20,6 +33,9 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 @pytest.fixture(scope="function")
 def session():
     Base.metadata.create_all(bind=engine)
+    crud.invalidate_read_caches()
+    auth.token_cache.clear()
+    auth.user_cache.clear()
     db = TestingSessionLocal()
     try:
         yield db
@@ -36,6 +52,99 @@ def client(session):
             pass
             
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
+
+@pytest.fixture(scope="function")
+def auth_headers(session):
+    session.add(models.User(username="tester", hashed_password="unused"))
+    session.commit()
+    token = auth.create_access_token(data={"sub": "tester"})
+    return {"Authorization": f"Bearer {token}"}
+
+class QueryRecorder:
+    """Records the SQL of every statement run on `bind` inside the block."""
+
+    def __init__(self, bind=engine):
+        self.bind = bind
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.bind, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.bind, "before_cursor_execute", self._record)
+
+@contextmanager
+def query_budget(limit: int, bind=engine):
+    """Fail the test, listing the statements, when the block runs more than `limit`."""
+    with QueryRecorder(bind) as recorder:
+        yield recorder
+    if len(recorder.statements) > limit:
+        listing = "\n".join(f"  {i}. {' '.join(sql.split())}" for i, sql in enumerate(recorder.statements, 1))
+        pytest.fail(f"{len(recorder.statements)} statements, over the budget of {limit}:\n{listing}", pytrace=False)
+
+# Most SQL statements each route may run per request (cold caches), which must
+# not grow with the number of sites or periods. Async routes share their sync
+# counterpart's budget.
+QUERY_BUDGETS = {
+    ("GET", "/"): 0,
+    ("POST", "/token"): 2,
+    ("GET", "/health"): 0,
+    ("GET", "/metrics"): 0,
+    ("GET", "/campaigns"): 4,
+    ("POST", "/campaigns"): 11,
+    # One batch of up to 1000 campaigns (the rows of one multi-row INSERT ...
+    # RETURNING); every further batch adds ten statements
+    ("POST", "/campaigns/bulk"): 11,
+    ("GET", "/campaigns/summary"): 1,
+    ("GET", "/campaigns/search-by-date"): 4,
+    ("GET", "/campaigns/export"): 3,
+    # A second statement when the best terms' campaigns do not fill the page
+    ("GET", "/search"): 2,
+    ("GET", "/campaigns/{campaign_id}"): 3,
+    ("GET", "/campaigns/{campaign_id}/sites/summary"): 2,
+    ("GET", "/campaigns/{campaign_id}/sites/demographics"): 2,
+    ("GET", "/campaigns/{campaign_id}/periods/summary"): 2,
+    ("GET", "/campaigns/{campaign_id}/traffic"): 1,
+    ("GET", "/analytics/campaigns/top"): 1,
+    ("GET", "/analytics/sites/summary"): 1,
+    ("GET", "/sites/{codigo_del_sitio}"): 1,
+    ("GET", "/analytics/periods"): 1,
+    ("GET", "/analytics/traffic"): 1,
+}
+
+def route_for(method: str, path: str):
+    """The route of routes.py that serves `method` `path`."""
+    scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+    for route in routes.router.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route
+    raise LookupError(f"No route for {method} {path}")
+
+@pytest.fixture(scope="function")
+def within_budget(client):
+    """
+    Send a request through the test client and check that it stays within the
+    query budget of its route (see QUERY_BUDGETS). Caches are emptied first, so
+    the count is that of a cold request. Returns the response and the recorded
+    statements.
+    """
+    def request(method: str, url: str, **kwargs):
+        route = route_for(method, url.split("?", 1)[0])
+        limit = QUERY_BUDGETS.get((method, route.path))
+        assert limit is not None, f"{method} {route.path} has no query budget"
+        crud.invalidate_read_caches()
+        auth.token_cache.clear()
+        auth.user_cache.clear()
+        with query_budget(limit) as recorder:
+            response = client.request(method, url, **kwargs)
+        return response, recorder.statements
+
+    return request
@@ -0,0 +1,120 @@
+import threading
+import numpy as np
+import pytest
+from datetime import date
+from app import analytics, cache, crud
+from app.models import Campaign, CampaignPeriod
+from test_api import create_campaigns, create_sample_campaign, create_sample_sites
+
+URLS = [
+    "/campaigns?limit=4",
+    "/campaigns?limit=3&tipo_campania=mensual&start_date=2025-01-01T00:00:00&end_date=2025-03-01T00:00:00",
+    "/campaigns?limit=2&cursor={cursor}",
+    "/campaigns?tipo_campania=missing",
+    "/campaigns?limit=3&fields=name,alcance&format=columnar",
+    "/campaigns/summary",
+    "/campaigns/test_campaign/sites/summary?group_by=estado",
+    "/campaigns/test_campaign/sites/summary?group_by=codigo_del_sitio&limit=3",
+    "/campaigns/test_campaign/periods/summary",
+    "/campaigns/test_campaign/sites/demographics",
+    "/campaigns/test_campaign/sites/demographics?tipo_de_mueble=Espectacular&weight=sites",
+    "/campaigns/test_campaign/sites/demographics?estado=Nowhere",
+    "/analytics/campaigns/top?metric=impactos_personas&limit=3",
+    "/analytics/campaigns/top?metric=alcance&order=asc&tipo_campania=mensual",
+    "/analytics/sites/summary?group_by=municipio",
+    "/analytics/sites/summary?group_by=tipo_de_mueble&tipo_campania=mensual",
+]
+
+def populate(session):
+    create_sample_campaign(session)
+    create_campaigns(session, 5)
+    create_campaigns(session, 3, tipo_campania="catorcenal")
+    for i, campaign in enumerate(session.query(Campaign).filter(Campaign.name != "test_campaign")):
+        campaign.impactos_personas = (i * 37) % 11 * 100 if i % 4 else None
+        campaign.alcance = i * 10
+    create_sample_sites(session, 7)
+    create_sample_sites(session, 3, campaign_name="catorcenal_000")
+    session.add_all([
+        CampaignPeriod(campaign_name="test_campaign", period=period, impactos_periodo_personas=personas, impactos_periodo_vehiculos=3)
+        for period, personas in [("2025-02", 40), ("2025-01", 10), ("2025-01", 5), ("2025-03", None)]
+    ])
+    session.commit()
+
+@pytest.fixture
+def use_store(monkeypatch):
+    """Serve reads from the column store, loaded afresh on the first one."""
+    def enable():
+        monkeypatch.setattr(crud, "ANALYTICS_STORE", True)
+        analytics.store.invalidate()
+    return enable
+
+def responses(client, cursor):
+    results = {}
+    for url in URLS:
+        cache.response_cache.clear()
+        response = client.get(url.format(cursor=cursor))
+        results[url] = (response.status_code, response.json())
+    return results
+
+def test_store_matches_sql(client, session, use_store):
+    populate(session)
+    cursor = client.get("/campaigns?limit=2").json()["next_cursor"]
+
+    expected = responses(client, cursor)
+    use_store()
+    actual = responses(client, cursor)
+
+    for url in URLS:
+        assert actual[url] == expected[url], url
+
+def test_store_appends_created_campaigns(client, session, auth_headers, use_store):
+    use_store()
+    create_campaigns(session, 2)
+    assert client.get("/campaigns").json()["total"] == 2
+
+    payload = {
+        "name": "nuevo", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+        "impactos_personas": 10**9,
+        "sites": [{"codigo_del_sitio": "S1", "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo", "estado": "Sonora", "municipio": "Hermosillo", "zm": "Hermosillo", "impactos_mensuales": 70}],
+    }
+    assert client.post("/campaigns", json=payload, headers=auth_headers).status_code == 200
+
+    assert client.get("/campaigns").json()["total"] == 3
+    assert client.get("/analytics/campaigns/top?limit=1").json()["data"][0]["name"] == "nuevo"
+    buckets = client.get("/analytics/sites/summary?group_by=estado").json()["buckets"]
+    assert buckets == [{"key": "Sonora", "sites": 1, "impactos_mensuales": 70, "impactos_catorcenal": 0,
+                        "alcance_mensual": 0.0, "frecuencia_mensual_promedio": None}]
+    assert client.get("/campaigns/nuevo").json()["fecha_inicio"] == date(2025, 1, 1).isoformat()
+
+def test_categories_encode_keeps_codes_across_calls():
+    categories = analytics.Categories()
+    first = categories.encode(["b", None, "a", "b"])
+    second = categories.encode(["c", "a", None])
+    assert [categories.decode(code) for code in first] == ["b", None, "a", "b"]
+    assert [categories.decode(code) for code in second] == ["c", "a", None]
+    assert categories.encode([]).dtype == np.int32
+
+def test_readers_keep_the_old_snapshot_during_a_reload(session, monkeypatch):
+    populate(session)
+    store = analytics.AnalyticsStore()
+    old = store.snapshot(session)
+
+    loading, release = threading.Event(), threading.Event()
+    load_all = store._load_all
+    def slow_load_all(db):
+        loading.set()
+        release.wait(5)
+        return load_all(db)
+    monkeypatch.setattr(store, "_load_all", slow_load_all)
+
+    store.invalidate()
+    reloaded = []
+    loader = threading.Thread(target=lambda: reloaded.append(store.snapshot(session)))
+    loader.start()
+    assert loading.wait(5)
+    # The reload is still running, and does not hold this reader up
+    assert store.snapshot(session) is old
+    release.set()
+    loader.join(5)
+    assert reloaded[0] is not old
+    assert store.snapshot(session) is reloaded[0]
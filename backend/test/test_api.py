@@ -1,6 +1,18 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
 import pytest
 from datetime import date, datetime
-from app.models import Campaign
+from passlib.context import CryptContext
+from sqlalchemy import event, text
+from sqlalchemy.dialects import postgresql
+from app import auth, bulk, cache, crud, database, export, main, metrics, pagination, period_buckets, rollups, schemas, search, sites
+from app.models import Base, Campaign, CampaignPeriod, CampaignRollup, CampaignRollupMueble, CampaignSite, Site, SiteCategory, User
+from conftest import engine
 
 def create_sample_campaign(session):
     campaign = Campaign(
@@ -87,3 +99,812 @@ def test_get_campaign_detail(client, session):
 def test_get_campaign_not_found(client, session):
     response = client.get("/campaigns/non_existent")
     assert response.status_code == 404
+
+def create_campaigns(session, count, tipo_campania="mensual"):
+    for i in range(count):
+        session.add(Campaign(
+            name=f"{tipo_campania}_{i:03d}",
+            tipo_campania=tipo_campania,
+            fecha_inicio=date(2025, 1, 1),
+            fecha_fin=date(2025, 1, 31)
+        ))
+    session.commit()
+
+def test_cursor_pagination(client, session):
+    create_campaigns(session, 7)
+    create_campaigns(session, 2, tipo_campania="catorcenal")
+
+    names = []
+    response = client.get("/campaigns?limit=3&tipo_campania=mensual")
+    data = response.json()
+    assert data["total"] == 7
+    while True:
+        names.extend(c["name"] for c in data["data"])
+        if data["next_cursor"] is None:
+            break
+        response = client.get(f"/campaigns?limit=3&tipo_campania=mensual&include_total=false&cursor={data['next_cursor']}")
+        data = response.json()
+        assert data["total"] is None
+
+    assert names == [f"mensual_{i:03d}" for i in range(7)]
+
+def test_invalid_cursor(client):
+    response = client.get("/campaigns?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+def test_cursor_of_the_wrong_type(client, session):
+    create_sample_campaign(session)
+    # A well-formed cursor whose key is not a campaign name / site id
+    for url in [
+        f"/campaigns?cursor={pagination.encode_cursor(5)}",
+        f"/campaigns?cursor={pagination.encode_cursor(None)}",
+        f"/campaigns/test_campaign?sites_cursor={pagination.encode_cursor('SITE-001')}",
+        f"/campaigns/test_campaign?sites_cursor={pagination.encode_cursor(True)}",
+        f"/campaigns/test_campaign?sites_cursor={pagination.encode_cursor(1, 2)}",
+        f"/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-02-01T00:00:00&cursor={pagination.encode_cursor(1, 'x')}",
+    ]:
+        assert client.get(url).status_code == 400, url
+
+def create_sample_sites(session, count, campaign_name="test_campaign"):
+    sites.insert(session, [
+        {
+            "campaign_name": campaign_name,
+            "codigo_del_sitio": f"SITE-{i:03d}",
+            "tipo_de_mueble": "Pantalla Digital" if i % 2 else "Espectacular",
+            "tipo_de_anuncio": "Digital",
+            "estado": "Jalisco" if i % 3 == 0 else "Ciudad de Mexico",
+            "municipio": "Guadalajara" if i % 3 == 0 else "Cuauhtemoc",
+            "zm": "Guadalajara" if i % 3 == 0 else "Valle de Mexico",
+            "impactos_mensuales": 100 * (i + 1),
+            "alcance_mensual": 10.0 * (i + 1),
+            "per_muj": None if i == 4 else 0.2 if i % 3 == 0 else 0.6,
+            "per_hom": 0.8 if i % 3 == 0 else 0.4,
+        }
+        for i in range(count)
+    ])
+    session.commit()
+
+def test_campaign_detail_sites_pages(client, session):
+    create_sample_campaign(session)
+    create_sample_sites(session, 9)
+    session.add(CampaignPeriod(campaign_name="test_campaign", period="2025-01", impactos_periodo_personas=1, impactos_periodo_vehiculos=2))
+    session.commit()
+
+    codes = []
+    response = client.get("/campaigns/test_campaign?sites_limit=2&estado=Jalisco")
+    data = response.json()
+    assert len(data["periods"]) == 1
+    while True:
+        codes.extend(s["codigo_del_sitio"] for s in data["sites"])
+        if data["sites_next_cursor"] is None:
+            break
+        data = client.get(f"/campaigns/test_campaign?sites_limit=2&estado=Jalisco&sites_cursor={data['sites_next_cursor']}").json()
+
+    assert codes == ["SITE-000", "SITE-003", "SITE-006"]
+
+def test_campaign_detail_returns_every_site_by_default(client, session):
+    create_sample_campaign(session)
+    create_sample_sites(session, 9)
+
+    data = client.get("/campaigns/test_campaign").json()
+    assert [s["codigo_del_sitio"] for s in data["sites"]] == [f"SITE-{i:03d}" for i in range(9)]
+    assert data["sites_next_cursor"] is None
+
+def test_sites_summary(client, session):
+    create_sample_campaign(session)
+    create_sample_sites(session, 6)
+
+    response = client.get("/campaigns/test_campaign/sites/summary?group_by=estado")
+    assert response.status_code == 200
+    buckets = {b["key"]: b for b in response.json()["buckets"]}
+    assert buckets["Jalisco"]["sites"] == 2
+    assert buckets["Jalisco"]["impactos_mensuales"] == 100 + 400
+    assert buckets["Ciudad de Mexico"]["sites"] == 4
+
+    response = client.get("/campaigns/test_campaign/sites/summary?group_by=codigo_del_sitio&limit=2")
+    assert [b["key"] for b in response.json()["buckets"]] == ["SITE-005", "SITE-004"]
+
+    response = client.get("/campaigns/test_campaign/sites/summary?group_by=not_a_column")
+    assert response.status_code == 422
+
+def test_sites_demographics(client, session):
+    create_sample_campaign(session)
+    create_sample_sites(session, 6)
+
+    data = client.get("/campaigns/test_campaign/sites/demographics").json()
+    assert data["sites"] == 6 and data["total_weight"] == 2100
+    # per_muj is missing at SITE-004, so its 500 impactos do not count towards mujeres
+    assert data["demographics"]["mujeres"] == pytest.approx((100 * 0.2 + 400 * 0.2 + 200 * 0.6 + 300 * 0.6 + 600 * 0.6) / 1600)
+    assert data["demographics"]["hombres"] == pytest.approx((500 * 0.8 + 1600 * 0.4) / 2100)
+    assert data["demographics"]["nse_ab"] is None
+
+    data = client.get("/campaigns/test_campaign/sites/demographics?estado=Jalisco&weight=sites").json()
+    assert data["sites"] == 2 and data["demographics"]["mujeres"] == pytest.approx(0.2)
+    assert client.get("/campaigns/test_campaign/sites/demographics?municipio=Nowhere").json()["sites"] == 0
+    assert client.get("/campaigns/missing/sites/demographics").status_code == 404
+
+def test_periods_summary(client, session):
+    create_sample_campaign(session)
+    for period, personas in [("2025-01", 10), ("2025-02", 30), ("2025-03", 20)]:
+        session.add(CampaignPeriod(campaign_name="test_campaign", period=period, impactos_periodo_personas=personas, impactos_periodo_vehiculos=1))
+    session.commit()
+
+    data = client.get("/campaigns/test_campaign/periods/summary").json()
+    assert [p["period"] for p in data["periods"]] == ["2025-01", "2025-02", "2025-03"]
+    assert data["total_personas"] == 60
+    assert data["total_vehiculos"] == 3
+    assert data["peak_period"] == "2025-02"
+
+def test_period_series(client, session, auth_headers):
+    for name, tipo, periods in [
+        ("monthly", "mensual", [("2024-12", 1, 10), ("2025-01", 2, 20), ("2025-04", 4, 40)]),
+        ("fortnightly", "catorcenal", [("2025-02", 8, 80), ("2025-27", 16, 160)]),
+    ]:
+        payload = {
+            "name": name, "tipo_campania": tipo, "fecha_inicio": "2024-12-01", "fecha_fin": "2025-12-31",
+            "periods": [{"period": p, "impactos_periodo_personas": personas, "impactos_periodo_vehiculos": vehiculos} for p, personas, vehiculos in periods]
+        }
+        assert client.post("/campaigns", json=payload, headers=auth_headers).status_code == 200
+
+    assert client.get("/campaigns/fortnightly").json()["periods"][1]["period_start"] == "2025-12-31"
+
+    series = client.get("/analytics/periods?granularity=quarter").json()["series"]
+    assert [(line["key"], [(p["bucket"], p["impactos_periodo_personas"]) for p in line["points"]]) for line in series] == [
+        ("catorcenal", [("2025-Q1", 8), ("2025-Q4", 16)]),
+        ("mensual", [("2024-Q4", 1), ("2025-Q1", 2), ("2025-Q2", 4)]),
+    ]
+
+    data = client.get("/analytics/periods?granularity=year&group_by=all&start_date=2025-01-01T00:00:00").json()
+    assert data["series"] == [{"key": None, "points": [{"bucket": "2025", "impactos_periodo_personas": 30, "impactos_periodo_vehiculos": 300}]}]
+
+    months = client.get("/analytics/periods?tipo_campania=mensual&end_date=2025-01-31T00:00:00").json()["series"]
+    assert [p["bucket"] for p in months[0]["points"]] == ["2024-12", "2025-01"]
+
+def test_period_starts_backfilled(session):
+    create_sample_campaign(session)
+    session.add(CampaignPeriod(campaign_name="test_campaign", period="2025-03", impactos_periodo_personas=1, impactos_periodo_vehiculos=1))
+    session.add(CampaignPeriod(campaign_name="test_campaign", period="sin fecha", impactos_periodo_personas=1, impactos_periodo_vehiculos=1))
+    session.commit()
+    assert period_buckets.needs_backfill(session)
+    assert "python -m app.period_buckets backfill" in main.pending_maintenance(engine)
+
+    assert period_buckets.backfill(session) == 1
+    assert not period_buckets.needs_backfill(session)
+    assert session.query(CampaignPeriod).filter_by(period="2025-03").one().period_start == date(2025, 3, 1)
+    assert period_buckets.backfill(session) == 0
+
+def test_campaigns_summary(client, session):
+    create_campaigns(session, 3)
+    create_campaigns(session, 2, tipo_campania="catorcenal")
+
+    data = client.get("/campaigns/summary").json()
+    assert {b["key"]: b["campaigns"] for b in data["buckets"]} == {"catorcenal": 2, "mensual": 3}
+
+def test_search_by_date_overlap(client, session):
+    ranges = {
+        "before": (date(2024, 11, 1), date(2024, 12, 31)),
+        "long_running": (date(2024, 6, 1), date(2025, 6, 30)),
+        "ends_inside": (date(2024, 12, 15), date(2025, 1, 10)),
+        "inside": (date(2025, 1, 5), date(2025, 1, 20)),
+        "starts_inside": (date(2025, 1, 31), date(2025, 3, 1)),
+        "after": (date(2025, 2, 1), date(2025, 2, 28)),
+    }
+    for name, (inicio, fin) in ranges.items():
+        session.add(Campaign(name=name, tipo_campania="mensual", fecha_inicio=inicio, fecha_fin=fin))
+    session.commit()
+
+    response = client.get("/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-01-31T00:00:00&limit=2")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 4
+    names = [c["name"] for c in data["data"]]
+    cursor = data["next_cursor"]
+    while cursor:
+        data = client.get(f"/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-01-31T00:00:00&limit=2&cursor={cursor}").json()
+        names.extend(c["name"] for c in data["data"])
+        cursor = data["next_cursor"]
+    assert names == ["long_running", "ends_inside", "inside", "starts_inside"]
+
+    response = client.get("/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-01-31T00:00:00&format=ndjson")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(response.text.splitlines()) == 4
+
+    # Written by another process (no cache invalidation here): longer than any campaign searched so far
+    session.add(Campaign(name="decade", tipo_campania="mensual", fecha_inicio=date(2016, 1, 1), fecha_fin=date(2026, 1, 1)))
+    session.commit()
+    data = client.get("/campaigns/search-by-date?start_date=2025-01-02T00:00:00&end_date=2025-01-30T00:00:00&limit=10").json()
+    assert [c["name"] for c in data["data"]] == ["decade", "long_running", "ends_inside", "inside"]
+
+def test_search_by_date_span_classes(client, session):
+    for month in range(1, 13):
+        session.add(Campaign(name=f"m{month:02d}", tipo_campania="mensual", fecha_inicio=date(2024, month, 1), fecha_fin=date(2024, month, 28)))
+    session.commit()
+    url = "/campaigns/search-by-date?start_date=2024-06-10T00:00:00&end_date=2024-08-05T00:00:00&limit=1"
+
+    def all_pages():
+        cache.response_cache.clear()
+        data = client.get(url).json()
+        names = [c["name"] for c in data["data"]]
+        while data["next_cursor"]:
+            data = client.get(f"{url}&cursor={data['next_cursor']}").json()
+            names.extend(c["name"] for c in data["data"])
+        return data["total"], names
+
+    assert all_pages() == (3, ["m06", "m07", "m08"])
+
+    # One long campaign puts the search on the span index instead of stretching the date range
+    session.add(Campaign(name="year", tipo_campania="catorcenal", fecha_inicio=date(2023, 1, 1), fecha_fin=date(2024, 6, 30)))
+    session.commit()
+    crud.invalidate_read_caches()
+    assert all_pages() == (4, ["year", "m06", "m07", "m08"])
+
+    longest = session.scalar(crud.longest_span_statement("sqlite"))
+    statement = crud.overlap_statement("sqlite", date(2024, 6, 10), date(2024, 8, 5), longest_span=longest)
+    compiled = statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    plan = " ".join(row[-1] for row in session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+    assert "MULTI-INDEX OR" in plan and "ix_campaigns_span" in plan
+
+def test_search_by_date_invalid_range(client):
+    response = client.get("/campaigns/search-by-date?start_date=2025-02-01T00:00:00&end_date=2025-01-01T00:00:00")
+    assert response.status_code == 400
+
+def test_export_campaigns(client, session, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr(export, "CHUNK_BYTES", 100)
+    create_campaigns(session, 3)
+    create_sample_campaign(session)
+    create_sample_sites(session, 3)
+    create_sample_sites(session, 2, campaign_name="mensual_001")
+    session.add(CampaignPeriod(campaign_name="test_campaign", period="2025-01", impactos_periodo_personas=1, impactos_periodo_vehiculos=2))
+    sites.insert(session, [{"campaign_name": "deleted", "codigo_del_sitio": "ORPHAN"}])
+    session.commit()
+
+    response = client.get("/campaigns/export?include=sites&include=periods")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    campaigns = [json.loads(line) for line in response.text.splitlines()]
+    assert [c["name"] for c in campaigns] == ["mensual_000", "mensual_001", "mensual_002", "test_campaign"]
+    assert [len(c["sites"]) for c in campaigns] == [0, 2, 0, 3]
+    assert campaigns[3]["periods"][0]["period"] == "2025-01" and campaigns[3]["fecha_inicio"] == "2025-01-01"
+    assert "campaign_name" not in campaigns[3]["sites"][0]
+
+    rows = list(csv.DictReader(io.StringIO(client.get("/campaigns/export?format=csv&include=sites").text)))
+    assert len(rows) == 2 + 2 + 3
+    assert rows[0]["name"] == "mensual_000" and rows[0]["sites.codigo_del_sitio"] == ""
+    assert [r["sites.codigo_del_sitio"] for r in rows if r["name"] == "test_campaign"] == ["SITE-000", "SITE-001", "SITE-002"]
+
+    rows = list(csv.DictReader(io.StringIO(client.get("/campaigns/export?format=csv&tipo_campania=mensual").text)))
+    assert [r["name"] for r in rows] == ["mensual_000", "mensual_001", "mensual_002", "test_campaign"]
+    assert client.get("/campaigns/export?format=csv&include=sites&include=periods").status_code == 400
+
+def test_bulk_create_ndjson(client, session, auth_headers):
+    create_sample_campaign(session)
+    lines = [
+        json.dumps({"name": "bulk_1", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+                    "sites": [{"codigo_del_sitio": "S1", "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo", "estado": "Jalisco", "municipio": "Zapopan", "zm": "Guadalajara"}],
+                    "periods": [{"period": "2025-01", "impactos_periodo_personas": 5, "impactos_periodo_vehiculos": 3}]}),
+        json.dumps({"name": "test_campaign", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31"}),
+        "",
+        json.dumps({"name": "bulk_2", "tipo_campania": "mensual", "fecha_inicio": "not a date", "fecha_fin": "2025-01-31"}),
+        "{broken",
+        json.dumps({"name": "bulk_1", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31"}),
+    ]
+    response = client.post(
+        "/campaigns/bulk?batch_size=1",
+        content="\n".join(lines),
+        headers={**auth_headers, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["line"], r["status"]) for r in results] == [
+        (1, "created"), (2, "conflict"), (4, "invalid"), (5, "invalid"), (6, "conflict")
+    ]
+    assert response.headers["X-Bulk-Created"] == "1"
+
+    detail = client.get("/campaigns/bulk_1").json()
+    assert len(detail["sites"]) == 1
+    assert len(detail["periods"]) == 1
+
+def test_bulk_create_rejects_long_lines(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(bulk, "MAX_LINE_BYTES", 200)
+    short = {"name": "short", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31"}
+    long = {**short, "name": "long" * 100}
+    body = "\n".join(json.dumps(record) for record in (long, short)).encode()
+    # Sent in small chunks, so the long line spans several of them
+    chunks = iter([body[i:i + 16] for i in range(0, len(body), 16)])
+    response = client.post("/campaigns/bulk", content=chunks, headers={**auth_headers, "Content-Type": "application/x-ndjson"})
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["line"], r["status"]) for r in results] == [(1, "invalid"), (2, "created")]
+    assert results[0]["detail"] == "line longer than 200 bytes"
+
+def test_bulk_create_yields_to_concurrent_writers(session):
+    create_sample_campaign(session)
+
+    raced = []
+
+    def racing_writer(conn, cursor, statement, parameters, context, executemany):
+        # Another process creates "raced" between validation and the insert
+        if statement.startswith("INSERT INTO campaigns") and not raced:
+            raced.append(statement)
+            cursor.execute("INSERT INTO campaigns (name, tipo_campania) VALUES ('raced', 'mensual')")
+
+    batch = [
+        schemas.CampaignCreate(name=name, tipo_campania="mensual", fecha_inicio=date(2025, 1, 1), fecha_fin=date(2025, 1, 31))
+        for name in ("fresh", "raced", "test_campaign", "fresh")
+    ]
+    event.listen(engine, "before_cursor_execute", racing_writer)
+    try:
+        results = crud.bulk_create_campaigns(session, batch)
+    finally:
+        event.remove(engine, "before_cursor_execute", racing_writer)
+    assert results == [("fresh", "created"), ("raced", "conflict"), ("test_campaign", "conflict"), ("fresh", "conflict")]
+    assert session.get(Campaign, "raced").fecha_inicio is None
+
+def test_bulk_create_csv(client, auth_headers):
+    body = "name,tipo_campania,fecha_inicio,fecha_fin,alcance\ncsv_1,mensual,2025-01-01,2025-01-31,10\ncsv_2,catorcenal,2025-02-01,2025-02-14,\n"
+    response = client.post("/campaigns/bulk", content=body, headers={**auth_headers, "Content-Type": "text/csv"})
+    assert response.headers["X-Bulk-Created"] == "2"
+    assert client.get("/campaigns").json()["total"] == 2
+
+    # Quoted fields may hold newlines (and quotes); an unclosed one ends the upload
+    body = 'name,tipo_campania,fecha_inicio,fecha_fin\r\n"csv_3\r\nsegunda ""línea""",mensual,2025-01-01,2025-01-31\r\ncsv_4,mensual,2025-01-01,2025-01-31\r\n"csv_5,mensual\r\n'
+    response = client.post("/campaigns/bulk", content=body.encode(), headers={**auth_headers, "Content-Type": "text/csv"})
+    results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["line"])
+    assert [(r["line"], r["name"], r["status"]) for r in results] == [
+        (2, 'csv_3\nsegunda "línea"', "created"), (4, "csv_4", "created"), (5, None, "invalid")
+    ]
+    assert results[2]["detail"] == "unterminated quoted field"
+
+def test_bulk_create_requires_auth(client):
+    response = client.post("/campaigns/bulk", content="", headers={"Content-Type": "text/csv"})
+    assert response.status_code == 401
+
+def test_create_campaign(client, session, auth_headers):
+    payload = {
+        "name": "created", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+        "impactos_personas": 10,
+        "sites": [{"codigo_del_sitio": f"S{i}", "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo", "estado": "Jalisco", "municipio": "Zapopan", "zm": "Guadalajara"} for i in range(3)],
+        "periods": [{"period": "2025-01", "impactos_periodo_personas": 5, "impactos_periodo_vehiculos": 3}]
+    }
+    response = client.post("/campaigns", json=payload, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["impactos_personas"] == 10
+    assert session.query(CampaignSite).filter_by(campaign_name="created").count() == 3
+
+    response = client.post("/campaigns", json=payload, headers=auth_headers)
+    assert response.status_code == 400
+    assert session.query(CampaignSite).filter_by(campaign_name="created").count() == 3
+
+def test_traffic_profile_and_summary(client, session, auth_headers):
+    create_sample_campaign(session)
+    for i, tipo in enumerate(["mensual", "mensual", "catorcenal"]):
+        payload = {
+            "name": f"traffic_{i}", "tipo_campania": tipo, "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+            "hourly_vehicle_counts": [(i + 1) * (hour + 1) for hour in range(24)]
+        }
+        assert client.post("/campaigns", json=payload, headers=auth_headers).status_code == 200
+
+    profile = client.get("/campaigns/traffic_1/traffic").json()
+    assert profile["hourly_vehicle_counts"] == [2 * (hour + 1) for hour in range(24)]
+    assert profile["total"] == 600 and profile["peak_hour"] == 23
+    assert client.get("/campaigns/test_campaign/traffic").json()["hourly_vehicle_counts"] is None
+    assert client.get("/campaigns/missing/traffic").status_code == 404
+
+    for counts in ([1, 2], [2**31] + [0] * 23, [-1] + [0] * 23):
+        bad = {**payload, "name": "bad", "hourly_vehicle_counts": counts}
+        assert client.post("/campaigns", json=bad, headers=auth_headers).status_code == 422
+
+    buckets = client.get("/analytics/traffic?percentile=50").json()["buckets"]
+    assert [(b["key"], b["campaigns"]) for b in buckets] == [("catorcenal", 1), ("mensual", 2)]
+    mensual = buckets[1]
+    assert mensual["sum"][0] == 3 and mensual["mean"][23] == 36.0
+    assert mensual["percentiles"]["50"][1] == 3.0
+
+    overall = client.get("/analytics/traffic?group_by=all&tipo_campania=mensual").json()["buckets"]
+    assert len(overall) == 1 and overall[0]["key"] is None and overall[0]["campaigns"] == 2
+    assert set(overall[0]["percentiles"]) == {"50", "90"}
+    assert client.get("/analytics/traffic?percentile=101").status_code == 400
+
+    # In a bulk upload only that record is rejected
+    bulk = "\n".join(json.dumps(body) for body in (
+        {**payload, "name": "overflow", "hourly_vehicle_counts": [2**31] + [0] * 23}, {**payload, "name": "bulk_ok"}
+    ))
+    response = client.post("/campaigns/bulk", content=bulk, headers={**auth_headers, "Content-Type": "application/x-ndjson"})
+    assert [line["status"] for line in map(json.loads, response.text.splitlines())] == ["invalid", "created"]
+
+def test_authenticated_requests_reuse_cached_user(client, session, auth_headers):
+    user_queries = []
+    def count_user_queries(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            user_queries.append(statement)
+
+    hits_before = auth.user_cache.hits
+    event.listen(engine, "before_cursor_execute", count_user_queries)
+    try:
+        for i in range(3):
+            response = client.post("/campaigns", json={"name": f"auth_{i}", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31"}, headers=auth_headers)
+            assert response.status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", count_user_queries)
+
+    assert len(user_queries) == 1
+    assert auth.user_cache.hits - hits_before == 2
+    assert client.get("/health").json()["caches"]["auth_users"]["entries"] == 1
+
+    session.query(User).filter_by(username="tester").delete()
+    session.commit()
+    auth.invalidate_user("tester")
+    response = client.post("/campaigns", json={"name": "auth_x", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31"}, headers=auth_headers)
+    assert response.status_code == 401
+
+def test_login_rehashes_outdated_hash(client, session):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    session.add(User(username="legacy", hashed_password=old_hash))
+    session.commit()
+
+    response = client.post("/token", data={"username": "legacy", "password": "secret"})
+    assert response.status_code == 200
+    session.expire_all()
+    new_hash = session.query(User).filter_by(username="legacy").one().hashed_password
+    assert new_hash != old_hash
+    assert new_hash.startswith(f"$2b${auth.PASSWORD_HASH_ROUNDS:02d}$")
+    assert client.post("/token", data={"username": "legacy", "password": "wrong"}).status_code == 401
+
+def test_login_rejected_when_hashing_saturated(client, session, monkeypatch):
+    session.add(User(username="busy", hashed_password=CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")))
+    session.commit()
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(auth, "_hash_slots", slots)
+
+    response = client.post("/token", data={"username": "busy", "password": "secret"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_writes_rejected_on_read_only_database(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_READ_ONLY", True)
+    response = client.post("/campaigns", json={"name": "ro", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31"}, headers=auth_headers)
+    assert response.status_code == 503
+    assert client.get("/campaigns").status_code == 200
+
+def test_campaign_fields_and_columnar_format(client, session):
+    create_campaigns(session, 3)
+
+    full = client.get("/campaigns?limit=2").json()
+    data = client.get("/campaigns?limit=2&fields=tipo_campania,fecha_inicio").json()
+    assert data["data"] == [{"tipo_campania": "mensual", "fecha_inicio": "2025-01-01"}] * 2
+    assert data["next_cursor"] == full["next_cursor"] and data["total"] == 3
+
+    columnar = client.get(f"/campaigns?limit=2&format=columnar&cursor={full['next_cursor']}").json()
+    assert columnar["data"]["name"] == ["mensual_002"]
+    assert list(columnar["data"]) == list(full["data"][0])
+
+    search = client.get("/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-01-31T00:00:00&fields=name&limit=2").json()
+    assert search["data"] == [{"name": "mensual_000"}, {"name": "mensual_001"}]
+    assert client.get("/campaigns?fields=name,password").status_code == 400
+
+def test_large_responses_compressed(client, session, monkeypatch):
+    create_campaigns(session, 30)
+    plain = client.get("/campaigns?limit=30", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+
+    # brotli is optional (not in requirements.txt)
+    for encoding in ["gzip"] + (["br"] if cache.brotli_module() is not None else []):
+        response = client.get("/campaigns?limit=30", headers={"Accept-Encoding": encoding})
+        assert response.headers["Content-Encoding"] == encoding
+        assert response.json() == plain.json()
+        assert int(response.headers["Content-Length"]) < len(plain.content) / 5
+        assert response.headers["ETag"] != plain.headers["ETag"]
+        again = client.get("/campaigns?limit=30", headers={"Accept-Encoding": encoding, "If-None-Match": response.headers["ETag"]})
+        assert again.status_code == 304
+
+    small = client.get("/campaigns?limit=1", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+    # Without brotli, clients that also take gzip get gzip
+    monkeypatch.setattr(cache, "brotli_module", lambda: None)
+    fallback = client.get("/campaigns?limit=30", headers={"Accept-Encoding": "br, gzip"})
+    assert fallback.headers["Content-Encoding"] == "gzip"
+    assert fallback.json() == plain.json()
+    only_br = client.get("/campaigns?limit=30", headers={"Accept-Encoding": "br"})
+    assert "Content-Encoding" not in only_br.headers and only_br.json() == plain.json()
+
+def test_server_timing_and_metrics(client, session):
+    metrics.reset()
+    create_sample_campaign(session)
+    create_sample_sites(session, 5)
+    timing = client.get("/campaigns/test_campaign").headers["Server-Timing"]
+    entries = dict(entry.split(";", 1) for entry in timing.split(", "))
+    assert set(entries) == {"db", "orm", "serialize", "app", "total"}
+    assert 'desc="3 queries"' in entries["db"]
+    assert float(entries["orm"].split("=")[1]) > 0
+    # Served from the response cache: no SQL and nothing to encode
+    assert client.get("/campaigns/test_campaign").headers["Server-Timing"].startswith('db;dur=0.00;desc="0 queries"')
+    client.get("/campaigns/missing")
+
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/campaigns/{campaign_id}",status="200"} 2' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/campaigns/{campaign_id}",status="404"} 1' in body
+    assert 'http_request_db_statements_sum{method="GET",route="/campaigns/{campaign_id}"} 4' in body
+    assert 'http_request_db_statements_bucket{method="GET",route="/campaigns/{campaign_id}",le="3"} 3' in body
+    assert 'cache_hits_total{cache="responses"}' in body
+    assert 'http_request_phase_seconds_total{method="GET",route="/campaigns/{campaign_id}",phase="orm"}' in body
+    assert "threadpool_max_threads" in body and "db_pool_checked_out" in body
+
+def test_read_responses_cached_with_etag(client, session, auth_headers):
+    create_sample_campaign(session)
+    response = client.get("/campaigns?limit=5")
+    etag = response.headers["ETag"]
+
+    assert client.get("/campaigns?limit=5", headers={"If-None-Match": etag}).status_code == 304
+
+    # Rows written behind the API's back are not seen until a write goes through it
+    create_campaigns(session, 1)
+    assert client.get("/campaigns?limit=5").json()["total"] == 1
+
+    client.post("/campaigns", json={"name": "new", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31"}, headers=auth_headers)
+    response = client.get("/campaigns?limit=5", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["total"] == 3
+    assert response.headers["ETag"] != etag
+
+def test_rollups_maintained_on_insert(client, session, auth_headers):
+    site = {"tipo_de_anuncio": "Fijo", "estado": "Jalisco", "municipio": "Zapopan", "zm": "Guadalajara"}
+    payload = {
+        "name": "rolled", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+        "sites": [
+            {**site, "codigo_del_sitio": "S1", "tipo_de_mueble": "Muro", "impactos_mensuales": 10},
+            {**site, "codigo_del_sitio": "S2", "tipo_de_mueble": "Muro", "impactos_mensuales": 20},
+            {**site, "codigo_del_sitio": "S3", "tipo_de_mueble": "Puente", "impactos_mensuales": 5},
+        ],
+        "periods": [
+            {"period": "2025-01", "impactos_periodo_personas": 7, "impactos_periodo_vehiculos": 1},
+            {"period": "2025-02", "impactos_periodo_personas": 9, "impactos_periodo_vehiculos": 1},
+        ]
+    }
+    client.post("/campaigns", json=payload, headers=auth_headers)
+    client.post("/campaigns", json={**payload, "name": "empty", "sites": [], "periods": []}, headers=auth_headers)
+
+    data_before = client.get("/campaigns?include_rollups=true").json()["data"]
+    by_name = {c["name"]: c["rollup"] for c in data_before}
+    assert by_name["rolled"] == {
+        "site_count": 3, "impactos_mensuales_total": 35, "period_count": 2,
+        "peak_period": "2025-02", "peak_period_impactos": 9,
+        "sites_by_mueble": {"Muro": 2, "Puente": 1}
+    }
+    assert by_name["empty"]["site_count"] == 0
+    assert "rollup" not in client.get("/campaigns").json()["data"][0]
+
+    # A database upgraded from before the rollups is not served until they are built
+    session.query(CampaignRollupMueble).delete()
+    session.query(CampaignRollup).delete()
+    session.commit()
+    assert main.pending_maintenance(engine) == ["python -m app.rollups rebuild"]
+    rollups.rebuild(session)
+    session.commit()
+    assert main.pending_maintenance(engine) == []
+    crud.invalidate_read_caches()
+    data = client.get("/campaigns?include_rollups=true").json()["data"]
+    assert {c["name"]: c["rollup"] for c in data} == {c["name"]: c["rollup"] for c in data_before}
+
+def test_search_campaigns(client, session, auth_headers):
+    def campaign(name, *sites):
+        return {
+            "name": name, "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+            "sites": [
+                {"codigo_del_sitio": code, "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo",
+                 "estado": estado, "municipio": municipio, "zm": "Valle de Mexico"}
+                for code, estado, municipio in sites
+            ],
+        }
+    client.post("/campaigns", json=campaign(
+        "verano", ("PRUEBA-MEX-054", "Ciudad de México", "Cuauhtémoc"), ("PRUEBA-MEX-055", "Ciudad de México", "Cuauhtémoc")
+    ), headers=auth_headers)
+    bulk = "\n".join(json.dumps(body) for body in (
+        campaign("invierno", ("PRUEBA-JAL-001", "Jalisco", "Zapopan")),
+        campaign("mexico_total", ("PRUEBA-MEX-054", "Ciudad de México", "Cuauhtémoc")),
+    ))
+    client.post("/campaigns/bulk", content=bulk, headers={**auth_headers, "Content-Type": "application/x-ndjson"})
+
+    def hits(q, **params):
+        response = client.get("/search", params={"q": q, **params})
+        assert response.status_code == 200
+        return [(hit["name"], hit["field"], hit["value"]) for hit in response.json()["data"]]
+
+    assert hits("prueba-mex-054") == [
+        ("mexico_total", "codigo_del_sitio", "PRUEBA-MEX-054"), ("verano", "codigo_del_sitio", "PRUEBA-MEX-054")
+    ]
+    # Accents and case are ignored and the last word is a prefix
+    assert hits("cuauhtemoc") == [("mexico_total", "municipio", "Cuauhtémoc"), ("verano", "municipio", "Cuauhtémoc")]
+    assert hits("zapo") == [("invierno", "municipio", "Zapopan")]
+    # Each campaign once, under its best (shortest) matching value
+    assert hits("mex") == [
+        ("mexico_total", "name", "mexico_total"),
+        ("verano", "codigo_del_sitio", "PRUEBA-MEX-054"),
+        ("invierno", "zm", "Valle de Mexico"),
+    ]
+    assert hits("mex", field="estado") == [
+        ("mexico_total", "estado", "Ciudad de México"), ("verano", "estado", "Ciudad de México")
+    ]
+    assert hits("%") == [] and hits("otoño") == []
+
+    first = client.get("/search", params={"q": "mex", "limit": 2}).json()
+    second = client.get("/search", params={"q": "mex", "limit": 2, "skip": 2}).json()
+    assert (first["page"], first["pageSize"], first["has_more"]) == (0, 2, True)
+    assert [hit["name"] for hit in first["data"] + second["data"]] == ["mexico_total", "verano", "invierno"]
+    assert second["has_more"] is False
+    assert client.get("/search", params={"q": "mex", "field": "tipo_de_mueble"}).status_code == 422
+
+    before = {q: hits(q) for q in ("prueba", "cuauh", "mex", "jal")}
+    search.rebuild(session)
+    session.commit()
+    crud.invalidate_read_caches()
+    assert {q: hits(q) for q in before} == before
+
+def test_search_ranks_before_cutting_matches(client, session, auth_headers, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_SCAN_TERMS", 20)
+
+    def campaign(name, codes, estado):
+        return {
+            "name": name, "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+            "sites": [
+                {"codigo_del_sitio": code, "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo",
+                 "estado": estado, "municipio": "Centro", "zm": "Centro"}
+                for code in codes
+            ],
+        }
+    # Far more matching codes than are scanned, indexed before the best match
+    client.post("/campaigns", json=campaign("c1", [f"PRUEBA-MEX-{i:04d}" for i in range(50)], "Jalisco"), headers=auth_headers)
+    client.post("/campaigns", json=campaign("c2", ["OTRO-1"], "Mexico"), headers=auth_headers)
+
+    data = client.get("/search", params={"q": "mex"}).json()
+    assert [(hit["name"], hit["field"], hit["value"]) for hit in data["data"]] == [
+        ("c2", "estado", "Mexico"), ("c1", "codigo_del_sitio", "PRUEBA-MEX-0000")
+    ]
+    data = client.get("/search", params={"q": "mex", "field": "codigo_del_sitio"}).json()
+    assert [(hit["name"], hit["value"]) for hit in data["data"]] == [("c1", "PRUEBA-MEX-0000")]
+
+    # A database indexed before terms were ranked is rebuilt by seed.py
+    assert not search.needs_backfill(session)
+    session.execute(text("CREATE TABLE search_index (value)"))
+    assert search.needs_backfill(session)
+    session.commit()
+    assert main.pending_maintenance(engine) == ["python -m app.search rebuild"]
+    search.rebuild(session)
+    assert not search.needs_backfill(session)
+
+def test_search_pages_past_the_best_terms(client, session, auth_headers, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_MAX_TERMS", 2)
+
+    def campaign(name, codes, estado):
+        return {
+            "name": name, "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+            "sites": [
+                {"codigo_del_sitio": code, "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo",
+                 "estado": estado, "municipio": "Centro", "zm": "Centro"}
+                for code in codes
+            ],
+        }
+    # The two best terms both belong to c1; c2 only matches through the third
+    client.post("/campaigns", json=campaign("c1", ["MEX-1", "MEX-2"], "Jalisco"), headers=auth_headers)
+    client.post("/campaigns", json=campaign("c2", ["OTRO-1"], "Mexico Norte"), headers=auth_headers)
+
+    first = client.get("/search", params={"q": "mex", "limit": 1}).json()
+    assert [hit["name"] for hit in first["data"]] == ["c1"] and first["has_more"] is True
+    second = client.get("/search", params={"q": "mex", "limit": 1, "skip": 1}).json()
+    assert [hit["name"] for hit in second["data"]] == ["c2"] and second["has_more"] is False
+    assert client.get("/search", params={"q": "mex", "skip": 5}).json()["data"] == []
+
+    statement = search.search_statement("postgresql", "Mex", terms=2)
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert "lower(search_terms.value) LIKE" in sql
+
+def test_sites_stored_once_per_code(client, session, auth_headers):
+    def campaign(name, *sites):
+        return {
+            "name": name, "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+            "sites": [
+                {"codigo_del_sitio": code, "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo", "estado": estado,
+                 "municipio": "Centro", "zm": "Occidente", "impactos_mensuales": impactos, "per_muj": 0.5}
+                for code, estado, impactos in sites
+            ],
+        }
+    for body in (
+        campaign("primera", ("S1", "Jalisco", 10), ("S2", "Jalisco", 20)),
+        # S1 again as posted before, S2 reported in another estado
+        campaign("segunda", ("S1", "Jalisco", 30), ("S2", "Colima", 40)),
+    ):
+        assert client.post("/campaigns", json=body, headers=auth_headers).status_code == 200
+
+    assert session.query(Site).filter_by(codigo_del_sitio="S1").count() == 1
+    assert session.query(Site).filter_by(codigo_del_sitio="S2").count() == 2
+    assert sorted(value for value, in session.query(SiteCategory.value).filter_by(field="estado")) == ["Colima", "Jalisco"]
+
+    # Every campaign reads back the sites it wrote
+    segunda = client.get("/campaigns/segunda").json()["sites"]
+    assert [(s["codigo_del_sitio"], s["estado"], s["impactos_mensuales"], s["zm"]) for s in segunda] == [
+        ("S1", "Jalisco", 30, "Occidente"), ("S2", "Colima", 40, "Occidente")
+    ]
+    assert [s["estado"] for s in client.get("/campaigns/primera").json()["sites"]] == ["Jalisco", "Jalisco"]
+    buckets = client.get("/analytics/sites/summary?group_by=estado").json()["buckets"]
+    assert [(b["key"], b["sites"], b["impactos_mensuales"]) for b in buckets] == [("Jalisco", 3, 60), ("Colima", 1, 40)]
+    with pytest.raises(TypeError):
+        session.add(CampaignSite(campaign_name="primera", codigo_del_sitio="S3"))
+        session.flush()
+    session.rollback()
+
+    response = client.get("/sites/S2")
+    assert response.status_code == 200
+    assert response.json() == {
+        "codigo_del_sitio": "S2", "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo", "estado": "Colima",
+        "municipio": "Centro", "zm": "Occidente", "campaigns": 2, "rows": 2
+    }
+    assert client.get("/sites/S9").status_code == 404
+
+def test_legacy_campaign_sites_migrated(session):
+    create_sample_campaign(session)
+    session.execute(text(
+        "CREATE TABLE campaign_sites (id INTEGER PRIMARY KEY, campaign_name VARCHAR, codigo_del_sitio VARCHAR, "
+        "estado VARCHAR, impactos_mensuales INTEGER, per_muj FLOAT)"
+    ))
+    session.execute(text(
+        "INSERT INTO campaign_sites VALUES (7, 'test_campaign', 'A', 'Jalisco', 5, 0.25), "
+        "(9, 'test_campaign', 'A', 'Jalisco', 6, 0.25), (12, 'test_campaign', 'B', NULL, 7, NULL)"
+    ))
+    assert sites.needs_migration(session.connection())
+
+    assert sites.migrate(session.connection(), chunk_size=2) == 3
+    session.commit()
+    assert not sites.needs_migration(session.connection())
+    migrated = session.query(CampaignSite).order_by(CampaignSite.id).all()
+    assert [(s.id, s.codigo_del_sitio, s.estado, s.impactos_mensuales, s.per_muj) for s in migrated] == [
+        (7, "A", "Jalisco", 5, 0.25), (9, "A", "Jalisco", 6, 0.25), (12, "B", None, 7, None)
+    ]
+    assert session.query(Site).count() == 2
+
+def test_startup_refused_until_legacy_sites_migrated(client, session, auth_headers, monkeypatch):
+    create_sample_campaign(session)
+    session.execute(text(
+        "CREATE TABLE campaign_sites (id INTEGER PRIMARY KEY, campaign_name VARCHAR, codigo_del_sitio VARCHAR, "
+        "estado VARCHAR, impactos_mensuales INTEGER)"
+    ))
+    session.execute(text("INSERT INTO campaign_sites VALUES (1, 'test_campaign', 'A', 'Jalisco', 5), (2, 'test_campaign', 'B', 'Colima', 6)"))
+    # Written by a version that left the table unmigrated, taking the legacy ids
+    sites.insert(session, [{"campaign_name": "test_campaign", "codigo_del_sitio": "C", "impactos_mensuales": 7}])
+    session.commit()
+
+    database.sync_schema(Base.metadata, engine)
+    assert sites.needs_migration(session.connection())
+    assert "python -m app.sites migrate" in main.pending_maintenance(engine)
+    monkeypatch.setattr(main, "engine", engine)
+    with pytest.raises(RuntimeError, match="app.sites migrate"):
+        main.startup_event()
+
+    sites.migrate(session.connection())
+    session.commit()
+    assert "python -m app.sites migrate" not in main.pending_maintenance(engine)
+    response = client.post("/campaigns", json={
+        "name": "after", "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-31",
+        "sites": [{"codigo_del_sitio": "A", "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo",
+                   "estado": "Jalisco", "municipio": "Zapopan", "zm": "Guadalajara"}],
+    }, headers=auth_headers)
+    assert response.status_code == 200
+
+    rows = session.query(CampaignSite.id, CampaignSite.campaign_name, CampaignSite.codigo_del_sitio).order_by(CampaignSite.id).all()
+    assert [tuple(row) for row in rows] == [
+        (1, "test_campaign", "A"), (2, "test_campaign", "B"), (3, "test_campaign", "C"), (4, "after", "A")
+    ]
+    buckets = client.get("/campaigns/test_campaign/sites/summary?group_by=codigo_del_sitio").json()["buckets"]
+    assert [(b["key"], b["impactos_mensuales"]) for b in buckets] == [("C", 7), ("B", 6), ("A", 5)]
+
+def test_importing_main_defers_optional_modules():
+    # A fresh interpreter, as on a Lambda cold start
+    deferred = [
+        "numpy", "pandas", "mangum", "jose", "passlib", "brotli",
+        "app.analytics", "app.bulk", "app.demographics", "app.export", "app.traffic",
+    ]
+    script = "import sys, app.main; print(' '.join(m for m in %r if m in sys.modules))" % deferred
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "BOOTSTRAP_ON_STARTUP": "0"}
+    result = subprocess.run([sys.executable, "-c", script], cwd=backend_dir, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == []
@@ -0,0 +1,113 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import async_routes, cache, dependencies, models, routes
+from app.database import Base, create_async_session_factory, sync_schema
+from conftest import QUERY_BUDGETS, QueryRecorder, route_for
+from test_api import create_sample_campaign, create_sample_sites
+
+@pytest.fixture(scope="function")
+def clients(tmp_path):
+    url = f"sqlite:///{tmp_path / 'campaigns.db'}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    sync_schema(Base.metadata, engine)
+    SyncSession = sessionmaker(bind=engine, autoflush=False)
+    AsyncSession = create_async_session_factory(url)
+    AsyncReadSession = create_async_session_factory(url, read_only=True)
+
+    def override_get_db():
+        db = SyncSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    async def override_get_async_read_db():
+        async with AsyncReadSession() as db:
+            yield db
+
+    def override_current_user():
+        return models.User(id=1, username="tester")
+
+    apps = []
+    for router in (routes.router, async_routes.router):
+        app = FastAPI()
+        app.include_router(router)
+        app.dependency_overrides[dependencies.get_db] = override_get_db
+        app.dependency_overrides[dependencies.get_read_db] = override_get_db
+        app.dependency_overrides[dependencies.get_async_db] = override_get_async_db
+        app.dependency_overrides[dependencies.get_async_read_db] = override_get_async_read_db
+        app.dependency_overrides[dependencies.get_current_user] = override_current_user
+        apps.append(TestClient(app))
+
+    session = SyncSession()
+    yield session, apps[0], apps[1], AsyncReadSession.kw["bind"].sync_engine
+    session.close()
+    engine.dispose()
+
+def test_async_routes_match_sync_routes(clients):
+    session, sync_client, async_client, async_read_engine = clients
+    create_sample_campaign(session)
+    create_sample_sites(session, 5)
+    created = {"name": "async_created", "tipo_campania": "catorcenal", "fecha_inicio": "2025-01-10", "fecha_fin": "2025-01-20",
+               "periods": [{"period": "2025-01", "impactos_periodo_personas": 5, "impactos_periodo_vehiculos": 3}]}
+    assert async_client.post("/campaigns", json=created).status_code == 200
+    assert async_client.post("/campaigns", json=created).status_code == 400
+
+    for url in [
+        "/campaigns?limit=1",
+        "/campaigns?include_rollups=true",
+        "/campaigns?fields=name,fecha_fin&include_rollups=true",
+        "/campaigns?format=columnar&limit=1",
+        "/campaigns/summary",
+        "/campaigns/search-by-date?start_date=2025-01-15T00:00:00&end_date=2025-02-01T00:00:00",
+        "/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-02-01T00:00:00&format=columnar&fields=tipo_campania&limit=1",
+        "/campaigns/test_campaign?sites_limit=2",
+        "/campaigns/test_campaign/sites/summary?group_by=estado",
+        "/campaigns/async_created/periods/summary",
+        "/campaigns/test_campaign/sites/demographics?estado=Jalisco",
+        "/campaigns/test_campaign/traffic",
+        "/campaigns/missing",
+        "/search?q=async",
+        "/sites/SITE-001",
+        "/sites/missing",
+        "/analytics/campaigns/top?metric=impactos_personas",
+        "/analytics/sites/summary?group_by=tipo_de_mueble",
+        "/analytics/periods?granularity=quarter",
+        "/analytics/traffic",
+    ]:
+        # Both apps share the response cache; clear it so each one really queries
+        cache.response_cache.clear()
+        sync_response = sync_client.get(url)
+        cache.response_cache.clear()
+        with QueryRecorder(async_read_engine) as recorder:
+            async_response = async_client.get(url)
+        assert async_response.status_code == sync_response.status_code, url
+        assert async_response.json() == sync_response.json(), url
+        # Reads go to the read pool, within the budget of the route
+        assert 0 < len(recorder.statements) <= QUERY_BUDGETS[("GET", route_for("GET", url.split("?")[0]).path)], url
+
+    for url in ["/campaigns/export?format=ndjson&include=sites&include=periods", "/campaigns/export?format=csv&include=sites"]:
+        assert async_client.get(url).text == sync_client.get(url).text, url
+    assert [hit["name"] for hit in async_client.get("/search?q=async").json()["data"]] == ["async_created"]
+    assert len(async_client.get("/campaigns/export?format=csv&include=sites").text.splitlines()) == 1 + 5 + 1
+
+    ndjson = async_client.get("/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-02-01T00:00:00&format=ndjson")
+    assert len(ndjson.text.splitlines()) == 2
+    ndjson = async_client.get("/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-02-01T00:00:00&format=ndjson&fields=name")
+    assert ndjson.text.splitlines()[0] == '{"name":"test_campaign"}'
+
+def test_async_routes_replace_sync_routes():
+    sync_routes = {(route.path, frozenset(route.methods)): route for route in routes.router.routes}
+    for route in async_routes.router.routes:
+        # Each one takes over a sync route, and so its query budget
+        sync_routes.pop((route.path, frozenset(route.methods)))
+    # Routes without database work, login and the bulk import stay sync
+    assert sorted(path for path, _ in sync_routes) == ["/", "/campaigns/bulk", "/health", "/metrics", "/token"]
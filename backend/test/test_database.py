@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import exc, insert, select, text
+
+from app import database, models
+
+@pytest.fixture(scope="function")
+def engines(tmp_path):
+    url = f"sqlite:///{tmp_path / 'campaigns.db'}"
+    write_engine = database.create_write_engine(url)
+    read_engine = database.create_read_engine(url)
+    database.sync_schema(models.Base.metadata, write_engine)
+    yield write_engine, read_engine
+    write_engine.dispose()
+    read_engine.dispose()
+
+def test_connections_use_wal(engines):
+    write_engine, read_engine = engines
+    with read_engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA cache_size").scalar() == -database.SQLITE_CACHE_SIZE_KB
+
+def test_read_engine_refuses_writes(engines):
+    _, read_engine = engines
+    with pytest.raises(exc.OperationalError):
+        with read_engine.begin() as conn:
+            conn.execute(insert(models.User), {"username": "intruder", "hashed_password": "x"})
+
+def test_reads_are_not_blocked_by_open_write(engines):
+    write_engine, read_engine = engines
+    with write_engine.begin() as conn:
+        conn.execute(insert(models.User), {"username": "admin", "hashed_password": "x"})
+
+    with write_engine.begin() as writer:
+        writer.execute(insert(models.User), {"username": "pending", "hashed_password": "x"})
+        with read_engine.connect() as reader:
+            reader.execute(text("PRAGMA busy_timeout=0"))
+            names = reader.execute(select(models.User.username)).scalars().all()
+    assert names == ["admin"]
+
+def test_read_only_url_serves_packaged_file(engines):
+    write_engine, _ = engines
+    with write_engine.begin() as conn:
+        conn.execute(insert(models.User), {"username": "admin", "hashed_password": "x"})
+    database.checkpoint(write_engine)
+    write_engine.dispose()
+
+    packaged = database.create_read_engine(database.read_only_url(str(write_engine.url)))
+    try:
+        with packaged.connect() as conn:
+            assert conn.execute(select(models.User.username)).scalars().all() == ["admin"]
+        with pytest.raises(exc.OperationalError):
+            with packaged.begin() as conn:
+                conn.execute(insert(models.User), {"username": "other", "hashed_password": "x"})
+    finally:
+        packaged.dispose()
+
+def test_suite_never_opens_the_tracked_database():
+    # conftest points the app's own engines at a throwaway file
+    assert database.SQLALCHEMY_DATABASE_URL != database.DEFAULT_DATABASE_URL
+    assert str(database.engine.url) == database.SQLALCHEMY_DATABASE_URL
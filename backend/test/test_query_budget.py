@@ -0,0 +1,111 @@
+import json
+import pytest
+from datetime import date
+from passlib.context import CryptContext
+from app import routes
+from app.models import Campaign, CampaignPeriod, User
+from conftest import QUERY_BUDGETS, query_budget, route_for
+from test_api import create_campaigns, create_sample_campaign, create_sample_sites
+
+def add_campaign(session, name, sites, periods):
+    session.add(Campaign(
+        name=name, tipo_campania="mensual", fecha_inicio=date(2025, 1, 1), fecha_fin=date(2025, 12, 31),
+        hourly_vehicle_counts=bytes(96)
+    ))
+    session.commit()
+    create_sample_sites(session, sites, campaign_name=name)
+    for i in range(periods):
+        session.add(CampaignPeriod(
+            campaign_name=name, period=f"2025-{i % 12 + 1:02d}", period_start=date(2025, i % 12 + 1, 1),
+            impactos_periodo_personas=10 * i, impactos_periodo_vehiculos=5 * i
+        ))
+    session.commit()
+
+def payload(name, sites, periods):
+    return {
+        "name": name, "tipo_campania": "mensual", "fecha_inicio": "2025-01-01", "fecha_fin": "2025-12-31",
+        "sites": [
+            {"codigo_del_sitio": f"S{i}", "tipo_de_mueble": "Muro", "tipo_de_anuncio": "Fijo",
+             "estado": "Jalisco", "municipio": "Zapopan", "zm": "Guadalajara"}
+            for i in range(sites)
+        ],
+        "periods": [
+            {"period": f"2025-{i % 12 + 1:02d}", "impactos_periodo_personas": 5, "impactos_periodo_vehiculos": 3}
+            for i in range(periods)
+        ],
+    }
+
+def requests_for(name, sites, periods, auth_headers):
+    """One request per route of routes.py against campaign `name`, with bodies of the same size."""
+    bulk = "\n".join(json.dumps(payload(f"{name}_bulk_{i}", sites, periods)) for i in range(3))
+    return [
+        ("GET", "/", {}),
+        ("POST", "/token", {"data": {"username": f"{name}_user", "password": "secret"}}),
+        ("GET", "/health", {}),
+        ("GET", "/metrics", {}),
+        ("GET", "/campaigns?limit=50&include_rollups=true", {}),
+        ("GET", "/campaigns?limit=50&fields=name,alcance&format=columnar", {}),
+        ("POST", "/campaigns", {"json": payload(f"{name}_created", sites, periods), "headers": auth_headers}),
+        ("POST", "/campaigns/bulk", {
+            "content": bulk, "headers": {**auth_headers, "Content-Type": "application/x-ndjson"}
+        }),
+        ("GET", "/campaigns/summary", {}),
+        ("GET", "/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-06-30T00:00:00&limit=50", {}),
+        ("GET", "/campaigns/search-by-date?start_date=2025-01-01T00:00:00&end_date=2025-06-30T00:00:00&format=ndjson", {}),
+        ("GET", "/campaigns/export?format=ndjson&include=sites&include=periods", {}),
+        ("GET", "/search?q=zapopan", {}),
+        ("GET", "/sites/S0", {}),
+        ("GET", f"/campaigns/{name}", {}),
+        ("GET", f"/campaigns/{name}/sites/summary?group_by=estado", {}),
+        ("GET", f"/campaigns/{name}/sites/demographics", {}),
+        ("GET", f"/campaigns/{name}/periods/summary", {}),
+        ("GET", f"/campaigns/{name}/traffic", {}),
+        ("GET", "/analytics/campaigns/top?metric=alcance", {}),
+        ("GET", "/analytics/sites/summary?group_by=estado", {}),
+        ("GET", "/analytics/periods?granularity=quarter", {}),
+        ("GET", "/analytics/traffic", {}),
+    ]
+
+def add_user(session, username):
+    # bcrypt with fewer rounds than auth uses, so the login also rehashes the password
+    session.add(User(username=username, hashed_password=CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")))
+    session.commit()
+
+def measure(session, within_budget, name, sites, periods, auth_headers):
+    """Statements per (method, route, query string) of requests_for."""
+    add_user(session, f"{name}_user")
+    counts = {}
+    for method, url, kwargs in requests_for(name, sites, periods, auth_headers):
+        response, statements = within_budget(method, url, **kwargs)
+        assert response.status_code == 200, (method, url, response.text)
+        path, _, query = url.partition("?")
+        counts[(method, route_for(method, path).path, query)] = len(statements)
+    return counts
+
+def test_query_budget_failure_lists_statements(session):
+    create_sample_campaign(session)
+    with pytest.raises(pytest.fail.Exception) as failure:
+        with query_budget(1):
+            session.get(Campaign, "test_campaign")
+            session.query(CampaignPeriod).filter_by(campaign_name="test_campaign").all()
+    message = str(failure.value)
+    assert "2 statements, over the budget of 1" in message
+    assert "1. SELECT campaigns.name" in message and "2. SELECT campaign_periods.id" in message
+
+def test_every_route_has_a_query_budget():
+    declared = {(method, route.path) for route in routes.router.routes for method in route.methods}
+    assert declared == set(QUERY_BUDGETS)
+
+def test_routes_within_query_budget(session, within_budget, auth_headers):
+    create_sample_campaign(session)
+    create_campaigns(session, 3)
+    add_campaign(session, "small", sites=2, periods=1)
+    small = measure(session, within_budget, "small", 2, 1, auth_headers)
+    declared = {(method, route.path) for route in routes.router.routes for method in route.methods}
+    assert declared == {(method, path) for method, path, _ in small}
+
+    # Many more sites and periods, here and across the catalog, must not add statements
+    add_campaign(session, "large", sites=120, periods=36)
+    create_campaigns(session, 40, tipo_campania="catorcenal")
+    large = measure(session, within_budget, "large", 120, 36, auth_headers)
+    assert large == small
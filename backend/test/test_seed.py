@@ -0,0 +1,55 @@
+import os
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import StaticPool
+
+import seed
+from app import traffic
+from app.models import Campaign, CampaignPeriod, CampaignRollup, CampaignSite
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+def count(engine, model):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(model)).scalar()
+
+def test_clean_number():
+    values = seed.pd.Series(["14566-06-26", "13918", None])
+    assert seed.clean_number(values).tolist()[:2] == [14566, 13918]
+
+def test_load_data_in_chunks_is_idempotent():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    stats = seed.load_data(chunk_size=7, data_dir=DATA_DIR, bind=engine)
+    campaigns = seed.pd.read_csv(os.path.join(DATA_DIR, seed.CAMPAIGNS_CSV))["name"].nunique()
+    assert count(engine, Campaign) == campaigns == stats.rows["campaigns"]
+    periods, sites = count(engine, CampaignPeriod), count(engine, CampaignSite)
+    assert periods > 0 and sites > 0
+
+    with engine.connect() as conn:
+        rolled_up = conn.execute(select(func.sum(CampaignRollup.site_count), func.sum(CampaignRollup.period_count))).one()
+    assert tuple(rolled_up) == (sites, periods)
+
+    with engine.connect() as conn:
+        period = conn.execute(select(CampaignPeriod).where(CampaignPeriod.campaign_name == "campania_9").order_by(CampaignPeriod.id)).first()
+    assert period.impactos_periodo_vehiculos == 14566
+
+    with engine.connect() as conn:
+        site = conn.execute(select(CampaignSite).where(CampaignSite.codigo_del_sitio == "PRUEBA-MEX-054")).first()
+    assert site.nivel_socioeconomico_ab == seed.pd.Series([0.133804068])[0]
+    assert abs(site.per_muj + site.per_hom - 1) < 1e-9
+
+    seed.load_data(chunk_size=7, data_dir=DATA_DIR, bind=engine)
+    assert count(engine, Campaign) == campaigns
+    assert count(engine, CampaignPeriod) == periods
+    assert count(engine, CampaignSite) == sites
+
+def test_load_data_packs_traffic_profiles():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    seed.load_data(data_dir=DATA_DIR, bind=engine)
+
+    csv = seed.pd.read_csv(os.path.join(DATA_DIR, seed.CAMPAIGNS_CSV)).drop_duplicates(subset=["name"])
+    expected = csv.iloc[0]
+    with engine.connect() as conn:
+        blob = conn.execute(select(Campaign.hourly_vehicle_counts).where(Campaign.name == expected["name"])).scalar()
+    hours = [seed.clean_number(seed.pd.Series([expected[c]]))[0] for c in traffic.CSV_COLUMNS]
+    assert traffic.unpack(blob).tolist() == [round(v) for v in hours]
@@ -62,12 +62,12 @@ export const getCampaignDetail = async (campaignId: string): Promise<CampaignDet
 export const searchCampaignsByDate = async (
     startDate: string,
     endDate: string
-): Promise<Campaign[]> => {
+): Promise<{ data: Campaign[]; total: number | null; next_cursor: string | null }> => {
     const params = new URLSearchParams({
         start_date: startDate,
         end_date: endDate,
     });
 
-    const response = await axios.get(`${API_URL}/campaigns/search-by-date/?${params}`);
+    const response = await axios.get(`${API_URL}/campaigns/search-by-date?${params}`);
     return response.data;
 };
@@ -88,6 +88,7 @@ export interface CampaignSite {
 export interface CampaignDetail extends Campaign {
     periods: CampaignPeriod[];
     sites: CampaignSite[];
+    sites_next_cursor?: string | null;
 }
 
 // API Functions
@@ -112,6 +113,31 @@ export const getCampaignDetail = async (id: string): Promise<CampaignDetail> =>
   return response.data;
 };
 
+export interface SiteSummaryBucket {
+    key: string | null;
+    sites: number;
+    impactos_mensuales: number;
+    impactos_catorcenal: number;
+    alcance_mensual: number;
+    frecuencia_mensual_promedio: number | null;
+}
+
+export interface SiteSummary {
+    group_by: string;
+    buckets: SiteSummaryBucket[];
+}
+
+export const getCampaignSitesSummary = async (
+    id: string,
+    groupBy: string = 'estado',
+    limit?: number
+): Promise<SiteSummary> => {
+    const params: any = { group_by: groupBy };
+    if (limit) params.limit = limit;
+    const response = await api.get<SiteSummary>(`/campaigns/${id}/sites/summary`, { params });
+    return response.data;
+};
+
 // Creation Types
 export interface CampaignSiteCreate extends Omit<CampaignSite, 'id' | 'campaign_name'> {}
 export interface CampaignPeriodCreate extends Omit<CampaignPeriod, 'id' | 'campaign_name'> {}
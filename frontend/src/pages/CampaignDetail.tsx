@@ -2,7 +2,7 @@ import { useRef } from 'react';
 import { useReactToPrint } from 'react-to-print';
 import { useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { getCampaignDetail, CampaignDetail as CampaignDetailType } from '../api/client';
+import { getCampaignDetail, getCampaignSitesSummary, CampaignDetail as CampaignDetailType, SiteSummaryBucket } from '../api/client';
 import {
     BarChart, Bar, LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, PieChart, Pie, Cell
 } from 'recharts';
@@ -14,6 +14,7 @@ const CampaignDetail = () => {
     const { id } = useParams();
     const navigate = useNavigate();
     const [campaign, setCampaign] = useState<CampaignDetailType | null>(null);
+    const [topSites, setTopSites] = useState<SiteSummaryBucket[]>([]);
     const [loading, setLoading] = useState(true);
 
     const componentRef = useRef<HTMLDivElement>(null);
@@ -29,6 +30,9 @@ const CampaignDetail = () => {
             .then(setCampaign)
             .catch(err => console.error(err))
             .finally(() => setLoading(false));
+        getCampaignSitesSummary(id, 'codigo_del_sitio', 10)
+            .then(summary => setTopSites(summary.buckets))
+            .catch(err => console.error(err));
     }, [id]);
 
     if (loading) return <div className="p-8 text-center">Loading...</div>;
@@ -102,9 +106,9 @@ const CampaignDetail = () => {
                             </h2>
                             <div className="h-64 md:h-80">
                                 <ResponsiveContainer width="100%" height="100%">
-                                    <BarChart data={campaign.sites.slice(0, 10)} margin={{ top: 10, right: 30, left: 0, bottom: 0 }}>
+                                    <BarChart data={topSites} margin={{ top: 10, right: 30, left: 0, bottom: 0 }}>
                                         <CartesianGrid strokeDasharray="3 3" />
-                                        <XAxis dataKey="codigo_del_sitio" />
+                                        <XAxis dataKey="key" />
                                         <YAxis />
                                         <Tooltip />
                                         <Legend />